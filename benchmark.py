@@ -0,0 +1,189 @@
+"""End-to-end throughput benchmark for script.py against mock_server.py.
+
+Runs the full ``generate`` pipeline on synthetic CSVs of several sizes while
+the local mock answers every SerpApi and OpenAI request, and reports what
+the pipeline itself costs: rows/sec, pages/sec, event-loop lag, peak RSS and
+how much of the concurrency limit was actually in use.
+
+    python benchmark.py --sizes 1,50,608 --chat-latency 0.5 --latency-dist lognormal
+    python benchmark.py --sizes 10000 --output bench/10k.json
+
+Each size runs in a fresh process so peak RSS is per size. Results are
+printed as a table and, with ``--output``, saved as JSON so runs can be
+compared over time.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List
+
+import pandas as pd
+
+import mock_server
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SIZES = "1,50,608,10000"
+LAG_INTERVAL = 0.05  # seconds between event-loop lag probes
+
+
+def synthetic_csv(source: str, rows: int, path: str) -> None:
+    """Write ``rows`` rows cycled from ``source``; repeats get unique formats and URLs."""
+    base = pd.read_csv(source)
+    out = []
+    for i in range(rows):
+        row = base.iloc[i % len(base)].copy()
+        cycle = i // len(base)
+        if cycle:
+            old = str(row["format_1"])
+            new = f"{old}{cycle}"
+            row["format_1"] = new
+            for col in ("Keyword 1", "Keyword 2", "URL"):
+                row[col] = str(row[col]).replace(old, new, 1)
+        out.append(row)
+    pd.DataFrame(out, columns=base.columns).to_csv(path, index=False)
+
+
+async def _probe_lag(samples: List[float]) -> None:
+    """Record how late each timer fires; a busy event loop shows up as lag."""
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(LAG_INTERVAL)
+        samples.append(max(0.0, loop.time() - start - LAG_INTERVAL))
+
+
+async def _run_main(script, argv: List[str], lag: List[float]) -> None:
+    probe = asyncio.create_task(_probe_lag(lag))
+    try:
+        await script.main(argv)
+    finally:
+        probe.cancel()
+
+
+def run_size(rows: int, base_url: str, options: Dict[str, object]) -> Dict[str, object]:
+    """Generate ``rows`` synthetic rows in a scratch directory and measure the run."""
+    logging.basicConfig(level=logging.WARNING)
+    os.environ["OPENAI_BASE_URL"] = f"{base_url}/v1"
+    os.environ["SERPAPI_BACKEND"] = base_url
+    sys.path.insert(0, HERE)
+    import script  # imported here so the environment above is seen at import time
+
+    script.OPENAI_API_KEY = "mock"
+    script.SERPAPI_API_KEY = "mock"
+    script.DEFAULT_TEST_MODE = False
+
+    with tempfile.TemporaryDirectory(prefix="seo-bench-") as work:
+        csv_path = os.path.join(work, "rows.csv")
+        synthetic_csv(script.DEFAULT_CSV, rows, csv_path)
+        demo_dir = os.path.join(work, "demo_site")
+        report_path = os.path.join(work, "run_report.json")
+        argv = [
+            "--input_csv", csv_path,
+            "--output_json", os.path.join(work, "preview.json"),
+            "--output_jsonl", os.path.join(work, "preview.jsonl"),
+            "--journal-dir", os.path.join(work, "journal"),
+            "--demo-dir", demo_dir,
+            "--report", report_path,
+            "--cache-mode", "off",
+            "--serp-cache-path", os.path.join(work, "serp.sqlite"),
+            "--concurrency", str(options["concurrency"]),
+            "--max-concurrency", str(options["max_concurrency"]),
+        ]
+        if options["stream"]:
+            argv.append("--stream")
+        lag: List[float] = []
+        started = time.perf_counter()
+        asyncio.run(_run_main(script, argv, lag))
+        elapsed = time.perf_counter() - started
+
+        with open(os.path.join(work, "preview.jsonl"), encoding="utf-8") as fh:
+            done_rows = sum(1 for line in fh if line.strip())
+        pages = sum(1 for name in os.listdir(demo_dir) if name.endswith(".html") and name != "index.html")
+        with open(report_path, encoding="utf-8") as fh:
+            report = json.load(fh)
+
+    lag_sorted = sorted(lag) or [0.0]
+    return {
+        "rows": rows,
+        "rows_done": done_rows,
+        "pages": pages,
+        "calls": report["totals"]["calls"],
+        "prompt_tokens": report["totals"]["prompt_tokens"],
+        "cached_prompt_tokens": report["totals"].get("cached_prompt_tokens", 0),
+        "wall_s": round(elapsed, 2),
+        "rows_per_s": round(done_rows / elapsed, 2),
+        "pages_per_s": round(pages / elapsed, 2),
+        "loop_lag_ms": {
+            "mean": round(statistics.fmean(lag_sorted) * 1000, 2),
+            "p99": round(lag_sorted[min(len(lag_sorted) - 1, int(len(lag_sorted) * 0.99))] * 1000, 2),
+            "max": round(lag_sorted[-1] * 1000, 2),
+        },
+        # ru_maxrss is in KiB on Linux
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "limiter": report.get("limiter", {}),
+    }
+
+
+def format_results(results: List[Dict[str, object]]) -> str:
+    lines = [
+        f"{'rows':>7} {'done':>7} {'pages':>7} {'wall s':>8} {'rows/s':>8} {'pages/s':>8} "
+        f"{'lag p99':>8} {'lag max':>8} {'RSS MB':>7} {'util':>5} {'peak':>5}"
+    ]
+    for r in results:
+        limiter = r["limiter"]
+        lines.append(
+            f"{r['rows']:>7} {r['rows_done']:>7} {r['pages']:>7} {r['wall_s']:>8} {r['rows_per_s']:>8} {r['pages_per_s']:>8} "
+            f"{r['loop_lag_ms']['p99']:>8} {r['loop_lag_ms']['max']:>8} {r['peak_rss_mb']:>7} "
+            f"{limiter.get('utilization', 0):>5} {limiter.get('peak_in_flight', 0):>5}"
+        )
+    return "\n".join(lines)
+
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Benchmark script.py end to end against the local mock APIs.")
+    p.add_argument("--sizes", default=DEFAULT_SIZES, help="comma-separated CSV sizes to run")
+    p.add_argument("--concurrency", type=int, default=6)
+    p.add_argument("--max-concurrency", type=int, default=32)
+    p.add_argument("--stream", action="store_true", help="benchmark the streaming page path")
+    p.add_argument("--output", help="also write the results as JSON to this file")
+    mock_server.add_state_args(p)
+    return p.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s | %(levelname)s | %(message)s")
+    state = mock_server.state_from_args(args)
+    server = mock_server.serve(port=0, state=state)
+    base_url = "http://%s:%d" % server.server_address[:2]
+    options = {"concurrency": args.concurrency, "max_concurrency": args.max_concurrency, "stream": args.stream}
+
+    results = []
+    for rows in (int(size) for size in args.sizes.split(",")):
+        logging.info("Benchmarking %d rows", rows)
+        # A fresh interpreter per size keeps peak RSS and module state separate
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+            results.append(pool.submit(run_size, rows, base_url, options).result())
+    server.shutdown()
+
+    print(format_results(results))
+    logging.info("Mock server: %s", state.counters)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as fh:
+            json.dump({"started": time.time(), "options": vars(args), "mock": state.counters, "results": results}, fh, indent=2)
+        logging.info("Saved results to %s", args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,35 @@
 #!/usr/bin/env bash
 set -e
 python script.py "$@"        # arguments pass-through
-rm -rf docs
-cp -R demo_site docs
-git add docs preview.json
+
+# merge/publish must read and sync the same trees the run wrote to
+site_args=()
+sharded=
+docs_dir=docs
+preview=preview.json
+args=("$@")
+for ((i = 0; i < ${#args[@]}; i++)); do
+  case "${args[i]}" in
+    --demo-dir|--docs-dir|--shards-dir|--journal-dir|--output_json|--output_jsonl|--render-workers)
+      site_args+=("${args[i]}" "${args[i+1]}") ;;
+    --demo-dir=*|--docs-dir=*|--shards-dir=*|--journal-dir=*|--output_json=*|--output_jsonl=*|--render-workers=*|--minify|--precompress|--search-index)
+      site_args+=("${args[i]}") ;;
+  esac
+  case "${args[i]}" in
+    --shard|--shard=*) sharded=1 ;;
+    --docs-dir) docs_dir="${args[i+1]}" ;;
+    --docs-dir=*) docs_dir="${args[i]#*=}" ;;
+    --output_json) preview="${args[i+1]}" ;;
+    --output_json=*) preview="${args[i]#*=}" ;;
+  esac
+done
+
+# A shard run only wrote shards/i-of-N/: publish the site merged from every finished shard
+if [ -n "$sharded" ]; then
+  python script.py merge "${site_args[@]}"
+fi
+python script.py publish "${site_args[@]}"   # sync demo_site/ into docs/ (changed files only)
+git add -A "$docs_dir"
+git add "$preview"
 git commit -m "deploy $(date +%F_%T)" || echo "Nothing to commit"
-git push
\ No newline at end of file
+git push
@@ -0,0 +1,426 @@
+"""Local stand-in for the external APIs used by script.py.
+
+Serves a SerpApi-compatible ``/search`` endpoint and the OpenAI chat
+completions, Files and Batch endpoints, so the pipeline can be exercised
+(and benchmarked, see ``benchmark.py``) without network access or API
+credits:
+
+    python mock_server.py --port 8787 --chat-latency 0.8 --latency-dist lognormal --rate-limit-rate 0.02
+    SERPAPI_BACKEND=http://127.0.0.1:8787 OPENAI_BASE_URL=http://127.0.0.1:8787/v1 \
+        python script.py --limit 20
+
+Responses are deterministic for a given query or prompt, so caches keyed on
+them behave exactly as they would against the real service.
+"""
+
+import argparse
+import collections
+import email.parser
+import email.policy
+import hashlib
+import json
+import logging
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+
+LATENCY_DISTS = ("fixed", "uniform", "exponential", "lognormal")
+
+# Prompt caching as the OpenAI API does it: prefixes of 1024+ tokens, matched
+# in 128-token steps (the mock counts 4 characters per token)
+PROMPT_CACHE_MIN_CHARS = 4096
+PROMPT_CACHE_STEP_CHARS = 512
+
+
+class MockState:
+    """Knobs and counters shared by all request handlers.
+
+    Latencies are drawn from ``latency_dist`` around the given mean;
+    ``sigma`` is the spread for ``lognormal`` (shape) and ``uniform``
+    (fraction of the mean). ``error_rate`` and ``rate_limit_rate`` are the
+    share of chat requests answered with a 500 or a 429.
+    """
+
+    def __init__(
+        self,
+        serp_latency: float = 0.0,
+        batch_latency: float = 2.0,
+        chat_latency: float = 0.0,
+        latency_dist: str = "fixed",
+        sigma: float = 0.5,
+        error_rate: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        response_scale: float = 1.0,
+        seed: Optional[int] = None,
+        prompt_cache_entries: int = 100_000,
+    ):
+        self.serp_latency = serp_latency
+        self.batch_latency = batch_latency
+        self.chat_latency = chat_latency
+        self.latency_dist = latency_dist
+        self.sigma = sigma
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.response_scale = response_scale
+        self.prompt_cache_entries = prompt_cache_entries
+        self.prompt_cache: "collections.OrderedDict[bytes, None]" = collections.OrderedDict()
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counters: Dict[str, int] = {
+            "serp_requests": 0, "chat_requests": 0, "errors": 0, "rate_limited": 0, "batch_jobs": 0, "batch_requests": 0,
+            "prompt_tokens": 0, "cached_tokens": 0,
+        }
+        self.files: Dict[str, bytes] = {}
+        self.batches: Dict[str, Dict[str, object]] = {}
+
+    def add_file(self, data: bytes) -> str:
+        with self.lock:
+            file_id = f"file-{len(self.files) + 1}"
+            self.files[file_id] = data
+        return file_id
+
+    def count(self, name: str) -> None:
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + 1
+
+    def sample_latency(self, mean: float) -> float:
+        if mean <= 0:
+            return 0.0
+        with self.lock:
+            if self.latency_dist == "uniform":
+                return self.rng.uniform(mean * max(0.0, 1 - self.sigma), mean * (1 + self.sigma))
+            if self.latency_dist == "exponential":
+                return self.rng.expovariate(1 / mean)
+            if self.latency_dist == "lognormal":
+                # Shift mu so the distribution keeps the requested mean
+                return self.rng.lognormvariate(math.log(mean) - self.sigma ** 2 / 2, self.sigma)
+        return mean
+
+    def cached_prefix_tokens(self, body: Dict[str, object]) -> int:
+        """Tokens of the longest prompt prefix seen before (LRU of prefix hashes)."""
+        if not self.prompt_cache_entries:
+            return 0
+        text = "".join(f"{m.get('role')}\x00{m.get('content')}\x00" for m in body.get("messages", []))
+        hasher = hashlib.blake2b(str(body.get("model")).encode("utf-8"), digest_size=8)
+        prefixes = []
+        for end in range(PROMPT_CACHE_STEP_CHARS, len(text) + 1, PROMPT_CACHE_STEP_CHARS):
+            hasher.update(text[end - PROMPT_CACHE_STEP_CHARS:end].encode("utf-8"))
+            if end >= PROMPT_CACHE_MIN_CHARS:
+                prefixes.append((end, hasher.copy().digest()))
+        matched = 0
+        with self.lock:
+            for end, digest in prefixes:
+                if digest not in self.prompt_cache:
+                    break
+                matched = end
+            for _, digest in prefixes:
+                self.prompt_cache[digest] = None
+                self.prompt_cache.move_to_end(digest)
+            while len(self.prompt_cache) > self.prompt_cache_entries:
+                self.prompt_cache.popitem(last=False)
+        return matched // 4
+
+    def roll_failure(self) -> Optional[int]:
+        """HTTP status to fail the next chat request with, if any."""
+        with self.lock:
+            roll = self.rng.random()
+        if roll < self.rate_limit_rate:
+            return 429
+        if roll < self.rate_limit_rate + self.error_rate:
+            return 500
+        return None
+
+
+def fake_serp_results(query: str) -> Dict[str, List[Dict[str, str]]]:
+    """Build a google_light-shaped result whose content depends only on ``query``."""
+    rng = random.Random(hashlib.sha256(query.encode("utf-8")).hexdigest())
+    words = query.split() or ["subtitles"]
+    return {
+        "search_metadata": {"status": "Success"},
+        "related_searches": [
+            {"query": f"{query} {suffix}"} for suffix in rng.sample(["online", "free", "python", "ffmpeg", "mac", "bulk"], 4)
+        ],
+        "related_questions": [
+            {"question": f"How do I {query}?", "snippet": f"You can {query} with a subtitle editor."},
+            {"question": f"Is it safe to {query} online?", "snippet": "Most online converters keep your timings intact."},
+            {"question": f"What is a {words[-1].upper()} file?", "snippet": f"{words[-1].upper()} is a subtitle format."},
+        ],
+        "organic_results": [
+            {"title": f"{query.title()} - result {i}", "snippet": f"Result {i} explains how to {query} step by step."}
+            for i in range(1, 5)
+        ],
+    }
+
+
+def fake_answer(messages: List[Dict[str, str]], json_mode: bool = False, scale: float = 1.0) -> str:
+    """Answer a chat request in the shape the matching prompt template asks for.
+
+    Landing answers come back fenced like free-form model output, unless the
+    request asked for schema-constrained JSON (``json_mode``). ``scale``
+    multiplies the length of HTML pages.
+    """
+    prompt = "\n".join(m.get("content", "") for m in messages if isinstance(m.get("content"), str))
+    rng = random.Random(hashlib.sha256(prompt.encode("utf-8")).hexdigest())
+    if '"tech_blog_ideas"' in prompt:
+        return json.dumps({
+            "tech_blog_ideas": [{"title": f"Automating subtitle step {i}", "meta": "API walkthrough."} for i in range(3)],
+            "tech_use_cases": [{"name": f"Pipeline integration {i}", "description": "Batch jobs."} for i in range(3)],
+        })
+    if '"content"' in prompt:
+        landing = json.dumps({
+            "content": "<h1>Convert your subtitles</h1><p>" + "Fast, accurate conversion. " * 12 + "</p>",
+            "faq": [{"question": f"Question {i}?", "answer": "Yes."} for i in range(5)],
+            "blog_ideas": [{"title": f"Subtitle guide {i}", "meta": "How-to."} for i in range(rng.randint(4, 6))],
+            "use_cases": [{"name": f"Use case {i}", "description": "Who it helps."} for i in range(4)],
+        })
+        return landing if json_mode else f"```json\n{landing}\n```"
+    if '"blog_ideas"' in prompt:
+        return json.dumps({
+            "blog_ideas": [{"title": f"More on subtitles {i}", "meta": "Tips."} for i in range(2)],
+            "use_cases": [{"name": f"Extra use case {i}", "description": "Who it helps."} for i in range(2)],
+        })
+    sections = max(1, round(3 * scale))
+    paragraphs = "".join(f"<h2>Section {i}</h2><p>{'Subtitle timing matters. ' * rng.randint(8, 20)}</p>" for i in range(sections))
+    return f"<h1>Generated page</h1>{paragraphs}"
+
+
+def fake_chat_completion(body: Dict[str, object], scale: float = 1.0, cached_tokens: int = 0) -> Dict[str, object]:
+    messages = body.get("messages", [])
+    text = fake_answer(messages, json_mode="response_format" in body, scale=scale)
+    prompt_tokens = sum(len(str(m.get("content", ""))) for m in messages) // 4
+    cached_tokens = min(cached_tokens, prompt_tokens)
+    completion_tokens = len(text) // 4
+    return {
+        "id": "chatcmpl-" + hashlib.sha256(text.encode("utf-8")).hexdigest()[:12],
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "mock"),
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "prompt_tokens_details": {"cached_tokens": cached_tokens},
+        },
+    }
+
+
+def run_batch(state: MockState, batch_id: str) -> None:
+    """Answer every request of a batch after ``batch_latency`` seconds."""
+    batch = state.batches[batch_id]
+    batch["status"] = "in_progress"
+    batch["in_progress_at"] = int(time.time())
+    time.sleep(state.batch_latency)
+    lines = state.files[batch["input_file_id"]].decode("utf-8").splitlines()
+    output = []
+    for line in filter(None, lines):
+        item = json.loads(line)
+        state.count("batch_requests")
+        output.append(json.dumps({
+            "id": f"batch_req_{item['custom_id']}",
+            "custom_id": item["custom_id"],
+            "response": {"status_code": 200, "request_id": item["custom_id"], "body": fake_chat_completion(item["body"], state.response_scale)},
+            "error": None,
+        }))
+    batch["output_file_id"] = state.add_file(("\n".join(output) + "\n").encode("utf-8"))
+    batch["request_counts"] = {"total": len(output), "completed": len(output), "failed": 0}
+    batch["completed_at"] = int(time.time())
+    batch["status"] = "completed"
+
+
+def stream_chunks(completion: Dict[str, object], chunk_chars: int = 200) -> List[Dict[str, object]]:
+    """Split a chat completion into ``chat.completion.chunk`` events, usage last."""
+    text = completion["choices"][0]["message"]["content"]
+    base = {"id": completion["id"], "object": "chat.completion.chunk", "created": completion["created"], "model": completion["model"]}
+    chunks = [
+        dict(base, choices=[{"index": 0, "delta": {"content": text[i:i + chunk_chars]}, "finish_reason": None}])
+        for i in range(0, len(text), chunk_chars)
+    ]
+    chunks.append(dict(base, choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}]))
+    chunks.append(dict(base, choices=[], usage=completion["usage"]))
+    return chunks
+
+
+def make_handler(state: MockState):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, fmt, *args):  # keep benchmark output clean
+            logging.debug("mock: " + fmt, *args)
+
+        def _send_json(self, status: int, payload: object) -> None:
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _read_body(self) -> bytes:
+            return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+        def _chat_completion(self) -> None:
+            body = json.loads(self._read_body() or b"{}")
+            state.count("chat_requests")
+            delay = state.sample_latency(state.chat_latency)
+            status = state.roll_failure()
+            if status == 429:
+                state.count("rate_limited")
+                time.sleep(delay / 10)  # quota errors come back quickly
+                payload = json.dumps({"error": {"message": "Rate limit reached (mock)", "type": "rate_limit_error"}}).encode("utf-8")
+                self.send_response(429)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("retry-after-ms", "200")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+                return
+            time.sleep(delay)
+            if status == 500:
+                state.count("errors")
+                self._send_json(500, {"error": {"message": "Internal server error (mock)", "type": "server_error"}})
+                return
+            completion = fake_chat_completion(body, state.response_scale, state.cached_prefix_tokens(body))
+            with state.lock:
+                state.counters["prompt_tokens"] += completion["usage"]["prompt_tokens"]
+                state.counters["cached_tokens"] += completion["usage"]["prompt_tokens_details"]["cached_tokens"]
+            if not body.get("stream"):
+                self._send_json(200, completion)
+                return
+            events = "".join(f"data: {json.dumps(chunk)}\n\n" for chunk in stream_chunks(completion)) + "data: [DONE]\n\n"
+            data = events.encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            if url.path == "/v1/chat/completions":
+                self._chat_completion()
+            elif url.path == "/v1/files":
+                # Multipart upload: pull out the "file" part with the stdlib MIME parser
+                head = f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode("utf-8")
+                message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(head + self._read_body())
+                data = next(
+                    (part.get_payload(decode=True) for part in message.iter_parts() if part.get_param("name", header="content-disposition") == "file"),
+                    b"",
+                )
+                file_id = state.add_file(data)
+                self._send_json(200, {
+                    "id": file_id, "object": "file", "bytes": len(data), "created_at": int(time.time()),
+                    "filename": "batch.jsonl", "purpose": "batch", "status": "processed",
+                })
+            elif url.path == "/v1/batches":
+                request = json.loads(self._read_body() or b"{}")
+                if request.get("input_file_id") not in state.files:
+                    self._send_json(400, {"error": {"message": "Unknown input_file_id", "type": "invalid_request_error"}})
+                    return
+                state.count("batch_jobs")
+                with state.lock:
+                    batch_id = f"batch_{len(state.batches) + 1}"
+                    state.batches[batch_id] = {
+                        "id": batch_id, "object": "batch", "endpoint": request.get("endpoint"),
+                        "input_file_id": request["input_file_id"], "completion_window": request.get("completion_window", "24h"),
+                        "status": "validating", "created_at": int(time.time()),
+                        "request_counts": {"total": 0, "completed": 0, "failed": 0},
+                    }
+                threading.Thread(target=run_batch, args=(state, batch_id), daemon=True).start()
+                self._send_json(200, state.batches[batch_id])
+            else:
+                self._send_json(404, {"error": {"message": f"Unknown path {url.path}"}})
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path == "/search":
+                state.count("serp_requests")
+                query = parse_qs(url.query).get("q", [""])[0]
+                if state.serp_latency:
+                    time.sleep(state.sample_latency(state.serp_latency))
+                self._send_json(200, fake_serp_results(query))
+            elif url.path.startswith("/v1/batches/"):
+                batch = state.batches.get(url.path.rsplit("/", 1)[-1])
+                if batch is None:
+                    self._send_json(404, {"error": {"message": "No such batch"}})
+                else:
+                    self._send_json(200, batch)
+            elif url.path.startswith("/v1/files/") and url.path.endswith("/content"):
+                data = state.files.get(url.path.split("/")[3])
+                if data is None:
+                    self._send_json(404, {"error": {"message": "No such file"}})
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "application/octet-stream")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+            elif url.path == "/stats":
+                with state.lock:
+                    self._send_json(200, dict(state.counters))
+            else:
+                self._send_json(404, {"error": f"Unknown path {url.path}"})
+
+    return Handler
+
+
+def serve(host: str = "127.0.0.1", port: int = 8787, state: MockState = None) -> ThreadingHTTPServer:
+    """Start the mock server on a background thread and return it."""
+    server = ThreadingHTTPServer((host, port), make_handler(state or MockState()))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Local stand-in for SerpApi and the OpenAI chat and Batch APIs.")
+    add_state_args(p)
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8787)
+    return p.parse_args()
+
+
+def add_state_args(p: argparse.ArgumentParser) -> None:
+    """Register the MockState knobs (shared with benchmark.py)."""
+    p.add_argument("--serp-latency", type=float, default=0.0, help="mean seconds added to every /search response")
+    p.add_argument("--batch-latency", type=float, default=2.0, help="seconds each batch job stays in progress")
+    p.add_argument("--chat-latency", type=float, default=0.0, help="mean seconds per chat completion")
+    p.add_argument("--latency-dist", choices=LATENCY_DISTS, default="fixed", help="distribution latencies are drawn from")
+    p.add_argument("--latency-sigma", type=float, default=0.5, help="spread for the lognormal and uniform distributions")
+    p.add_argument("--error-rate", type=float, default=0.0, help="share of chat requests failing with a 500")
+    p.add_argument("--rate-limit-rate", type=float, default=0.0, help="share of chat requests rejected with a 429")
+    p.add_argument("--response-scale", type=float, default=1.0, help="multiplier for the length of generated pages")
+    p.add_argument("--seed", type=int, help="seed for latency and failure sampling")
+    p.add_argument("--prompt-cache-entries", type=int, default=100_000,
+                   help="prompt prefixes remembered for cached_tokens accounting (0 disables)")
+
+
+def state_from_args(args: argparse.Namespace) -> MockState:
+    return MockState(
+        serp_latency=args.serp_latency,
+        batch_latency=args.batch_latency,
+        chat_latency=args.chat_latency,
+        latency_dist=args.latency_dist,
+        sigma=args.latency_sigma,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        response_scale=args.response_scale,
+        seed=args.seed,
+        prompt_cache_entries=args.prompt_cache_entries,
+    )
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s | %(levelname)s | %(message)s")
+    server = serve(args.host, args.port, state_from_args(args))
+    logging.info("Mock server listening on http://%s:%d", args.host, args.port)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -1,14 +1,35 @@
 import os
 import argparse
 import asyncio
+import collections
+import contextlib
+import contextvars
+import csv
+import email.utils
+import gzip
+import hashlib
+import heapq
 import json
 import logging
 import re
+import shutil
+import sqlite3
+import threading
+import time
 import unicodedata
-from typing import Tuple, Optional, List, Dict
+from array import array
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import asdict, dataclass, fields
+from typing import Callable, Iterator, Tuple, Optional, List, Dict, Set, Type, Union
+from html import unescape as html_unescape
+from xml.sax.saxutils import escape as xml_escape
 
 import pandas as pd
 from serpapi import GoogleSearch
+try:
+    from openai import APITimeoutError, AsyncOpenAI  # type: ignore
+except ImportError as e:
+    raise SystemExit("openai package not found. Install with `pip install openai>=1.98.0`.") from e
 from string import Template
 import random
 
@@ -47,6 +68,11 @@ OPENAI_MODEL = os.getenv("OPENAI_MODEL", BASE_MODEL)
 OPENAI_API_KEY = _SECRETS.get("OPENAI_API_KEY")
 SERPAPI_API_KEY = _SECRETS.get("SERPAPI_API_KEY", "")
 
+# Point the SerpApi client at another endpoint (e.g. a local fake) when set
+SERPAPI_BACKEND = os.getenv("SERPAPI_BACKEND")
+if SERPAPI_BACKEND:
+    GoogleSearch.BACKEND = SERPAPI_BACKEND.rstrip("/")
+
 SYSTEM_MESSAGE = (
     "You are an expert copywriter specialized in crafting structured, professional, "
     "and helpful landing-page content for audiences interested in converting "
@@ -116,726 +142,3189 @@ Example for the keyword "convert vtt to srt" (only to illustrate the expected st
         EXAMPLE=example_section,
     )
 
+
+# Static text every prompt of a template starts with, see register_prompt_prefix
+PROMPT_PREFIXES: List[str] = []
+
+
+def register_prompt_prefix(tpl: Template, **constants: str) -> None:
+    """Remember the part of ``tpl`` that is identical for every row.
+
+    That is the text up to the first placeholder not listed in ``constants``
+    (run-wide values such as the API reference are filled in).
+    """
+    cut = len(tpl.template)
+    for m in tpl.pattern.finditer(tpl.template):
+        name = m.group("named") or m.group("braced")
+        if m.group("escaped") is None and name not in constants:
+            cut = m.start()
+            break
+    prefix = Template(tpl.template[:cut]).safe_substitute(**constants)
+    if prefix not in PROMPT_PREFIXES:
+        PROMPT_PREFIXES.append(prefix)
+
+
+def prompt_cache_key(stage: str, system_message: str, user_prompt: str) -> str:
+    """Route calls that share a prompt prefix to the same provider prompt cache.
+
+    The key is the stage plus a short hash of the system message and the
+    static template prefix the prompt starts with, so two templates used by
+    one stage (or an edited template) get their own bucket.
+    """
+    prefix = max((p for p in PROMPT_PREFIXES if user_prompt.startswith(p)), key=len, default="")
+    digest = hashlib.sha256(f"{system_message}\0{prefix}".encode("utf-8")).hexdigest()[:12]
+    return f"seo-{stage}-{digest}"
+
 ###############################################################################
-# OpenAI wrapper                                                              #
+# Response cache                                                              #
 ###############################################################################
 
-try:
-    from openai import AsyncOpenAI  # type: ignore
-except ImportError as e:
-    raise SystemExit("openai package not found. Install with `pip install openai>=1.3.7`.") from e
+CACHE_MODES = ("off", "read", "readwrite", "refresh")
+DEFAULT_CACHE_PATH = os.path.join(".cache", "responses.sqlite")
+DEFAULT_SERP_CACHE_PATH = os.path.join(".cache", "serp.sqlite")
 
 
-class SEOGenerator:
-    """Utility class for asynchronous OpenAI calls with a semaphore."""
+class ResponseCache:
+    """Content-addressed SQLite store of raw model answers (and SERP contexts).
 
-    def __init__(self, api_key: Optional[str] = None, serpapi_api_key: Optional[str] = None, concurrency: int = 3):
-        if api_key is None:
-            api_key = OPENAI_API_KEY or HARDCODED_API_KEY
-        if not api_key:
-            raise ValueError("OpenAI API key is required. Set OPENAI_API_KEY or add to settings/keys.txt")
-        self.client = AsyncOpenAI(api_key=api_key)
-        self.serpapi_api_key = serpapi_api_key
-        self.semaphore = asyncio.Semaphore(concurrency)
+    Keys are a SHA-256 of (model, system message, user prompt, output format), so
+    any change to a template, a CSV row or the model ID naturally misses.
+    ``mode`` controls access: ``read`` never writes, ``refresh`` never reads
+    (but stores fresh answers), ``readwrite`` does both. Shards running at
+    the same time share the file: WAL lets them read while one writes, and a
+    write that still loses the lock after ``timeout`` seconds is logged and
+    dropped, since a missing entry only costs a cache miss.
+    """
 
-    async def _single_call(
+    def __init__(
         self,
-        system_message: str,
-        user_prompt: str,
-        model_override: Optional[str] = None,
-        expect_json: bool = True,
-    ) -> Tuple[str, List[Dict[str, str]], List[Dict[str, str]], List[Dict[str, str]]]:
+        path: str = DEFAULT_CACHE_PATH,
+        mode: str = "readwrite",
+        max_bytes: int = 512 * 1024 * 1024,
+        max_age_days: float = 30.0,
+        timeout: float = 30.0,
+    ):
+        if mode not in CACHE_MODES or mode == "off":
+            raise ValueError(f"Invalid cache mode for ResponseCache: {mode}")
+        self.path = path
+        self.mode = mode
+        self.max_bytes = max_bytes
+        self.max_age = max_age_days * 86400
+        self.hits = 0
+        self.misses = 0
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path, timeout=timeout, isolation_level=None, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, answer TEXT NOT NULL, size INTEGER NOT NULL,"
+            " created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
 
-        model_id = model_override or OPENAI_MODEL
-        async with self.semaphore:
-            max_retries = 3
-            for attempt in range(max_retries):
-                try:
-                    response = await self.client.chat.completions.create(
-                        model=model_id,
-                        messages=[
-                            {"role": "system", "content": system_message},
-                            {"role": "user",   "content": user_prompt},
-                        ],
-                        timeout=60.0,
-                    )
-                    answer = response.choices[0].message.content
+    @staticmethod
+    def key(model_id: str, system_message: str, user_prompt: str, output_format: str) -> str:
+        payload = json.dumps([model_id, system_message, user_prompt, output_format], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        if self.mode not in ("read", "readwrite"):
+            return None
+        row = self.db.execute("SELECT answer, created FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None or (self.max_age and time.time() - row[1] > self.max_age):
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._write("UPDATE responses SET accessed = ? WHERE key = ?", (time.time(), key))
+        return row[0]
+
+    def put(self, key: str, answer: str) -> None:
+        if self.mode not in ("readwrite", "refresh"):
+            return
+        now = time.time()
+        self._write(
+            "INSERT OR REPLACE INTO responses (key, answer, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+            (key, answer, len(answer.encode("utf-8")), now, now),
+        )
+
+    def _write(self, sql: str, params: Tuple[object, ...]) -> None:
+        try:
+            self.db.execute(sql, params)
+        except sqlite3.OperationalError as e:
+            logging.warning("Response cache write skipped (%s): %s", self.path, e)
+
+    def evict(self) -> int:
+        """Drop expired entries, then least-recently-used ones above ``max_bytes``."""
+        if self.mode == "read":
+            return 0
+        removed = 0
+        if self.max_age:
+            removed += self.db.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.max_age,)).rowcount
+        total = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if self.max_bytes and total > self.max_bytes:
+            for key, size in self.db.execute("SELECT key, size FROM responses ORDER BY accessed").fetchall():
+                if total <= self.max_bytes:
                     break
-                except Exception as e:
-                    if attempt == max_retries - 1:
-                        logging.error("API call failed after %d attempts: %s", max_retries, e)
-                        raise
-                    logging.warning("API call attempt %d failed: %s. Retrying...", attempt + 1, e)
-                    await asyncio.sleep(2 ** attempt)  # Exponential backoff
-
-        # Remove ```json fences if present
-        import re, textwrap
-
-        def _strip(txt: str) -> str:
-            # Try to find JSON in ```json or ``` blocks
-            m = re.search(r"```(?:json)?\s*(\{.*?\})```", txt, re.DOTALL)
-            if m:
-                return textwrap.dedent(m.group(1)).strip()
-            
-            # Try to find JSON without fences (starts with { and ends with })
-            json_match = re.search(r'(\{.*\})', txt, re.DOTALL)
-            if json_match:
-                return json_match.group(1).strip()
-                
-            return txt.strip()
-
-        cleaned = _strip(answer)
-        parsed = None
-        
-        # Debug logging
-        logging.debug("Raw answer length: %d", len(answer))
-        logging.debug("Cleaned response preview: %s", repr(cleaned[:300]))
-        logging.debug("Expecting JSON: %s", expect_json)
-        
-        # If we don't expect JSON, return HTML directly
-        if not expect_json:
-            logging.debug("Not expecting JSON, returning HTML directly")
-            # Apply HTML cleaning first
-            cleaned_html = _ensure_html(cleaned)
-            
-            # More flexible validation for HTML content
-            if len(cleaned_html.strip()) < 50:
-                logging.warning("Content too short: %d chars", len(cleaned_html))
-                return f"<p>Error: Generated content too short ({len(cleaned_html)} chars). Retrying...</p>", [], [], []
-            
-            # If it doesn't start with HTML tag, wrap it
-            if not cleaned_html.strip().startswith('<'):
-                logging.debug("Content doesn't start with HTML tag, wrapping...")
-                cleaned_html = f"<div>{cleaned_html}</div>"
-                
-            return cleaned_html, [], [], []
-        
-        # Try parsing JSON; fallback to Python literal eval if it fails
+                self.db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                total -= size
+                removed += 1
+        return removed
+
+    def close(self) -> None:
         try:
-            parsed = json.loads(cleaned)
-            logging.debug("Successfully parsed JSON response")
-        except Exception as e:
-            logging.debug("JSON parsing failed: %s", e)
-            try:
-                import ast
-                parsed = ast.literal_eval(cleaned)
-                logging.debug("Successfully parsed with ast.literal_eval")
-                # Ensure parsed is a dict, not a set or other type
-                if not isinstance(parsed, dict):
-                    logging.warning("ast.literal_eval returned %s instead of dict", type(parsed))
-                    parsed = None
-            except Exception as e2:
-                logging.debug("ast.literal_eval also failed: %s", e2)
-                parsed = None
-
-        if parsed and isinstance(parsed, dict):
-            content = parsed.get("content", "")
-            faq = parsed.get("faq", [])
-            blogs = parsed.get("blog_ideas", [])
-            uses = parsed.get("use_cases", [])
-            
-            # Validation basique
-            if not content or len(content) < 100:
-                logging.warning("Content seems too short: %d chars", len(content))
-            if not isinstance(faq, list) or len(faq) < 3:
-                logging.warning("FAQ list seems incomplete: %d items", len(faq) if isinstance(faq, list) else 0)
-            if not isinstance(blogs, list) or len(blogs) < 5:
-                logging.warning("Blog ideas seem incomplete: %d items", len(blogs) if isinstance(blogs, list) else 0)
-                
-            return (content, faq, blogs, uses)
-        
-        # fallback - if no JSON, treat the raw response as HTML content
-        logging.warning("Failed to parse JSON response, treating as raw HTML content")
-        logging.debug("Cleaned content preview for fallback: %s", repr(cleaned[:500]))
-        
-        # If the response looks like raw HTML, use it directly
-        if cleaned.strip().startswith('<') and '<h' in cleaned:
-            logging.debug("Detected HTML content, using directly")
-            return cleaned, [], [], []
-            
-        # If it looks like JSON but failed to parse, try to extract manually
-        if '{' in cleaned and '"content"' in cleaned:
-            logging.warning("Attempting manual JSON extraction")
-            content_match = re.search(r'"content":\s*"([^"]*(?:\\.[^"]*)*)"', cleaned, re.DOTALL)
-            if content_match:
-                content = content_match.group(1)
-                content = content.replace('\\n', '\n').replace('\\"', '"').replace('\\/', '/')
-                logging.debug("Manually extracted content: %d chars", len(content))
-                return content, [], [], []
-        
-        # Last resort: return the cleaned text as-is
-        logging.warning("Using cleaned response as-is: %d chars", len(cleaned))
-        return cleaned, [], [], []
+            removed = self.evict()
+        except sqlite3.OperationalError as e:
+            logging.warning("Response cache eviction skipped (%s): %s", self.path, e)
+            removed = 0
+        logging.info("Response cache: %d hits, %d misses, %d evicted (%s)", self.hits, self.misses, removed, self.path)
+        self.db.close()
 
 ###############################################################################
-# Helper: related searches                                                    #
+# Run journal                                                                 #
 ###############################################################################
 
-def gather_serp_context(query: str, api_key: str) -> Dict[str, object]:
-    """Return SERP context: suggestions list plus raw blocks (questions, overview, organic)."""
-    if not api_key:
-        return {"suggestions": []}
-    try:
-        params = {"engine": "google_light", "q": query, "api_key": api_key}
-        results = GoogleSearch(params).get_dict()
-
-        suggestions: List[str] = []
-        questions_raw: List[dict] = results.get("related_questions", [])
-        organic_raw: List[dict] = results.get("organic_results", [])
-
-        # related searches (queries)
-        for item in results.get("related_searches", []):
-            q = item.get("query")
-            if q:
-                suggestions.append(q)
-
-        # related questions
-        for item in questions_raw:
-            q = item.get("question") or item.get("title")
-            if q and q not in suggestions:
-                suggestions.append(q)
-
-        # AI overview summary paragraphs (if available)
-        ai_overview = results.get("ai_overview")
-        if isinstance(ai_overview, dict):
-            summary = ai_overview.get("summary") or ai_overview.get("answer")
-            if summary:
-                suggestions.extend([s.strip() for s in summary.split(". ") if s])
-        elif isinstance(ai_overview, str):
-            suggestions.extend([s.strip() for s in ai_overview.split(". ") if s])
+DEFAULT_JOURNAL_DIR = "journal"
+
+
+class RunJournal:
+    """Append-only record of the units of work completed for each row.
+
+    Every row gets ``<root>/<slug>.jsonl``. Each line is one finished unit –
+    ``serp``, ``landing``, ``ideas``, ``comparison``, ``tech_ideas`` or a page
+    file name such as ``srt-to-vtt_blog_3.html`` – with its payload, the
+    SHA-256 of that payload and the fingerprint of the inputs it was made
+    from. Lines are fsync'd as they are written, so a killed process loses
+    at most the unit it was working on.
+    """
 
+    def __init__(self, root: str = DEFAULT_JOURNAL_DIR):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, slug: str) -> str:
+        return os.path.join(self.root, f"{slug}.jsonl")
+
+    @staticmethod
+    def digest(payload: object) -> str:
+        blob = json.dumps(payload, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+    def load(self, slug: str) -> Dict[str, Dict[str, object]]:
+        """Return ``{unit: entry}`` for ``slug``; later entries win, torn lines are ignored."""
+        entries: Dict[str, Dict[str, object]] = {}
+        path = self._path(slug)
+        if not os.path.isfile(path):
+            return entries
+        with open(path, "r", encoding="utf-8") as fp:
+            for line in fp:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    logging.warning("Ignoring torn journal line in %s", path)
+                    continue
+                if entry.get("hash") != self.digest(entry.get("payload")):
+                    logging.warning("Ignoring journal entry %s in %s: hash mismatch", entry.get("unit"), path)
+                    continue
+                entries[entry["unit"]] = entry
+        return entries
+
+    def slugs(self) -> List[str]:
+        return sorted(f[:-len(".jsonl")] for f in os.listdir(self.root) if f.endswith(".jsonl"))
+
+    def reset(self, slug: str) -> None:
+        path = self._path(slug)
+        if os.path.isfile(path):
+            os.remove(path)
+
+    def record(self, slug: str, unit: str, payload: object, fingerprint: Optional[str] = None) -> Dict[str, object]:
+        entry = {"unit": unit, "hash": self.digest(payload), "time": time.time(), "payload": payload}
+        if fingerprint is not None:
+            entry["fingerprint"] = fingerprint
+        with open(self._path(slug), "a", encoding="utf-8") as fp:
+            fp.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            fp.flush()
+            os.fsync(fp.fileno())
+        return entry
+
+###############################################################################
+# Adaptive concurrency                                                        #
+###############################################################################
+
+# Scheduling priority of the current task, lowest first: (row, page type). Rows
+# set it from their search volume and calls add their stage; tasks inherit it.
+CURRENT_PRIORITY: contextvars.ContextVar[Tuple[float, int]] = contextvars.ContextVar("current_priority", default=(0.0, 0))
+
+# Within a row: what the landing page needs first, then blogs, use cases, tech pages
+STAGE_PRIORITY = {"blog": 1, "use_case": 2, "tech_page": 3}
+
+
+class AdaptiveLimiter:
+    """AIMD concurrency limit for model calls, used like an asyncio.Semaphore.
+
+    The limit grows by roughly one slot per round trip while calls succeed
+    and latency stays close to its long-run average, and is halved (at most
+    once per round trip) on 429s, timeouts and 5xx errors. Callers release
+    their slot before sleeping through a backoff, so other work can use it.
+    Waiters are served by ``CURRENT_PRIORITY``, then in arrival order.
+    """
+
+    def __init__(
+        self,
+        initial: int = 6,
+        min_limit: int = 1,
+        max_limit: int = 32,
+        backoff: float = 0.5,
+        latency_tolerance: float = 2.0,
+    ):
+        self.min_limit = min_limit
+        self.max_limit = max(max_limit, initial)
+        self.limit = float(initial)
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.decreases = 0
+        self._short_latency: Optional[float] = None
+        self._long_latency: Optional[float] = None
+        self._last_decrease = 0.0
+        self._waiters: List[Tuple[Tuple[float, int], int, asyncio.Future]] = []
+        self._arrivals = 0
+        # Time integrals of in_flight and the limit, for average utilisation
+        self._busy_area = 0.0
+        self._limit_area = 0.0
+        self._last_change = time.monotonic()
+
+    def _capacity(self) -> int:
+        return max(self.min_limit, int(self.limit))
+
+    def _accrue(self) -> None:
+        now = time.monotonic()
+        self._busy_area += self.in_flight * (now - self._last_change)
+        self._limit_area += self._capacity() * (now - self._last_change)
+        self._last_change = now
+
+    def _take(self) -> None:
+        self._accrue()
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def _wake(self) -> None:
+        while self._waiters and self.in_flight < self._capacity():
+            fut = heapq.heappop(self._waiters)[2]
+            if not fut.done():
+                self._take()
+                fut.set_result(None)
+
+    async def acquire(self, priority: Optional[Tuple[float, int]] = None) -> None:
+        if not self._waiters and self.in_flight < self._capacity():
+            self._take()
+            return
+        fut = asyncio.get_running_loop().create_future()
+        self._arrivals += 1
+        heapq.heappush(self._waiters, (priority or CURRENT_PRIORITY.get(), self._arrivals, fut))
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                self.release()  # the slot was handed over just before cancellation
+            # otherwise the cancelled future is skipped when it reaches the top of the heap
+            raise
+
+    def release(self) -> None:
+        self._accrue()
+        self.in_flight -= 1
+        self._wake()
+
+    async def __aenter__(self) -> "AdaptiveLimiter":
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        self.release()
+
+    def on_success(self, latency: float) -> None:
+        """Additive increase, unless latency is drifting above its long-run average."""
+        if self._short_latency is None:
+            self._short_latency = self._long_latency = latency
+        else:
+            self._short_latency += 0.3 * (latency - self._short_latency)
+            self._long_latency += 0.02 * (latency - self._long_latency)
+        if self._short_latency > self.latency_tolerance * self._long_latency:
+            return
+        if self.limit < self.max_limit:
+            self._accrue()
+            self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+            self._wake()
+
+    def on_overload(self) -> None:
+        """Multiplicative decrease, at most once per observed round trip."""
+        now = time.monotonic()
+        if now - self._last_decrease < max(1.0, self._short_latency or 0.0):
+            return
+        self._last_decrease = now
+        self._accrue()
+        self.limit = max(float(self.min_limit), self.limit * self.backoff)
+        self.decreases += 1
+        logging.info("Backing off: concurrency limit now %d", self._capacity())
+
+    def snapshot(self) -> Dict[str, float]:
+        self._accrue()
         return {
-            "suggestions": suggestions[:20],
-            "related_questions": questions_raw,
-            "ai_overview": ai_overview,
-            "organic_results": organic_raw,
+            "limit": self._capacity(),
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "waiting": sum(not fut.done() for _, _, fut in self._waiters),
+            "decreases": self.decreases,
+            "utilization": round(self._busy_area / self._limit_area, 3) if self._limit_area else 0.0,
         }
-    except Exception as e:
-        logging.warning("SerpApi error: %s", e)
-        return {"suggestions": []}
+
+
+def _is_overload(exc: BaseException) -> bool:
+    """True for errors that mean 'slow down': 429, 5xx and timeouts."""
+    if isinstance(exc, (APITimeoutError, asyncio.TimeoutError)):
+        return True
+    status = getattr(exc, "status_code", None)
+    return status is not None and (status == 429 or status >= 500)
+
+
+def _retry_after(exc: BaseException) -> Optional[float]:
+    """Seconds requested by a Retry-After / retry-after-ms header, if any."""
+    headers = getattr(getattr(exc, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
 
 ###############################################################################
-# CLI                                                                         #
+# Rate limiting                                                               #
 ###############################################################################
 
-DEFAULT_CSV = os.path.join("settings", "srt_contents.csv")
-DEFAULT_OUTPUT = "preview.json"
+try:
+    import tiktoken  # type: ignore
+except ImportError:  # optional: token estimates fall back to ~4 chars per token
+    tiktoken = None
 
-def parse_args() -> argparse.Namespace:
-    p = argparse.ArgumentParser(description="Generate SEO landing content + pages.")
-    p.add_argument("--input_csv", default=DEFAULT_CSV)
-    p.add_argument("--output_json", default=DEFAULT_OUTPUT)
-    p.add_argument("--concurrency", type=int, default=6)
-    p.add_argument("--test", action="store_true", default=DEFAULT_TEST_MODE, help="enable test mode to process only top rows")
-    p.add_argument("--limit", type=int)
-    p.add_argument("--debug", action="store_true")
-    return p.parse_args()
+
+def estimate_tokens(text: str, model_id: str = "") -> int:
+    """Count prompt tokens locally, exactly with tiktoken when it is installed."""
+    if tiktoken is not None:
+        if not hasattr(estimate_tokens, "_enc"):
+            try:
+                estimate_tokens._enc = tiktoken.encoding_for_model(model_id)  # type: ignore
+            except KeyError:
+                estimate_tokens._enc = tiktoken.get_encoding("o200k_base")  # type: ignore
+        return len(estimate_tokens._enc.encode(text))  # type: ignore
+    return len(text) // 4 + 1
+
+
+class TokenBucket:
+    """Classic token bucket refilled continuously at ``per_minute / 60`` per second."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.level = per_minute
+        self.rate = per_minute / 60.0
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        self._refill()
+        # A single request larger than the bucket is admitted once it is full
+        needed = min(amount, self.capacity)
+        return 0.0 if self.level >= needed else (needed - self.level) / self.rate
+
+    def adjust(self, delta: float) -> None:
+        """Add (or, when negative, remove) tokens; the level may go into debt."""
+        self._refill()
+        self.level = min(self.capacity, self.level + delta)
+
+
+class RateLimiter:
+    """Request and token buckets matching the provider's RPM / TPM quotas.
+
+    Each call reserves its estimated prompt tokens plus a running average of
+    completion tokens before it is dispatched; the reservation is then
+    reconciled against the ``usage`` block of the response. Calls are
+    admitted in FIFO order, just under the quota (``headroom``), so bursts
+    queue locally instead of turning into 429s and retry sleeps.
+    """
+
+    def __init__(self, rpm: Optional[float] = None, tpm: Optional[float] = None, headroom: float = 0.95):
+        self.requests = TokenBucket(rpm * headroom) if rpm else None
+        self.tokens = TokenBucket(tpm * headroom) if tpm else None
+        self.completion_estimate = 1500.0
+        self.throttled_seconds = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, prompt_tokens: int) -> int:
+        """Wait for quota and return the number of tokens reserved."""
+        reserved = prompt_tokens + int(self.completion_estimate)
+        if self.requests is None and self.tokens is None:
+            return reserved
+        async with self._lock:
+            while True:
+                wait = max(
+                    self.requests.wait_time(1) if self.requests else 0.0,
+                    self.tokens.wait_time(reserved) if self.tokens else 0.0,
+                )
+                if wait <= 0:
+                    break
+                self.throttled_seconds += wait
+                await asyncio.sleep(wait)
+            if self.requests:
+                self.requests.adjust(-1)
+            if self.tokens:
+                self.tokens.adjust(-reserved)
+        return reserved
+
+    def reconcile(self, reserved: int, usage: object = None) -> None:
+        """Settle a reservation against actual usage (refund it entirely on failure)."""
+        if usage is None:
+            if self.tokens:
+                self.tokens.adjust(reserved)
+            return
+        completion = getattr(usage, "completion_tokens", None)
+        if completion:
+            self.completion_estimate += 0.1 * (completion - self.completion_estimate)
+        total = getattr(usage, "total_tokens", None)
+        if self.tokens and total:
+            self.tokens.adjust(reserved - total)
 
 ###############################################################################
-# Main async workflow                                                         #
+# Batch backend                                                               #
 ###############################################################################
 
-async def main() -> None:
-    args = parse_args()
-    logging.basicConfig(level=logging.DEBUG if args.debug else logging.INFO, format="%(asctime)s | %(levelname)s | %(message)s")
+DEFAULT_BATCH_DIR = os.path.join(".cache", "batches")
+BATCH_DONE_STATES = {"completed", "failed", "expired", "cancelled"}
+BATCH_ROW_WORKERS = 1000  # default rows in flight with --backend batch: one job per stage per wave
 
-    df = pd.read_csv(args.input_csv)
 
-    # test mode
-    if args.test:
-        sv_col = next((c for c in df.columns if c.startswith("SV")), None)
-        rows_keep = TEST_ROW_COUNT if TEST_ROW_COUNT > 0 else 5
-        if sv_col:
-            df[sv_col] = pd.to_numeric(df[sv_col], errors="coerce").fillna(0)
-            df = df.sort_values(sv_col, ascending=False).head(rows_keep).copy()
+class BatchCollector:
+    """Run chat requests through the Batch API instead of one call each.
+
+    ``submit`` queues a request body and waits for its answer. Queued
+    requests are flushed as one batch job once no new request has arrived
+    for ``flush_after`` seconds (or ``max_requests`` are pending), so each
+    wave of the row pipeline (landings, then all pages) becomes a single
+    job. Jobs are polled every ``poll_interval`` seconds; when one finishes
+    its answers are handed back to the waiting rows, which then write their
+    pages as usual. Per-request errors are raised to the caller, whose retry
+    loop resubmits them with the next batch. Input files under ``batch_dir``
+    are removed once a job's answers are in; failed jobs keep theirs.
+    """
+
+    def __init__(
+        self,
+        client: "AsyncOpenAI",
+        batch_dir: str = DEFAULT_BATCH_DIR,
+        flush_after: float = 5.0,
+        poll_interval: float = 60.0,
+        max_requests: int = 50000,
+    ):
+        self.client = client
+        self.batch_dir = batch_dir
+        self.flush_after = flush_after
+        self.poll_interval = poll_interval
+        self.max_requests = max_requests
+        self.pending: List[Tuple[str, Dict[str, object], asyncio.Future]] = []
+        self.jobs: List[str] = []
+        self._counter = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._flushes: Set[asyncio.Task] = set()
+        os.makedirs(batch_dir, exist_ok=True)
+
+    async def submit(self, body: Dict[str, object]) -> Dict[str, object]:
+        """Queue one /v1/chat/completions body and return the chat completion."""
+        loop = asyncio.get_running_loop()
+        self._counter += 1
+        future = loop.create_future()
+        self.pending.append((f"req-{self._counter}", body, future))
+        if self._timer is not None:
+            self._timer.cancel()
+        if len(self.pending) >= self.max_requests:
+            self._flush()
         else:
-            df = df.head(rows_keep).copy()
-    if args.limit:
-        df = df.head(args.limit).copy()
+            self._timer = loop.call_later(self.flush_after, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        self._timer = None
+        batch, self.pending = self.pending, []
+        if batch:
+            task = asyncio.create_task(self._run(batch))
+            self._flushes.add(task)
+            task.add_done_callback(self._flushes.discard)
+
+    async def _run(self, batch: List[Tuple[str, Dict[str, object], asyncio.Future]]) -> None:
+        futures = {custom_id: future for custom_id, _, future in batch}
+        try:
+            path = os.path.join(self.batch_dir, f"input-{int(time.time())}-{batch[0][0]}.jsonl")
+            # Serialising tens of thousands of requests would stall every row: do it in a thread
+            data = await asyncio.to_thread(self._write_input, path, [(custom_id, body) for custom_id, body, _ in batch])
+            upload = await self.client.files.create(file=(os.path.basename(path), data), purpose="batch")
+            job = await self.client.batches.create(
+                input_file_id=upload.id,
+                endpoint="/v1/chat/completions",
+                completion_window="24h",
+            )
+            self.jobs.append(job.id)
+            logging.info("📦 Submitted batch %s with %d requests", job.id, len(batch))
+            while job.status not in BATCH_DONE_STATES:
+                await asyncio.sleep(self.poll_interval)
+                job = await self.client.batches.retrieve(job.id)
+                counts = job.request_counts
+                if counts is not None:
+                    logging.info("📦 Batch %s %s: %d/%d done", job.id, job.status, counts.completed + counts.failed, counts.total)
+            # Expired or cancelled jobs still return the requests they finished
+            for file_id in (job.output_file_id, job.error_file_id):
+                if file_id:
+                    content = await self.client.files.content(file_id)
+                    self._resolve(content.text, futures)
+            logging.info("📦 Batch %s %s", job.id, job.status)
+            # Answers are ingested; the input file is only kept for jobs that failed
+            os.remove(path)
+        except Exception as e:
+            logging.error("Batch of %d requests failed: %s", len(batch), e)
+            for future in futures.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for custom_id, future in futures.items():
+            if not future.done():
+                future.set_exception(RuntimeError(f"Batch {job.id} ended '{job.status}' without an answer for {custom_id}"))
+
+    @staticmethod
+    def _write_input(path: str, requests: List[Tuple[str, Dict[str, object]]]) -> bytes:
+        data = "".join(
+            json.dumps({"custom_id": custom_id, "method": "POST", "url": "/v1/chat/completions", "body": body}) + "\n"
+            for custom_id, body in requests
+        ).encode("utf-8")
+        with open(path, "wb") as fh:
+            fh.write(data)
+        return data
+
+    @staticmethod
+    def _resolve(text: str, futures: Dict[str, asyncio.Future]) -> None:
+        for line in text.splitlines():
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            future = futures.get(item.get("custom_id"))
+            if future is None or future.done():
+                continue
+            response = item.get("response") or {}
+            if item.get("error") or response.get("status_code") != 200:
+                error = item.get("error") or response.get("body", {}).get("error") or {}
+                future.set_exception(RuntimeError(f"Batch request failed: {error.get('message', error)}"))
+            else:
+                future.set_result(response["body"])
 
-    generator = SEOGenerator(concurrency=args.concurrency, serpapi_api_key=SERPAPI_API_KEY)
+###############################################################################
+# Telemetry                                                                   #
+###############################################################################
 
-    with open(os.path.join(PROMPTS_DIR, "usecase_prompt.txt"), "r", encoding="utf-8") as fp:
-        use_tpl = Template(fp.read())
-    with open(os.path.join(PROMPTS_DIR, "comparison_prompt.txt"), "r", encoding="utf-8") as fp:
-        comp_tpl = Template(fp.read())
-    with open(os.path.join(PROMPTS_DIR, "ideas_prompt.txt"), "r", encoding="utf-8") as fp:
-        ideas_tpl = Template(fp.read())
-    with open(os.path.join(PROMPTS_DIR, "tech_ideas_prompt.txt"), "r", encoding="utf-8") as fp:
-        tech_ideas_tpl = Template(fp.read())
+DEFAULT_REPORT = "run_report.json"
 
-    async def _wrap(idx: int, row: pd.Series):
-        kw_primary = row["Keyword 1"]
-        kw_secondary = row["Keyword 2"]
-        serp_context: Dict[str, object] = {"suggestions": []}
-        if SERPAPI_API_KEY:
-            serp_context = await asyncio.to_thread(gather_serp_context, kw_primary, SERPAPI_API_KEY)
-        related_searches = serp_context.get("suggestions", [])
+# USD per million (input, cached input, output) tokens; dated snapshots match by prefix
+MODEL_PRICES: Dict[str, Tuple[float, float, float]] = {
+    "o4-mini": (1.10, 0.275, 4.40),
+    "o3-mini": (1.10, 0.55, 4.40),
+    "gpt-4.1-mini": (0.40, 0.10, 1.60),
+    "gpt-4.1": (2.00, 0.50, 8.00),
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+    "gpt-4o": (2.50, 1.25, 10.00),
+}
+BATCH_DISCOUNT = 0.5
+
+# Row (slug) the current task works for; tasks created by a row inherit it
+CURRENT_ROW: contextvars.ContextVar[str] = contextvars.ContextVar("current_row", default="")
+
+
+def model_price(model_id: str) -> Optional[Tuple[float, float, float]]:
+    for prefix in sorted(MODEL_PRICES, key=len, reverse=True):
+        if model_id.startswith(prefix):
+            return MODEL_PRICES[prefix]
+    return None
+
+
+def estimate_cost(
+    model_id: str, prompt_tokens: int, completion_tokens: int, batch: bool = False, cached_tokens: int = 0
+) -> float:
+    """USD cost of a call (0 for models without a known price).
+
+    ``cached_tokens`` of the prompt were served from the provider's prompt
+    cache and are billed at the cached-input rate.
+    """
+    price = model_price(model_id)
+    if price is None:
+        return 0.0
+    cost = ((prompt_tokens - cached_tokens) * price[0] + cached_tokens * price[1] + completion_tokens * price[2]) / 1_000_000
+    return cost * (BATCH_DISCOUNT if batch else 1.0)
+
+
+def _usage_tokens(usage: object) -> Tuple[int, int]:
+    """(prompt, completion) tokens from an SDK usage object or a raw usage dict."""
+    if usage is None:
+        return 0, 0
+    if isinstance(usage, dict):
+        return usage.get("prompt_tokens") or 0, usage.get("completion_tokens") or 0
+    return getattr(usage, "prompt_tokens", 0) or 0, getattr(usage, "completion_tokens", 0) or 0
+
+
+def _cached_tokens(usage: object) -> int:
+    """Prompt tokens served from the provider's prompt cache (``prompt_tokens_details``)."""
+    if usage is None:
+        return 0
+    if isinstance(usage, dict):
+        return (usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0
+    return getattr(getattr(usage, "prompt_tokens_details", None), "cached_tokens", 0) or 0
+
+
+def _percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0}
+    ordered = sorted(values)
+
+    def _at(q: float) -> float:
+        pos = q * (len(ordered) - 1)
+        low = int(pos)
+        high = min(low + 1, len(ordered) - 1)
+        return round(ordered[low] + (ordered[high] - ordered[low]) * (pos - low), 3)
+
+    return {"p50": _at(0.50), "p95": _at(0.95), "p99": _at(0.99)}
+
+
+@dataclass
+class CallRecord:
+    """What one logical model call (all its retries included) cost."""
+
+    stage: str
+    row: str
+    model: str
+    queue_wait: float = 0.0
+    latency: float = 0.0
+    retries: int = 0
+    prompt_tokens: int = 0
+    cached_prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cost: float = 0.0
+    cached: bool = False
+    ok: bool = True
+    # Refused by --max-cost / --max-tokens before its first attempt: not a call, not a failure
+    skipped_budget: bool = False
+
+
+TELEMETRY_SAMPLES = 10_000  # latency samples kept per stage for the percentiles
+
+
+class _Reservoir:
+    """Uniform sample of at most ``size`` values (exact until it fills up)."""
+
+    def __init__(self, size: int = TELEMETRY_SAMPLES):
+        self.size = size
+        self.seen = 0
+        self.values: List[float] = []
+        self._rng = random.Random(0)
+
+    def add(self, value: float) -> None:
+        self.seen += 1
+        if len(self.values) < self.size:
+            self.values.append(value)
+        else:
+            slot = self._rng.randrange(self.seen)
+            if slot < self.size:
+                self.values[slot] = value
 
-        prompt = build_outline_prompt(
-            format_1=row["format_1"],
-            format_2=row["format_2"],
-            kw_primary=kw_primary,
-            kw_secondary=kw_secondary,
-            related_searches=related_searches,
+
+class _CallStats:
+    """Running totals of a group of calls."""
+
+    def __init__(self):
+        self.counts = collections.Counter(
+            calls=0, skipped_budget=0, cache_hits=0, failures=0, retries=0,
+            prompt_tokens=0, cached_prompt_tokens=0, completion_tokens=0,
+        )
+        self.cost = 0.0
+        self.latency = _Reservoir()
+        self.queue_wait = _Reservoir()
+
+    def add(self, call: CallRecord) -> None:
+        if call.skipped_budget:
+            self.counts["skipped_budget"] += 1
+            return
+        self.counts.update(
+            calls=1, cache_hits=call.cached, failures=not call.ok, retries=call.retries,
+            prompt_tokens=call.prompt_tokens, cached_prompt_tokens=call.cached_prompt_tokens,
+            completion_tokens=call.completion_tokens,
         )
+        self.cost += call.cost
+        if not call.cached:
+            self.latency.add(call.latency)
+            self.queue_wait.add(call.queue_wait)
 
-        # Landing content -> always generated with BASE_MODEL
-        content, faq, blogs, uses = await generator._single_call(SYSTEM_MESSAGE, prompt, model_override=BASE_MODEL)  # type: ignore
-        
-        # Debug: log what we got
-        logging.debug("Landing content type: %s", type(content))
-        logging.debug("Landing content preview (first 200 chars): %s", repr(content[:200]))
+    def summary(self) -> Dict[str, object]:
+        c = self.counts
+        return {
+            "calls": c["calls"],
+            "skipped_budget": c["skipped_budget"],
+            "cache_hits": c["cache_hits"],
+            "failures": c["failures"],
+            "retries": c["retries"],
+            "latency_s": _percentiles(self.latency.values),
+            "queue_wait_s": _percentiles(self.queue_wait.values),
+            "prompt_tokens": c["prompt_tokens"],
+            "cached_prompt_tokens": c["cached_prompt_tokens"],
+            "completion_tokens": c["completion_tokens"],
+            "cost_usd": round(self.cost, 4),
+        }
 
-        # ------- second pass for enriched ideas (3 each) ---------------------
-        related_q = [q.get("snippet") or q.get("question") for q in serp_context.get("related_questions", [])][:5]
-        organic_snips = [o.get("snippet", "") for o in serp_context.get("organic_results", [])][:4]
 
-        ideas_prompt = ideas_tpl.substitute(
-            RELATED_Q="\n".join(f"- {q}" for q in related_q if q),
-            ORGANIC_SNIPPETS="\n".join(f"- {s}" for s in organic_snips if s)
+class Telemetry:
+    """Per-call metrics keyed by stage (prompt template), summarised at the end of a run.
+
+    Calls are folded into running totals as they finish (latency percentiles
+    come from a bounded sample per stage), so memory does not grow with the
+    number of calls; per row only calls, tokens and cost are kept.
+    """
+
+    def __init__(self, batch: bool = False):
+        self.batch = batch
+        self.started = time.monotonic()
+        self.totals = _CallStats()
+        self.stages: Dict[str, _CallStats] = collections.defaultdict(_CallStats)
+        self.rows: Dict[str, List[float]] = {}  # slug -> [calls, tokens, cost]
+        self._unpriced: Set[str] = set()
+
+    def add(self, call: CallRecord) -> None:
+        if model_price(call.model) is None and call.model not in self._unpriced:
+            self._unpriced.add(call.model)
+            logging.warning("No price known for model %s; its cost is reported as 0", call.model)
+        call.cost = estimate_cost(call.model, call.prompt_tokens, call.completion_tokens, self.batch, call.cached_prompt_tokens)
+        self.totals.add(call)
+        self.stages[call.stage].add(call)
+        row = self.rows.setdefault(call.row, [0, 0, 0.0])
+        if not call.skipped_budget:
+            row[0] += 1
+        row[1] += call.prompt_tokens + call.completion_tokens
+        row[2] += call.cost
+
+    def report(self) -> Dict[str, object]:
+        per_row = {
+            slug: {"calls": calls, "tokens": tokens, "cost_usd": round(cost, 4)}
+            for slug, (calls, tokens, cost) in sorted(self.rows.items())
+        }
+        costs = [r["cost_usd"] for r in per_row.values()]
+        return {
+            "wall_seconds": round(time.monotonic() - self.started, 1),
+            "backend": "batch" if self.batch else "chat",
+            "totals": self.totals.summary(),
+            "stages": {stage: stats.summary() for stage, stats in sorted(self.stages.items())},
+            "cost_per_row_usd": _percentiles(costs) if costs else {},
+            "rows": per_row,
+        }
+
+    @staticmethod
+    def format_report(report: Dict[str, object]) -> str:
+        lines = [
+            f"{'stage':<12} {'calls':>6} {'cached':>6} {'fail':>5} {'retry':>5} {'skip':>5} "
+            f"{'p50 s':>7} {'p95 s':>7} {'p99 s':>7} {'wait p95':>8} {'tokens':>10} {'pfx hit':>7} {'cost $':>9}"
+        ]
+        for stage, s in list(report["stages"].items()) + [("TOTAL", report["totals"])]:
+            lat, wait = s["latency_s"], s["queue_wait_s"]
+            # Share of prompt tokens billed at the cached-input rate
+            prefix_hit = s["cached_prompt_tokens"] / s["prompt_tokens"] if s["prompt_tokens"] else 0.0
+            lines.append(
+                f"{stage:<12} {s['calls']:>6} {s['cache_hits']:>6} {s['failures']:>5} {s['retries']:>5} {s['skipped_budget']:>5} "
+                f"{lat['p50']:>7.2f} {lat['p95']:>7.2f} {lat['p99']:>7.2f} {wait['p95']:>8.2f} "
+                f"{s['prompt_tokens'] + s['completion_tokens']:>10} {prefix_hit:>7.0%} {s['cost_usd']:>9.4f}"
+            )
+        per_row = report["cost_per_row_usd"]
+        if per_row:
+            lines.append(
+                f"{len(report['rows'])} rows in {report['wall_seconds']}s, cost per row "
+                f"p50 ${per_row['p50']:.4f} / p95 ${per_row['p95']:.4f}"
+            )
+        return "\n".join(lines)
+
+class BudgetExceeded(RuntimeError):
+    """The run hit --max-cost / --max-tokens; finished units stay journaled for --resume."""
+
+
+class Budget:
+    """Hard caps on spend for a run (``--max-cost`` USD, ``--max-tokens``).
+
+    Each attempt of a call is only dispatched if its estimate (prompt tokens
+    plus the running completion average) fits next to what was spent and what
+    is in flight, so the caps are never knowingly crossed; otherwise it waits for in-flight
+    calls to settle, and waiting calls are granted by ``CURRENT_PRIORITY`` so
+    the remaining budget goes to the highest-volume rows. When nothing in
+    flight could make room, waiting calls are refused, the budget is
+    ``exhausted`` and no new rows start.
+    """
+
+    def __init__(self, max_cost: Optional[float] = None, max_tokens: Optional[int] = None, batch: bool = False):
+        self.max_cost = max_cost
+        self.max_tokens = max_tokens
+        self.batch = batch
+        self.spent_cost = 0.0
+        self.spent_tokens = 0
+        self.exhausted = False
+        self._reserved: Dict[int, Tuple[float, int]] = {}
+        self._charged: Dict[int, Tuple[float, int]] = {}  # spend of earlier attempts of a call
+        self._waiters: List[Tuple[Tuple[float, int], int, float, int, int, asyncio.Future]] = []
+        self._arrivals = 0
+
+    def _fits(self, cost: float, tokens: int) -> bool:
+        held_cost = sum(c for c, _ in self._reserved.values())
+        held_tokens = sum(t for _, t in self._reserved.values())
+        return not (
+            (self.max_tokens and self.spent_tokens + held_tokens + tokens > self.max_tokens)
+            or (self.max_cost and self.spent_cost + held_cost + cost > self.max_cost)
         )
 
+    def _refusal(self) -> BudgetExceeded:
+        return BudgetExceeded(f"budget reached (${self.spent_cost:.2f}, {self.spent_tokens} tokens spent)")
+
+    def _grant(self) -> None:
+        # Strictly by priority: a lower-priority call never overtakes one still waiting for room
+        while self._waiters:
+            _, _, cost, tokens, key, fut = self._waiters[0]
+            if fut.done():
+                heapq.heappop(self._waiters)
+            elif self._fits(cost, tokens):
+                heapq.heappop(self._waiters)
+                self._reserved[key] = (cost, tokens)
+                fut.set_result(None)
+            elif not self._reserved:
+                self.exhausted = True
+                for *_, waiter in self._waiters:
+                    if not waiter.done():
+                        waiter.set_exception(self._refusal())
+                self._waiters.clear()
+            else:
+                return
+
+    async def reserve(self, call: "CallRecord", prompt_tokens: int, completion_tokens: int) -> None:
+        if not (self.max_cost or self.max_tokens):
+            return
+        if self.exhausted:
+            raise self._refusal()
+        tokens = prompt_tokens + completion_tokens
+        cost = estimate_cost(call.model, prompt_tokens, completion_tokens, self.batch)
+        fut = asyncio.get_running_loop().create_future()
+        self._arrivals += 1
+        heapq.heappush(self._waiters, (CURRENT_PRIORITY.get(), self._arrivals, cost, tokens, id(call), fut))
+        self._grant()
+        await fut
+
+    def settle(self, call: "CallRecord", final: bool = True) -> None:
+        """Charge what ``call`` has used so far and release its reservation.
+
+        Each attempt of a call holds its own reservation: a retry settles
+        (``final=False``) and reserves again, so retries cannot overspend.
+        """
+        reserved = self._reserved.pop(id(call), None)
+        charged_cost, charged_tokens = self._charged.pop(id(call), (0.0, 0))
+        if reserved is None:
+            return
+        tokens = call.prompt_tokens + call.completion_tokens
+        cost = estimate_cost(call.model, call.prompt_tokens, call.completion_tokens, self.batch, call.cached_prompt_tokens)
+        self.spent_cost += cost - charged_cost
+        self.spent_tokens += tokens - charged_tokens
+        if not final:
+            self._charged[id(call)] = (cost, tokens)
+        self._grant()
+
+
+class Tracer:
+    """Chrome trace-event recorder for ``--trace`` (open the file in Perfetto or chrome://tracing).
+
+    Spans become complete ("X") events. Each group (rows, stages, model
+    calls, SERP lookups, page writes) is shown as a process whose lanes are
+    handed out so that concurrent spans never share a track; counters ("C")
+    plot the concurrency limiter over time. Disabled until ``start``. Events
+    are written to the file as they happen rather than kept in memory;
+    ``save`` closes the JSON.
+    """
+
+    GROUPS = {"row": 1, "stage": 2, "model": 3, "serp": 4, "write": 5}
+
+    def __init__(self):
+        self.path: Optional[str] = None
+        self.count = 0
+        self._fh = None
+        self._lanes: Dict[str, List[int]] = collections.defaultdict(list)
+        self._lane_count: Dict[str, int] = collections.defaultdict(int)
+        self._t0 = time.perf_counter()
+
+    def start(self, path: str) -> None:
+        self.path = path
+        self._t0 = time.perf_counter()
+        self._fh = open(path, "w", encoding="utf-8")
+        self._fh.write('{"displayTimeUnit": "ms", "traceEvents": [')
+        for group, pid in self.GROUPS.items():
+            self._emit({"name": "process_name", "ph": "M", "pid": pid, "args": {"name": group}})
+
+    def _emit(self, event: Dict[str, object]) -> None:
+        self._fh.write(("," if self.count else "") + "\n" + json.dumps(event))
+        self.count += 1
+
+    def _now(self) -> float:
+        return round((time.perf_counter() - self._t0) * 1e6, 1)
+
+    @contextlib.contextmanager
+    def span(self, name: str, group: str, **args: object):
+        """Time the enclosed block; the yielded dict can receive extra args."""
+        if self._fh is None:
+            yield args
+            return
+        free = self._lanes[group]
+        if free:
+            lane = heapq.heappop(free)
+        else:
+            self._lane_count[group] += 1
+            lane = self._lane_count[group]
+        start = self._now()
         try:
-            # We only need the blog and use-case lists (3 items each)
-            _, _, extra_blogs, extra_uses = await generator._single_call(
-                SYSTEM_MESSAGE,
-                ideas_prompt,
-                model_override=BASE_MODEL,  # single model
-                expect_json=True,
-            )
-            # merge while avoiding duplicates
-            def _merge(src, extra, key):
-                titles = {item[key] for item in src}
-                for itm in extra:
-                    if itm[key] not in titles and len(src) < 10:
-                        src.append(itm)
-            _merge(blogs, extra_blogs, "title")
-            _merge(uses, extra_uses, "name")
-        except Exception as e:
-            logging.warning("Ideas prompt failed: %s", e)
-        # Debug: log blog ideas and use cases returned by the model
-        logging.debug("Row %d returned blog_ideas (%d): %s", idx, len(blogs), blogs)
-        logging.debug("Row %d returned use_cases (%d): %s", idx, len(uses), uses)
-        comp_prompt = comp_tpl.substitute(FORMAT_1=row["format_1"].upper(), FORMAT_2=row["format_2"].upper())
-        comp_html, *_ = await generator._single_call(SYSTEM_MESSAGE, comp_prompt, expect_json=False)  # type: ignore
-        return idx, content, faq, blogs, uses, serp_context, comp_html
-
-    tasks = [asyncio.create_task(_wrap(idx, row)) for idx, row in df.iterrows()]
-    logging.info("Queued %d rows", len(tasks))
-
-    results: List[Dict[str, object]] = []
-    for fut in asyncio.as_completed(tasks):
-        idx, content, faq, blogs, uses, rel, comp_html = await fut
-        results.append({
-            "url": df.at[idx, "URL"],
-            "format_1": df.at[idx, "format_1"],
-            "format_2": df.at[idx, "format_2"],
-            "keyword_primary": df.at[idx, "Keyword 1"],
-            "keyword_secondary": df.at[idx, "Keyword 2"],
-            "serp_context": rel,
-            "content": content,
-            "faq": faq,
-            "blog_ideas": blogs,
-            "use_cases": uses,
-            "comparison": comp_html,
-        })
-        with open(args.output_json, "w", encoding="utf-8") as fp:
-            json.dump(results, fp, ensure_ascii=False, indent=2)
+            yield args
+        finally:
+            self._emit({
+                "name": name, "cat": group, "ph": "X", "ts": start, "dur": self._now() - start,
+                "pid": self.GROUPS[group], "tid": lane, "args": args,
+            })
+            heapq.heappush(free, lane)
 
-    # ------------------------------------------------------------------
-    # Generate static pages                                              
-    # ------------------------------------------------------------------
+    def counter(self, name: str, **values: float) -> None:
+        if self._fh is not None:
+            self._emit({"name": name, "ph": "C", "ts": self._now(), "pid": self.GROUPS["model"], "args": values})
 
-    demo_dir = os.path.join(os.path.dirname(__file__), "demo_site")
-    os.makedirs(demo_dir, exist_ok=True)
+    def save(self) -> None:
+        if self._fh is None:
+            return
+        self._fh.write("\n]}\n")
+        self._fh.close()
+        self._fh = None
+        logging.info("Wrote %d trace events to %s", self.count, self.path)
 
-    with open(os.path.join(PROMPTS_DIR, "article_prompt.txt"), "r", encoding="utf-8") as fp:
-        article_tpl = Template(fp.read())
-    with open(os.path.join(PROMPTS_DIR, "tech_article_prompt.txt"), "r", encoding="utf-8") as fp:
-        tech_article_tpl = Template(fp.read())
-    with open(os.path.join(PROMPTS_DIR, "tech_usecase_prompt.txt"), "r", encoding="utf-8") as fp:
-        tech_use_tpl = Template(fp.read())
 
-    # Load API summary for technical prompts
-    api_summary_file = os.path.join(PROMPTS_DIR, "api_happyscribe_doc_resume.txt")
-    if os.path.isfile(api_summary_file):
-        with open(api_summary_file, "r", encoding="utf-8") as fp:
-            API_SUMMARY = fp.read()
-    else:
-        API_SUMMARY = ""
+TRACER = Tracer()
 
-    # ------------------------------------------------------------------
-    # Utility: write full static HTML page                                 
-    # ------------------------------------------------------------------
+###############################################################################
+# Structured outputs                                                          #
+###############################################################################
 
-    async def _write_page(
-        path: str,
-        title: str,
-        body_html: str,
-        extra_nav: str = "",
-        meta_desc: str = "",
-        model_id: str = "",
-    ) -> None:
-        """Save a complete HTML file with shared header/footer."""
+class InvalidAnswer(ValueError):
+    """A model answer that cannot be used as-is; it is retried straight away."""
 
-        page_slug = os.path.basename(path)
-        canonical_url = (
-            f"https://monsiaz.github.io/demo_happyscribe_contents_gen/{page_slug}"
-        )
 
-        skel = f"""
-<!DOCTYPE html>
-<html lang='en'>
-<head>
-  <meta charset='utf-8'>
-  <title>{title} - HappyScribe</title>
-  <meta name='description' content='{meta_desc or 'AI-generated page about subtitle conversion.'}'>
-  <meta name='viewport' content='width=device-width,initial-scale=1'>
-  <link rel='canonical' href='{canonical_url}'>
-  <link rel='stylesheet' href='https://cdn.jsdelivr.net/npm/bootstrap@5.3.3/dist/css/bootstrap.min.css'>
-  <link rel='stylesheet' href='settings/web_assets/style.css'>
-</head>
-<body>
-  <header class='topbar'>
-     <div class='container topbar-inner'>
-        <a class='brand' href='/'><img src='https://monsiaz.github.io/demo_happyscribe_contents_gen/settings/web_assets/header.png' class='hero-img' alt='Header'></a>
-     </div>
-  </header>
+def _object_schema(**properties: Dict[str, object]) -> Dict[str, object]:
+    # Strict structured outputs need every property listed and nothing else allowed
+    return {"type": "object", "properties": properties, "required": list(properties), "additionalProperties": False}
 
-  <main class='container'>
-     <nav id='toc' class='toc'></nav>
-     {body_html}
-     {extra_nav}
-  </main>
 
-  <footer>
-     <div class='container small text-muted'>© HappyScribe · Generated by <strong>{model_id}</strong></div>
-  </footer>
+def _list_schema(*keys: str) -> Dict[str, object]:
+    return {"type": "array", "items": _object_schema(**{k: {"type": "string"} for k in keys})}
 
-  <script src='https://cdn.jsdelivr.net/npm/bootstrap@5.3.3/dist/js/bootstrap.bundle.min.js'></script>
-  <script>
-  document.addEventListener('DOMContentLoaded', () => {{
-     const toc = document.getElementById('toc');
-     if (!toc) return;
-     const h2s = Array.from(document.querySelectorAll('main.container h2'));
-     if (!h2s.length) {{ toc.remove(); return; }}
-     const ul = document.createElement('ul');
-     h2s.forEach(h => {{
-        const id = h.textContent.trim().toLowerCase().replace(/[^a-z0-9]+/g,'-');
-        h.id = id;
-        const li = document.createElement('li');
-        li.innerHTML = "<a href='#"+id+"'>"+h.textContent+"</a>";
-        ul.appendChild(li);
-     }});
-     toc.innerHTML = '<h2>Table of contents</h2>';
-     toc.appendChild(ul);
-  }});
-  </script>
-</body>
-</html>"""
 
-        os.makedirs(os.path.dirname(path), exist_ok=True)
-        with open(path, "w", encoding="utf-8") as fp:
-            fp.write(skel.strip())
+class StructuredOutput:
+    """Base for JSON answers constrained by a schema through ``response_format``.
 
-    # ------------------------------------------------------------------
-    # Helper: ensure we extract clean HTML from model response -----------
-    _html_re = re.compile(r'"content"\\s*:\\s*"(.*?)"', re.DOTALL)
-
-    def _ensure_html(raw: str) -> str:
-        """Return HTML string even if wrapped in JSON or markdown fences."""
-        txt = raw.strip()
-        
-        # Remove leading Response dumps
-        if txt.startswith("Response("):
-            first_tag = txt.find("<")
-            if first_tag != -1:
-                txt = txt[first_tag:]
-        
-        # If already HTML with headings, return as-is
-        if txt.startswith('<') and '<h' in txt:
-            return txt
-            
-        # If starts with HTML tag (any), return as-is
-        if txt.startswith('<') and '>' in txt:
-            return txt
-            
-        # Handle JSON wrapped content
-        if '"content":' in txt and '"' in txt:
-            try:
-                # Try to parse as JSON and extract content
-                parsed = json.loads(txt)
-                if isinstance(parsed, dict) and "content" in parsed:
-                    content = parsed["content"]
-                    # Unescape if needed
-                    content = content.replace('\\n', '\n').replace('\\"', '"').replace('\\/', '/')
-                    return content
-            except Exception as e:
-                logging.debug("JSON extraction in _ensure_html failed: %s", e)
-                # Try to extract content manually with regex
-                content_match = re.search(r'"content":\s*"([^"]*(?:\\.[^"]*)*)"', txt, re.DOTALL)
-                if content_match:
-                    content = content_match.group(1)
-                    # Unescape
-                    content = content.replace('\\n', '\n').replace('\\"', '"').replace('\\/', '/')
-                    return content
-        
-        # Remove ``` fences
-        if txt.startswith('```'):
-            lines = txt.split('\n')
-            # Remove first line (```html, ```json, etc.)
-            if len(lines) > 1:
-                lines = lines[1:]
-            # Remove last ``` if present
-            if lines and lines[-1].strip() == '```':
-                lines = lines[:-1]
-            txt = '\n'.join(lines).strip()
-            
-        # Try regex extraction for quoted content
-        m = _html_re.search(txt)
-        if m:
-            html_escaped = m.group(1)
-            try:
-                html_escaped = bytes(html_escaped, "utf-8").decode("unicode_escape")
-            except Exception:
-                pass
-            return html_escaped
-        
-        # If it looks like broken JSON or template code, try to extract HTML
-        if '{' in txt and '}' in txt:
-            # Look for HTML content within the response
-            html_match = re.search(r'<h[1-6][^>]*>.*?</.*?>', txt, re.DOTALL)
-            if html_match:
-                # Find the start of HTML content
-                start = txt.find('<h')
-                if start != -1:
-                    return txt[start:]
-        
-        # Return cleaned text
-        return txt
+    Subclasses are dataclasses whose fields are the top-level JSON keys;
+    ``SCHEMA`` describes them for the API and ``asdict`` gives back the
+    payload stored in the journal.
+    """
 
-    # CTA stripping helper removed – prompts no longer generate marketing calls
-
-    def _build_faq_accordion(faq_list: List[Dict[str, str]], prefix: str) -> str:
-        if not faq_list:
-            return ""
-        
-        items_html = []
-        for i, item in enumerate(faq_list):
-            question = item.get("question", "")
-            answer = item.get("answer", "")
-            if not question or not answer:
-                continue
+    SCHEMA: Dict[str, object] = {}
 
-            target_id = f"{prefix}-{i}"
-            item_html = (
-                f'<div class="accordion-item">'
-                f'  <h3 class="accordion-header" id="heading-{target_id}">' 
-                f'    <button class="accordion-button" type="button" data-bs-toggle="collapse" data-bs-target="#{target_id}" aria-expanded="true" aria-controls="{target_id}">' 
-                f'      {question}' 
-                f'    </button>' 
-                f'  </h3>' 
-                f'  <div id="{target_id}" class="accordion-collapse collapse show" aria-labelledby="heading-{target_id}" >' 
-                f'    <div class="accordion-body">{answer}</div>' 
-                f'  </div>' 
-                f'</div>'
-            )
-            items_html.append(item_html)
+    @classmethod
+    def response_format(cls) -> Dict[str, object]:
+        return {"type": "json_schema", "json_schema": {"name": cls.__name__, "strict": True, "schema": cls.SCHEMA}}
 
-        if not items_html:
-            return ""
+    @classmethod
+    def from_answer(cls, answer: str) -> "StructuredOutput":
+        txt = answer.strip()
+        # Schema-constrained answers are bare JSON; tolerate a fence from endpoints without JSON mode
+        if txt.startswith("```"):
+            txt = txt.split("\n", 1)[-1].rsplit("```", 1)[0]
+        try:
+            data = json.loads(txt)
+        except json.JSONDecodeError as e:
+            raise InvalidAnswer(f"{cls.__name__} answer is not JSON: {e}") from e
+        missing = [f.name for f in fields(cls) if not isinstance(data, dict) or f.name not in data]
+        if missing:
+            raise InvalidAnswer(f"{cls.__name__} answer is missing {', '.join(missing)}")
+        return cls(**{f.name: data[f.name] for f in fields(cls)})
+
+
+@dataclass
+class LandingCopy(StructuredOutput):
+    """Landing page copy, FAQ and the first page ideas (landing_prompt.txt)."""
+
+    content: str
+    faq: List[Dict[str, str]]
+    blog_ideas: List[Dict[str, str]]
+    use_cases: List[Dict[str, str]]
+
+    SCHEMA = _object_schema(
+        content={"type": "string"},
+        faq=_list_schema("question", "answer"),
+        blog_ideas=_list_schema("title", "meta"),
+        use_cases=_list_schema("name", "description"),
+    )
 
-        return (
-            f'<div class="faq-block"><h2>Frequently Asked Questions</h2>'
-            f'<div class="accordion" id="faqAccordion-{prefix}">' 
-            + ''.join(items_html) + '</div></div>'
-        )
 
-    # Convenience: slugify helper
-    def _slugify(txt: str) -> str:
-        base = unicodedata.normalize('NFKD', txt).encode('ascii', 'ignore').decode('ascii')
-        slug = re.sub(r'[^a-z0-9]+', '-', base.lower()).strip('-')
-        return slug[:60] or 'page'
-
-    # Helper: apply proper sentence case
-    def _sentence_case(txt: str) -> str:
-        """Apply sentence case: capitalize first letter and proper nouns/acronyms only."""
-        if not txt:
-            return txt
-        
-        # First, preserve known acronyms
-        acronyms = ['SRT', 'VTT', 'HTML', 'CSS', 'API', 'JSON', 'XML', 'HTTP', 'HTTPS', 'URL', 'SEO', 'AI', 'ML', 'CI', 'CD', 'DVD', 'TV', 'HD', 'MP4', 'AVI', 'MOV', 'WEBM', 'FFMPEG', 'UTF', 'ASCII', 'WEBVTT', 'HAPPYSCRIBE']
-        
-        # Split into words
-        words = txt.split()
-        result = []
-        
-        for i, word in enumerate(words):
-            # Remove punctuation for comparison
-            clean_word = re.sub(r'[^\w]', '', word.upper())
-            
-            if clean_word in acronyms:
-                # Preserve acronym case but keep original punctuation
-                punctuation = re.sub(r'[a-zA-Z]', '', word)
-                result.append(clean_word + punctuation)
-            elif i == 0:
-                # Always capitalize first word completely
-                result.append(word.capitalize())
-            else:
-                # Lowercase other words except proper nouns
-                if word.lower() in ['happyscribe', 'github', 'youtube', 'vimeo', 'premiere', 'pro', 'windows', 'mac', 'linux']:
-                    result.append(word.capitalize())
-                else:
-                    result.append(word.lower())
-        
-        return ' '.join(result)
+@dataclass
+class PageIdeas(StructuredOutput):
+    """Extra blog and use-case ideas drawn from the SERP context (ideas_prompt.txt)."""
 
-    # ------------------------------------------------------------------
-    # Generate blog, use-case, and landing pages for each result --------
-    # ------------------------------------------------------------------
+    blog_ideas: List[Dict[str, str]]
+    use_cases: List[Dict[str, str]]
 
-    for res in results:
-        kw_p = res["keyword_primary"]
-        kw_s = res["keyword_secondary"]
-        f1 = res["format_1"]
-        f2 = res["format_2"]
+    SCHEMA = _object_schema(
+        blog_ideas=_list_schema("title", "meta"),
+        use_cases=_list_schema("name", "description"),
+    )
 
-        slug = _slugify(f"{f1}-to-{f2}")
-        landing_fname = f"{slug}.html"
-        landing_path = os.path.join(demo_dir, landing_fname)
 
-        # Build filename lists for blogs and use-cases
-        blog_links = [
-            (f"{slug}_blog_{i}.html", _sentence_case(b.get("title", f"Blog {i}")), b.get("meta", ""))
-            for i, b in enumerate(res.get("blog_ideas", []), 1)
-        ]
-        
-        use_links = [
-            (f"{slug}_use_{i}.html", _sentence_case(u.get("name", f"Use case {i}")), u.get("description", ""))
-            for i, u in enumerate(res.get("use_cases", []), 1)
-        ]
+@dataclass
+class TechIdeas(StructuredOutput):
+    """Technical blog and use-case ideas around the API (tech_ideas_prompt.txt)."""
 
-        stats_pool = [
-            '<p class="alt-bg">💡 83% of internet users watch videos without sound — subtitles are crucial.</p>',
-            '<p class="alt-bg">📊 92% of videos viewed on mobile are watched in silent mode.</p>',
-            '<p class="alt-bg">🔈 69% of users leave a video if subtitles are missing.</p>',
-            '<p class="alt-bg">🌍 80% of learners retain information better with subtitles.</p>',
-            '<p class="alt-bg">🕒 Subtitled videos increase viewing time by 12%.</p>',
-        ]
+    tech_blog_ideas: List[Dict[str, str]]
+    tech_use_cases: List[Dict[str, str]]
 
-        stat_info = random.choice(stats_pool)
+    SCHEMA = _object_schema(
+        tech_blog_ideas=_list_schema("title", "meta"),
+        tech_use_cases=_list_schema("name", "description"),
+    )
 
-        # Lists for context to avoid redundancy
-        all_blog_titles = [title for _, title, _ in blog_links]
-        all_use_names   = [name for _, name, _ in use_links]
+###############################################################################
+# OpenAI wrapper                                                              #
+###############################################################################
 
-        async def _gen_blog(fname: str, title_b: str, meta_b: str, idx: int):
-            prompt = article_tpl.substitute(
-                TITLE=title_b,
-                KW_PRIMARY=kw_p,
-                KW_SECONDARY=kw_s,
-                ALL_BLOGS="\n".join(all_blog_titles),
-                ALL_USES="\n".join(all_use_names),
-                STAT_INFO=stat_info,)
-            model_to_use = BASE_MODEL
-            
-            # Retry logic for content generation
-            max_retries = 2
-            for retry in range(max_retries):
-                try:
-                    body_html, *_ = await generator._single_call(
-                        SYSTEM_MESSAGE, prompt, model_override=model_to_use, expect_json=False
-                    )
-                    # Check if content is valid
-                    if "Error:" not in body_html and len(body_html.strip()) > 200:
-                        break
-                    elif retry < max_retries - 1:
-                        logging.warning("Blog content invalid for %s, retrying (%d/%d)", fname, retry + 1, max_retries)
-                        await asyncio.sleep(1)
-                except Exception as e:
-                    if retry < max_retries - 1:
-                        logging.warning("Blog generation failed for %s, retrying: %s", fname, e)
-                        await asyncio.sleep(2)
-                    else:
-                        body_html = f"<h1>{title_b}</h1><p>Content generation failed after {max_retries} attempts. Please regenerate this page.</p>"
-            
-            nav_back = f'<p><a href="{landing_fname}">&larr; Back to converter landing</a></p>'
-            extra_links = "<h2>More Articles</h2><ul>" + "".join(
-                f'<li><a href="{f}">{t}</a></li>' for f, t, _ in blog_links if f != fname
-            ) + "</ul>"
-            await _write_page(
-                os.path.join(demo_dir, fname),
-                title_b,
-                body_html,
-                nav_back + extra_links,
-                meta_b,
-                model_id=model_to_use,
-            )
+class SEOGenerator:
+    """Utility class for asynchronous OpenAI calls behind an adaptive concurrency limit."""
 
-        async def _gen_use(fname: str, name_u: str, desc_u: str, idx: int):
-            prompt = use_tpl.substitute(
-                USE_NAME=name_u,
-                F1=f1.upper(),
-                F2=f2.upper(),
-                ALL_BLOGS="\n".join(all_blog_titles),
-                ALL_USES="\n".join(all_use_names),
-                STAT_INFO=stat_info,
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        serpapi_api_key: Optional[str] = None,
+        concurrency: int = 3,
+        cache: Optional[ResponseCache] = None,
+        max_concurrency: int = 32,
+        rate_limiter: Optional[RateLimiter] = None,
+        backend: str = "chat",
+        batch_poll_interval: float = 60.0,
+        stream: bool = False,
+        budget: Optional[Budget] = None,
+    ):
+        if api_key is None:
+            api_key = OPENAI_API_KEY or HARDCODED_API_KEY
+        if not api_key:
+            raise ValueError("OpenAI API key is required. Set OPENAI_API_KEY or add to settings/keys.txt")
+        # Retries are handled below so backoff never holds a concurrency slot
+        self.client = AsyncOpenAI(api_key=api_key, max_retries=0)
+        self.serpapi_api_key = serpapi_api_key
+        self.limiter = AdaptiveLimiter(initial=concurrency, max_limit=max_concurrency)
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.cache = cache
+        self.batch = BatchCollector(self.client, poll_interval=batch_poll_interval) if backend == "batch" else None
+        self._inflight: Dict[Tuple[str, Optional[str], object], asyncio.Future] = {}
+        self.coalesced = 0
+        self.stream = stream
+        self.aborted_streams = 0
+        self.telemetry = Telemetry(batch=self.batch is not None)
+        self.budget = budget or Budget(batch=self.batch is not None)
+
+    async def _single_call(
+        self,
+        system_message: str,
+        user_prompt: str,
+        model_override: Optional[str] = None,
+        result_type: Optional[Type[StructuredOutput]] = None,
+        stream_path: Optional[str] = None,
+        stage: str = "other",
+        validate: Optional[Callable[[str], bool]] = None,
+    ) -> Union[str, StructuredOutput]:
+        """Ask the model once (modulo retries) and parse the answer.
+
+        Returns cleaned HTML, or an instance of ``result_type`` when given:
+        the answer is then constrained to its schema via ``response_format``.
+        With streaming enabled, HTML answers are written to ``stream_path``
+        as they arrive and cancelled early when their first tokens are
+        clearly not a page. ``stage`` names the prompt template in telemetry.
+        HTML that fails ``validate`` is still returned, but never cached, so
+        a caller that rejects it with the same check gets a fresh answer.
+        """
+
+        model_id = model_override or OPENAI_MODEL
+        if not self.stream or result_type is not None:
+            stream_path = None
+
+        # Identical requests already in flight share one answer instead of a second call
+        # (only with the same stream file and validation, which shape the answer too)
+        key = ResponseCache.key(model_id, system_message, user_prompt, result_type.__name__ if result_type else "html")
+        inflight_key = (key, stream_path, validate)
+        task = self._inflight.get(inflight_key)
+        if task is None:
+            task = asyncio.ensure_future(
+                self._call_model(key, system_message, user_prompt, model_id, result_type, stream_path, stage, validate)
             )
-            model_to_use = BASE_MODEL
-            
-            # Retry logic for content generation
-            max_retries = 2
-            for retry in range(max_retries):
+            self._inflight[inflight_key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(inflight_key, None))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    async def _call_model(
+        self,
+        key: str,
+        system_message: str,
+        user_prompt: str,
+        model_id: str,
+        result_type: Optional[Type[StructuredOutput]],
+        stream_path: Optional[str] = None,
+        stage: str = "other",
+        validate: Optional[Callable[[str], bool]] = None,
+    ) -> Union[str, StructuredOutput]:
+        call = CallRecord(stage=stage, row=CURRENT_ROW.get(), model=model_id)
+        # Runs in its own task, so this only ranks this call's wait for a slot
+        CURRENT_PRIORITY.set((CURRENT_PRIORITY.get()[0], STAGE_PRIORITY.get(stage, 0)))
+        with TRACER.span(stage, "model", row=call.row) as info:
+            try:
+                return await self._request_answer(
+                    key, system_message, user_prompt, model_id, result_type, stream_path, call, validate
+                )
+            except Exception:
+                call.ok = call.skipped_budget
+                raise
+            finally:
+                self.telemetry.add(call)
+                self.budget.settle(call)
+                info.update(retries=call.retries, cached=call.cached, ok=call.ok, skipped_budget=call.skipped_budget)
+
+    async def _request_answer(
+        self,
+        key: str,
+        system_message: str,
+        user_prompt: str,
+        model_id: str,
+        result_type: Optional[Type[StructuredOutput]],
+        stream_path: Optional[str],
+        call: CallRecord,
+        validate: Optional[Callable[[str], bool]] = None,
+    ) -> Union[str, StructuredOutput]:
+
+        cache_key = None
+        if self.cache is not None:
+            cache_key = key
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                result, ok = self._parse_answer(cached, result_type, validate)
+                if ok:
+                    logging.debug("Cache hit for %s", cache_key[:12])
+                    call.cached = True
+                    return result
+
+        request = {
+            "model": model_id,
+            "messages": [
+                {"role": "system", "content": system_message},
+                {"role": "user",   "content": user_prompt},
+            ],
+            # A top-level argument since openai 1.98, and a plain body field for the Batch API
+            "prompt_cache_key": prompt_cache_key(call.stage, system_message, user_prompt),
+        }
+        if result_type is not None:
+            request["response_format"] = result_type.response_format()
+        prompt_tokens = estimate_tokens(system_message, model_id) + estimate_tokens(user_prompt, model_id)
+        max_retries = 3
+        for attempt in range(max_retries):
+            try:
+                await self.budget.reserve(call, prompt_tokens, int(self.rate_limiter.completion_estimate))
+            except BudgetExceeded:
+                call.skipped_budget = attempt == 0
+                raise
+            error: Optional[Exception] = None
+            usage = None
+            call.retries = attempt
+            queued = time.monotonic()
+            if self.batch is not None:
+                # Batch jobs have their own quota and pacing; just wait for the answer
                 try:
-                    body_html, *_ = await generator._single_call(
-                        SYSTEM_MESSAGE, prompt, model_override=model_to_use, expect_json=False
-                    )
-                    # Check if content is valid
-                    if "Error:" not in body_html and len(body_html.strip()) > 200:
-                        break
-                    elif retry < max_retries - 1:
-                        logging.warning("Use case content invalid for %s, retrying (%d/%d)", fname, retry + 1, max_retries)
-                        await asyncio.sleep(1)
+                    completion = await self.batch.submit(request)
+                    answer, usage = completion["choices"][0]["message"]["content"], completion.get("usage")
                 except Exception as e:
-                    if retry < max_retries - 1:
-                        logging.warning("Use case generation failed for %s, retrying: %s", fname, e)
-                        await asyncio.sleep(2)
-                    else:
-                        body_html = f"<h1>{name_u}</h1><p>Content generation failed after {max_retries} attempts. Please regenerate this page.</p>"
-            
-            nav_back = f'<p><a href="{landing_fname}">&larr; Back to converter landing</a></p>'
-            extra_links = "<h2>More Use Cases</h2><ul>" + "".join(
-                f'<li><a href="{f}">{n}</a></li>' for f, n, _ in use_links if f != fname
-            ) + "</ul>"
-            await _write_page(
-                os.path.join(demo_dir, fname),
-                name_u,
-                body_html,
-                nav_back + extra_links,
-                desc_u,
-                model_id=model_to_use,
+                    error = e
+                call.latency += time.monotonic() - queued
+            else:
+                # RPM/TPM quota first, so a call waiting on quota does not hold a concurrency slot
+                reserved = await self.rate_limiter.acquire(prompt_tokens)
+                async with self.limiter:
+                    started = time.monotonic()
+                    call.queue_wait += started - queued
+                    try:
+                        if stream_path is not None:
+                            answer, usage = await self._stream_html(request, stream_path)
+                        else:
+                            response = await self.client.chat.completions.create(**request, timeout=60.0)
+                            answer, usage = response.choices[0].message.content, response.usage
+                        self.limiter.on_success(time.monotonic() - started)
+                        self.rate_limiter.reconcile(reserved, usage)
+                    except Exception as e:
+                        error = e
+                        self.rate_limiter.reconcile(reserved)
+                        if _is_overload(e):
+                            self.limiter.on_overload()
+                    call.latency += time.monotonic() - started
+            prompt_used, completion_used = _usage_tokens(usage)
+            call.prompt_tokens += prompt_used
+            call.cached_prompt_tokens += _cached_tokens(usage)
+            call.completion_tokens += completion_used
+            if error is None:
+                result, ok = self._parse_answer(answer, result_type, validate)
+                # HTML is judged by the caller; a structured answer must match its schema
+                if ok or result_type is None:
+                    break
+                error = InvalidAnswer(f"{result_type.__name__} answer does not match its schema")
+            if attempt == max_retries - 1:
+                logging.error("API call failed after %d attempts: %s", max_retries, error)
+                raise error
+            self.budget.settle(call, final=False)
+            # The slot is already released: honour Retry-After, else exponential backoff
+            # (an unusable answer says nothing about the service, so retry at once)
+            delay = 0 if isinstance(error, InvalidAnswer) else _retry_after(error) or 2 ** attempt
+            logging.warning("API call attempt %d failed: %s. Retrying in %.1fs...", attempt + 1, error, delay)
+            with TRACER.span("backoff", "model", row=call.row, attempt=attempt + 1, error=str(error)[:200]):
+                await asyncio.sleep(delay)
+
+        # Only answers that parsed cleanly are worth replaying on the next run
+        if ok and cache_key is not None:
+            self.cache.put(cache_key, answer)
+        return result
+
+    async def _stream_html(self, request: Dict[str, object], path: str) -> Tuple[str, object]:
+        """Stream an HTML answer into ``path``, giving up as soon as its prefix is broken."""
+        stream = await self.client.chat.completions.create(
+            **request, stream=True, stream_options={"include_usage": True}, timeout=60.0
+        )
+        parts: List[str] = []
+        usage = None
+        checked = False
+        # The .part file is written off the event loop, a few KiB at a time
+        flushed = pending = 0
+        try:
+            await asyncio.to_thread(_write_text, path, "", "w")
+            async for chunk in stream:
+                if chunk.usage is not None:
+                    usage = chunk.usage
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if not delta:
+                    continue
+                parts.append(delta)
+                pending += len(delta)
+                if pending >= STREAM_FLUSH_CHARS:
+                    await asyncio.to_thread(_write_text, path, "".join(parts[flushed:]))
+                    flushed, pending = len(parts), 0
+                if not checked:
+                    prefix = "".join(parts)
+                    problem = html_prefix_problem(prefix)
+                    if problem:
+                        raise StreamAborted(f"{problem} after {len(prefix)} chars")
+                    checked = len(prefix) >= HTML_PREFIX_WINDOW
+            await asyncio.to_thread(_write_text, path, "".join(parts[flushed:]))
+            answer = "".join(parts)
+            problem = None if checked else html_prefix_problem(answer, final=True)
+            if problem:
+                raise StreamAborted(problem)
+        except BaseException as e:
+            # A failed stream leaves no partial page behind
+            if isinstance(e, StreamAborted):
+                self.aborted_streams += 1
+            if os.path.exists(path):
+                os.remove(path)
+            raise
+        finally:
+            await stream.close()
+        return answer, usage
+
+    @staticmethod
+    def _parse_answer(
+        answer: str,
+        result_type: Optional[Type[StructuredOutput]],
+        validate: Optional[Callable[[str], bool]] = None,
+    ) -> Tuple[Union[str, StructuredOutput, None], bool]:
+        """Turn a raw answer into ``result_type`` (or cleaned HTML) plus a parse-OK flag."""
+
+        logging.debug("Raw answer length: %d", len(answer))
+
+        if result_type is not None:
+            try:
+                return result_type.from_answer(answer), True
+            except (InvalidAnswer, TypeError) as e:
+                logging.warning("Could not parse %s answer: %s", result_type.__name__, e)
+                return None, False
+
+        # Apply HTML cleaning first (fences, JSON-wrapped content)
+        cleaned_html = _ensure_html(answer)
+
+        # More flexible validation for HTML content
+        if len(cleaned_html.strip()) < 50:
+            logging.warning("Content too short: %d chars", len(cleaned_html))
+            return f"<p>Error: Generated content too short ({len(cleaned_html)} chars). Retrying...</p>", False
+
+        # If it doesn't start with HTML tag, wrap it
+        if not cleaned_html.strip().startswith('<'):
+            logging.debug("Content doesn't start with HTML tag, wrapping...")
+            cleaned_html = f"<div>{cleaned_html}</div>"
+
+        return cleaned_html, validate is None or validate(cleaned_html)
+
+###############################################################################
+# HTML helpers                                                                #
+###############################################################################
+
+_html_re = re.compile(r'"content"\\s*:\\s*"(.*?)"', re.DOTALL)
+
+def _ensure_html(raw: str) -> str:
+    """Return HTML string even if wrapped in JSON or markdown fences."""
+    txt = raw.strip()
+
+    # Remove leading Response dumps
+    if txt.startswith("Response("):
+        first_tag = txt.find("<")
+        if first_tag != -1:
+            txt = txt[first_tag:]
+
+    # If already HTML with headings, return as-is
+    if txt.startswith('<') and '<h' in txt:
+        return txt
+
+    # If starts with HTML tag (any), return as-is
+    if txt.startswith('<') and '>' in txt:
+        return txt
+
+    # Handle JSON wrapped content
+    if '"content":' in txt and '"' in txt:
+        try:
+            # Try to parse as JSON and extract content
+            parsed = json.loads(txt)
+            if isinstance(parsed, dict) and "content" in parsed:
+                content = parsed["content"]
+                # Unescape if needed
+                content = content.replace('\\n', '\n').replace('\\"', '"').replace('\\/', '/')
+                return content
+        except Exception as e:
+            logging.debug("JSON extraction in _ensure_html failed: %s", e)
+            # Try to extract content manually with regex
+            content_match = re.search(r'"content":\s*"([^"]*(?:\\.[^"]*)*)"', txt, re.DOTALL)
+            if content_match:
+                content = content_match.group(1)
+                # Unescape
+                content = content.replace('\\n', '\n').replace('\\"', '"').replace('\\/', '/')
+                return content
+
+    # Remove ``` fences
+    if txt.startswith('```'):
+        lines = txt.split('\n')
+        # Remove first line (```html, ```json, etc.)
+        if len(lines) > 1:
+            lines = lines[1:]
+        # Remove last ``` if present
+        if lines and lines[-1].strip() == '```':
+            lines = lines[:-1]
+        txt = '\n'.join(lines).strip()
+
+    # Try regex extraction for quoted content
+    m = _html_re.search(txt)
+    if m:
+        html_escaped = m.group(1)
+        try:
+            html_escaped = bytes(html_escaped, "utf-8").decode("unicode_escape")
+        except Exception:
+            pass
+        return html_escaped
+
+    # If it looks like broken JSON or template code, try to extract HTML
+    if '{' in txt and '}' in txt:
+        # Look for HTML content within the response
+        html_match = re.search(r'<h[1-6][^>]*>.*?</.*?>', txt, re.DOTALL)
+        if html_match:
+            # Find the start of HTML content
+            start = txt.find('<h')
+            if start != -1:
+                return txt[start:]
+
+    # Return cleaned text
+    return txt
+
+
+HTML_PREFIX_WINDOW = 1500  # characters, roughly the first 350 tokens of a page
+STREAM_FLUSH_CHARS = 4096  # streamed characters buffered between .part file writes
+
+
+def _write_text(path: str, text: str, mode: str = "a") -> None:
+    with open(path, mode, encoding="utf-8") as fh:
+        fh.write(text)
+
+
+class StreamAborted(InvalidAnswer):
+    """A streamed HTML answer was cancelled because its prefix was clearly broken."""
+
+
+def html_prefix_problem(prefix: str, final: bool = False) -> Optional[str]:
+    """Spot an obviously broken HTML page from the start of the answer.
+
+    Returns the reason the answer should be abandoned, or None while the
+    prefix still looks like a page (or is too short to tell). The page must
+    start with a tag (an ```html fence is fine), must not be JSON and must
+    have a heading within the first ``HTML_PREFIX_WINDOW`` characters.
+    """
+    txt = prefix.lstrip()
+    if txt.startswith("```"):
+        fence, newline, txt = txt.partition("\n")
+        if not newline:
+            return None
+        if fence.strip("`").strip().lower() == "json":
+            return "JSON-fenced answer"
+        txt = txt.lstrip()
+    if not txt:
+        return None
+    if txt[0] in "{[":
+        return "JSON instead of HTML"
+    if txt[0] != "<":
+        return "does not start with an HTML tag"
+    if (final or len(txt) >= HTML_PREFIX_WINDOW) and not re.search(r"<h[1-3][\s>]", txt, re.IGNORECASE):
+        return "no heading"
+    return None
+
+
+_comp_table_re = re.compile(r'(<table[^>]*class="comp-table"[^>]*>)(.*?)(</table>)', re.DOTALL | re.IGNORECASE)
+_comp_row_re = re.compile(r"<tr[^>]*>.*?</tr>", re.DOTALL | re.IGNORECASE)
+_comp_cell_re = re.compile(r"<t[hd][^>]*>.*?</t[hd]>", re.DOTALL | re.IGNORECASE)
+
+
+def flip_comparison(html: str, f1: str, f2: str) -> str:
+    """Turn a "F1 vs F2" comparison into "F2 vs F1" without another model call.
+
+    Swaps the two format columns of the ``comp-table`` and the order of the
+    formats in its heading; the usage guide reads the same either way.
+    """
+
+    def _swap_cells(row: re.Match) -> str:
+        cells = list(_comp_cell_re.finditer(row.group(0)))
+        if len(cells) < 3:
+            return row.group(0)
+        text, a, b = row.group(0), cells[1], cells[2]
+        return text[:a.start()] + b.group(0) + text[a.end():b.start()] + a.group(0) + text[b.end():]
+
+    def _swap_table(table: re.Match) -> str:
+        return table.group(1) + _comp_row_re.sub(_swap_cells, table.group(2)) + table.group(3)
+
+    html = _comp_table_re.sub(_swap_table, html, count=1)
+    heading = re.compile(rf"{re.escape(f1)}(\s+vs\.?\s+){re.escape(f2)}", re.IGNORECASE)
+    return heading.sub(lambda m: f"{f2.upper()}{m.group(1)}{f1.upper()}", html, count=1)
+
+###############################################################################
+# Site rendering                                                              #
+###############################################################################
+
+def _build_faq_accordion(faq_list: List[Dict[str, str]], prefix: str) -> str:
+    if not faq_list:
+        return ""
+
+    items_html = []
+    for i, item in enumerate(faq_list):
+        question = item.get("question", "")
+        answer = item.get("answer", "")
+        if not question or not answer:
+            continue
+
+        target_id = f"{prefix}-{i}"
+        item_html = (
+            f'<div class="accordion-item">'
+            f'  <h3 class="accordion-header" id="heading-{target_id}">'
+            f'    <button class="accordion-button" type="button" data-bs-toggle="collapse" data-bs-target="#{target_id}" aria-expanded="true" aria-controls="{target_id}">'
+            f'      {question}'
+            f'    </button>'
+            f'  </h3>'
+            f'  <div id="{target_id}" class="accordion-collapse collapse show" aria-labelledby="heading-{target_id}" >'
+            f'    <div class="accordion-body">{answer}</div>'
+            f'  </div>'
+            f'</div>'
+        )
+        items_html.append(item_html)
+
+    if not items_html:
+        return ""
+
+    return (
+        f'<div class="faq-block"><h2>Frequently Asked Questions</h2>'
+        f'<div class="accordion" id="faqAccordion-{prefix}">'
+        + ''.join(items_html) + '</div></div>'
+    )
+
+# Convenience: slugify helper
+def _slugify(txt: str) -> str:
+    base = unicodedata.normalize('NFKD', txt).encode('ascii', 'ignore').decode('ascii')
+    slug = re.sub(r'[^a-z0-9]+', '-', base.lower()).strip('-')
+    return slug[:60] or 'page'
+
+# Helper: apply proper sentence case
+def _sentence_case(txt: str) -> str:
+    """Apply sentence case: capitalize first letter and proper nouns/acronyms only."""
+    if not txt:
+        return txt
+
+    # First, preserve known acronyms
+    acronyms = ['SRT', 'VTT', 'HTML', 'CSS', 'API', 'JSON', 'XML', 'HTTP', 'HTTPS', 'URL', 'SEO', 'AI', 'ML', 'CI', 'CD', 'DVD', 'TV', 'HD', 'MP4', 'AVI', 'MOV', 'WEBM', 'FFMPEG', 'UTF', 'ASCII', 'WEBVTT', 'HAPPYSCRIBE']
+
+    # Split into words
+    words = txt.split()
+    result = []
+
+    for i, word in enumerate(words):
+        # Remove punctuation for comparison
+        clean_word = re.sub(r'[^\w]', '', word.upper())
+
+        if clean_word in acronyms:
+            # Preserve acronym case but keep original punctuation
+            punctuation = re.sub(r'[a-zA-Z]', '', word)
+            result.append(clean_word + punctuation)
+        elif i == 0:
+            # Always capitalize first word completely
+            result.append(word.capitalize())
+        else:
+            # Lowercase other words except proper nouns
+            if word.lower() in ['happyscribe', 'github', 'youtube', 'vimeo', 'premiere', 'pro', 'windows', 'mac', 'linux']:
+                result.append(word.capitalize())
+            else:
+                result.append(word.lower())
+
+    return ' '.join(result)
+
+
+SITE_URL = "https://monsiaz.github.io/demo_happyscribe_contents_gen/"
+
+
+def render_page(
+    page_slug: str,
+    title: str,
+    body_html: str,
+    extra_nav: str = "",
+    meta_desc: str = "",
+    model_id: str = "",
+) -> str:
+    """Return a complete HTML page with shared header/footer."""
+
+    canonical_url = (
+        f"{SITE_URL}{page_slug}"
+    )
+
+    skel = f"""
+<!DOCTYPE html>
+<html lang='en'>
+<head>
+  <meta charset='utf-8'>
+  <title>{title} - HappyScribe</title>
+  <meta name='description' content='{meta_desc or 'AI-generated page about subtitle conversion.'}'>
+  <meta name='viewport' content='width=device-width,initial-scale=1'>
+  <link rel='canonical' href='{canonical_url}'>
+  <link rel='stylesheet' href='https://cdn.jsdelivr.net/npm/bootstrap@5.3.3/dist/css/bootstrap.min.css'>
+  <link rel='stylesheet' href='settings/web_assets/style.css'>
+</head>
+<body>
+  <header class='topbar'>
+     <div class='container topbar-inner'>
+        <a class='brand' href='/'><img src='{SITE_URL}settings/web_assets/header.png' class='hero-img' alt='Header'></a>
+     </div>
+  </header>
+
+  <main class='container'>
+     <nav id='toc' class='toc'></nav>
+     {body_html}
+     {extra_nav}
+  </main>
+
+  <footer>
+     <div class='container small text-muted'>© HappyScribe · Generated by <strong>{model_id}</strong></div>
+  </footer>
+
+  <script src='https://cdn.jsdelivr.net/npm/bootstrap@5.3.3/dist/js/bootstrap.bundle.min.js'></script>
+  <script>
+  document.addEventListener('DOMContentLoaded', () => {{
+     const toc = document.getElementById('toc');
+     if (!toc) return;
+     const h2s = Array.from(document.querySelectorAll('main.container h2'));
+     if (!h2s.length) {{ toc.remove(); return; }}
+     const ul = document.createElement('ul');
+     h2s.forEach(h => {{
+        const id = h.textContent.trim().toLowerCase().replace(/[^a-z0-9]+/g,'-');
+        h.id = id;
+        const li = document.createElement('li');
+        li.innerHTML = "<a href='#"+id+"'>"+h.textContent+"</a>";
+        ul.appendChild(li);
+     }});
+     toc.innerHTML = '<h2>Table of contents</h2>';
+     toc.appendChild(ul);
+  }});
+  </script>
+</body>
+</html>"""
+
+    return skel.strip()
+
+PAGE_FAILED_HTML = "<h1>{title}</h1><p>Content generation failed. Please regenerate this page.</p>"
+MIN_PAGE_BODY_CHARS = 200
+
+
+def page_body_ok(body_html: str) -> bool:
+    """Whether a generated page body is usable; only such bodies are cached."""
+    return "Error:" not in body_html and len(body_html.strip()) > MIN_PAGE_BODY_CHARS
+
+
+
+def _links_block(heading: str, links: List[Tuple[str, str, str]], skip: str = "", css_class: str = "") -> str:
+    class_attr = f" class='{css_class}'" if css_class else ""
+    return f"<h2>{heading}</h2><ul{class_attr}>" + "".join(
+        f'<li><a href="{f}">{t}</a></li>' for f, t, _ in links if f != skip
+    ) + "</ul>"
+
+
+def render_row(slug: str, entries: Dict[str, Dict[str, object]]) -> List[Tuple[str, str]]:
+    """Render every page of one row from its journal entries.
+
+    Returns ``(file name, html)`` pairs, landing page last. Rows whose
+    landing page was never assembled yield nothing; pages missing from the
+    journal (failed generations) get a placeholder so no link 404s.
+    """
+    landing_fname = f"{slug}.html"
+    if landing_fname not in entries or "landing" not in entries or "comparison" not in entries:
+        return []
+    site = entries[landing_fname]["payload"]
+    landing = entries["landing"]["payload"]
+    model_id = site.get("model_id", BASE_MODEL)
+    blog_links = [tuple(link) for link in site["blog_links"]]
+    use_links = [tuple(link) for link in site["use_links"]]
+    tech_blog_links = [tuple(link) for link in site["tech_blog_links"]]
+    tech_use_links = [tuple(link) for link in site["tech_use_links"]]
+
+    def _body(fname: str, title: str) -> str:
+        entry = entries.get(fname)
+        if entry is None:
+            return PAGE_FAILED_HTML.format(title=title)
+        return entry["payload"]["body_html"]
+
+    pages: List[Tuple[str, str]] = []
+    nav_back = f'<p><a href="{landing_fname}">&larr; Back to converter landing</a></p>'
+    for fname, title, meta in blog_links:
+        extra_links = _links_block("More Articles", blog_links, skip=fname)
+        pages.append((fname, render_page(fname, title, _body(fname, title), nav_back + extra_links, meta, model_id)))
+    for fname, name, desc in use_links:
+        extra_links = _links_block("More Use Cases", use_links, skip=fname)
+        pages.append((fname, render_page(fname, name, _body(fname, name), nav_back + extra_links, desc, model_id)))
+    for fname, title, _ in tech_blog_links + tech_use_links:
+        pages.append((fname, render_page(fname, title, _body(fname, title), model_id=model_id)))
+
+    # ---------------- Landing page ----------------
+    all_blog_links = blog_links + tech_blog_links
+    all_use_links = use_links + tech_use_links
+    content_html = _ensure_html(landing["content"])
+    comp_html = _ensure_html(entries["comparison"]["payload"]["html"])
+    faq_html = _build_faq_accordion(landing["faq"], slug)
+
+    nav_html = ""
+    block_parts = []
+    if all_blog_links:
+        block_parts.append(_links_block("Related Articles", all_blog_links, css_class="related-list"))
+    if all_use_links:
+        block_parts.append(_links_block("Professional Use Cases", all_use_links, css_class="related-list"))
+    if block_parts:
+        nav_html = "<hr class='section-divider'><div class='block-section'>" + "<hr class='section-divider'>".join(block_parts) + "</div>"
+
+    pages.append((
+        landing_fname,
+        render_page(landing_fname, site["title"], content_html + comp_html + faq_html + nav_html, model_id=model_id),
+    ))
+    return pages
+
+
+SITE_MANIFEST = ".manifest.json"
+MANIFEST_FLUSH_SECONDS = 5.0  # how often a long run saves the page manifest
+
+try:
+    import brotli  # type: ignore
+except ImportError:  # optional: --precompress then only writes .gz siblings
+    brotli = None
+
+# Elements whose content is whitespace-sensitive (code samples, inline scripts)
+_PRESERVE_RE = re.compile(r"<(pre|code|script|style|textarea)\b[^>]*>.*?</\1\s*>", re.S | re.I)
+_COMMENT_RE = re.compile(r"<!--(?!\[if).*?-->", re.S)
+# HTML whitespace only: \s would also eat (and so change the rendering of) NBSPs
+_WS = r"[ \t\n\r\f]"
+# Whitespace around block-level tags never renders
+_BLOCK_TAG_WS_RE = re.compile(
+    _WS + r"*(</?(?:html|head|body|meta|link|title|div|main|header|footer|nav|section|article|aside|"
+    r"p|ul|ol|li|h[1-6]|table|thead|tbody|tr|th|td|hr|br|details|summary)\b[^>]*>)" + _WS + "*",
+    re.I,
+)
+
+
+def minify_html(html: str) -> str:
+    """Drop comments and collapse whitespace, leaving <pre>/<code>/<script>/<style> untouched."""
+    kept: List[str] = []
+
+    def _keep(match: "re.Match[str]") -> str:
+        kept.append(match.group(0))
+        return f"\x00{len(kept) - 1}\x00"
+
+    out = _PRESERVE_RE.sub(_keep, html)
+    out = _COMMENT_RE.sub("", out)
+    out = re.sub(_WS + "+", " ", out)
+    out = _BLOCK_TAG_WS_RE.sub(r"\1", out)
+    return re.sub(r"\x00(\d+)\x00", lambda m: kept[int(m.group(1))], out).strip(" \t\n\r\f")
+
+
+def precompressed(data: bytes) -> List[Tuple[str, bytes]]:
+    """(suffix, bytes) variants a static host can serve with Content-Encoding."""
+    variants = [(".gz", gzip.compress(data, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        variants.append((".br", brotli.compress(data, quality=11, mode=brotli.MODE_TEXT)))
+    return variants
+
+
+def page_slug(fname: str) -> str:
+    """Row slug a site file belongs to (slugs never contain underscores or dots)."""
+    return re.split(r"[_.]", fname, 1)[0]
+
+
+def _atomic_write(path: str, data: bytes) -> None:
+    """Write ``data`` to a temp file next to ``path`` and rename it into place."""
+    tmp = os.path.join(os.path.dirname(path), f".{os.path.basename(path)}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with open(tmp, "wb") as fp:
+            fp.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def write_page(
+    demo_dir: str,
+    fname: str,
+    html: str,
+    known: Dict[str, str],
+    minify: bool = False,
+    compress: bool = False,
+) -> List[Tuple[str, str, bool]]:
+    """Write one page (and its .gz/.br siblings) unless unchanged.
+
+    ``known`` maps file names to the content hashes already on disk. Returns
+    ``(file name, hash, written)`` for the page and every sibling.
+    """
+    # Only pages are minified; sitemaps and search shards are written verbatim
+    data = (minify_html(html) if minify and fname.endswith(".html") else html).encode("utf-8")
+    digest = hashlib.sha256(data).hexdigest()
+    path = os.path.join(demo_dir, fname)
+    written = digest != known.get(fname) or not os.path.exists(path)
+    if written:
+        _atomic_write(path, data)
+    results = [(fname, digest, written)]
+    if compress:
+        suffixes = [".gz"] + ([".br"] if brotli is not None else [])
+        if written or any(fname + s not in known or not os.path.exists(path + s) for s in suffixes):
+            for suffix, blob in precompressed(data):
+                _atomic_write(path + suffix, blob)
+                results.append((fname + suffix, hashlib.sha256(blob).hexdigest(), True))
+        else:
+            results += [(fname + s, known[fname + s], False) for s in suffixes]
+    # The body streamed while the page was generated (--stream) is now superseded
+    if os.path.exists(path + ".part"):
+        os.remove(path + ".part")
+    return results
+
+
+class SiteWriter:
+    """Writes site pages off the event loop, atomically, skipping unchanged ones.
+
+    Content hashes of the files it wrote are kept in ``<demo_dir>/.manifest.json``;
+    a page whose hash matches is left alone, so its mtime only moves when its
+    bytes do. ``prune`` deletes manifest pages that were not produced this run
+    (a full render) and ``discard`` single pages a row dropped. ``counts`` tallies
+    written / unchanged / deleted files. With ``minify`` / ``compress`` the
+    CPU-bound post-processing runs in a process pool instead of threads.
+    The manifest is saved by ``checkpoint`` while pages are being written
+    and by ``close``, so a killed run only loses the last few seconds.
+    """
+
+    def __init__(self, demo_dir: str, workers: int = 8, minify: bool = False, compress: bool = False):
+        self.demo_dir = demo_dir
+        self.minify = minify
+        self.compress = compress
+        os.makedirs(demo_dir, exist_ok=True)
+        self.manifest_path = os.path.join(demo_dir, SITE_MANIFEST)
+        self.manifest: Dict[str, str] = {}
+        if os.path.isfile(self.manifest_path):
+            with open(self.manifest_path, "r", encoding="utf-8") as fp:
+                self.manifest = json.load(fp)
+        self.counts: Dict[str, int] = collections.Counter(written=0, unchanged=0, deleted=0)
+        self._seen: Set[str] = set()
+        self._lock = threading.Lock()
+        self._saved = time.monotonic()
+        if minify or compress:
+            self._pool = ProcessPoolExecutor(max_workers=min(workers, os.cpu_count() or 1))
+        else:
+            self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="site-writer")
+
+    def _known(self, fname: str) -> Dict[str, str]:
+        with self._lock:
+            return {name: self.manifest[name] for name in (fname, fname + ".gz", fname + ".br") if name in self.manifest}
+
+    def record(self, results: List[Tuple[str, str, bool]]) -> bool:
+        """Account for files written by ``write_page`` (possibly in another process)."""
+        with self._lock:
+            for fname, digest, written in results:
+                self.manifest[fname] = digest
+                self._seen.add(fname)
+                self.counts["written" if written else "unchanged"] += 1
+        return any(written for _, _, written in results)
+
+    def put(self, fname: str, html: str) -> bool:
+        """Write one page now; returns whether any file changed."""
+        return self.record(write_page(self.demo_dir, fname, html, self._known(fname), self.minify, self.compress))
+
+    async def write(self, fname: str, html: str) -> bool:
+        with TRACER.span(fname, "write", row=page_slug(fname)) as info:
+            results = await asyncio.get_running_loop().run_in_executor(
+                self._pool, write_page, self.demo_dir, fname, html, self._known(fname), self.minify, self.compress
+            )
+            info["written"] = self.record(results)
+        return info["written"]
+
+    def prune(self) -> int:
+        """Delete pages from earlier runs that this run did not produce."""
+        stale = [fname for fname in self.manifest if fname not in self._seen]
+        for fname in stale:
+            path = os.path.join(self.demo_dir, fname)
+            if os.path.exists(path):
+                os.remove(path)
+            del self.manifest[fname]
+        self.counts["deleted"] += len(stale)
+        return len(stale)
+
+    def keep(self, fnames: List[str]) -> None:
+        """Mark files (and their siblings) as produced this run without rewriting them."""
+        with self._lock:
+            self._seen.update(
+                name for fname in fnames for name in (fname, fname + ".gz", fname + ".br") if name in self.manifest
             )
 
-        tasks: List[asyncio.Task] = []
-        tasks += [
-            asyncio.create_task(_gen_blog(f, t, m, idx))
-            for idx, (f, t, m) in enumerate(blog_links, 1)
-        ]
-        tasks += [
-            asyncio.create_task(_gen_use(f, n, d, idx))
-            for idx, (f, n, d) in enumerate(use_links, 1)
+    def discard(self, fname: str) -> None:
+        """Delete a file this run no longer produces, with its .gz/.br siblings."""
+        for name in (fname, fname + ".gz", fname + ".br"):
+            if name in self.manifest:
+                path = os.path.join(self.demo_dir, name)
+                if os.path.exists(path):
+                    os.remove(path)
+                del self.manifest[name]
+                self.counts["deleted"] += 1
+
+    def _save_manifest(self) -> None:
+        with self._lock:
+            data = json.dumps(self.manifest, indent=0, sort_keys=True).encode("utf-8")
+        _atomic_write(self.manifest_path, data)
+        self._saved = time.monotonic()
+
+    def checkpoint(self) -> None:
+        """Save the manifest if the last save is more than MANIFEST_FLUSH_SECONDS old."""
+        if time.monotonic() - self._saved >= MANIFEST_FLUSH_SECONDS:
+            self._save_manifest()
+
+    def close(self) -> None:
+        self._pool.shutdown()
+        self._save_manifest()
+
+    def summary(self) -> str:
+        return "{written} written, {unchanged} unchanged, {deleted} deleted".format(**self.counts)
+
+
+SITE_INDEX_STATE = ".site-index.json"
+SITEMAP_NS = "http://www.sitemaps.org/schemas/sitemap/0.9"
+
+
+def row_page_titles(slug: str, entries: Dict[str, Dict[str, object]]) -> List[Tuple[str, str]]:
+    """(file name, title) of every page of a row, landing page first."""
+    site = entries.get(f"{slug}.html", {}).get("payload")
+    if not site:
+        return []
+    links = site["blog_links"] + site["use_links"] + site["tech_blog_links"] + site["tech_use_links"]
+    return [(f"{slug}.html", site["title"])] + [(link[0], link[1]) for link in links]
+
+
+def _index_page(title: str, body: str) -> str:
+    return (
+        '<!DOCTYPE html><html><head><meta charset="utf-8">'
+        '<meta name="viewport" content="width=device-width,initial-scale=1">'
+        f'<title>{xml_escape(title)}</title>'
+        '<link href="https://cdn.jsdelivr.net/npm/bootstrap@5.3.3/dist/css/bootstrap.min.css" rel="stylesheet">'
+        '<link rel="stylesheet" href="settings/web_assets/style.css">'
+        '</head><body><div class="container">'
+        f'<h1>{xml_escape(title)}</h1>{body}</div></body></html>'
+    )
+
+
+class SiteIndex:
+    """Index and sitemap pages built from per-row page titles, not a directory scan.
+
+    ``<demo_dir>/.site-index.json`` keeps each row's pages as ``[file, title,
+    hash, lastmod]``; ``lastmod`` is the UTC date the page's content hash last
+    changed. Rows are sharded into one section per source format:
+    ``index-<format>.html`` lists its pairs with every page title and
+    ``sitemap-<format>.xml`` its URLs, while ``index.html`` and the
+    ``sitemap.xml`` sitemap index link the sections. Only sections whose rows
+    changed are rebuilt; the others are kept as they are. Pages on disk that
+    the SiteWriter never wrote (e.g. committed baseline pages with no journal)
+    are imported from their files on the first run over a tree and on every
+    ``render``, and stay in the state marked ``"unmanaged": true``.
+    """
+
+    def __init__(self, demo_dir: str):
+        self.demo_dir = demo_dir
+        self.path = os.path.join(demo_dir, SITE_INDEX_STATE)
+        self.rows: Dict[str, Dict[str, object]] = {}
+        self.imported = False
+        self.options: Optional[List[bool]] = None
+        self._dirty: Set[str] = set()
+        if os.path.isfile(self.path):
+            with open(self.path, "r", encoding="utf-8") as fp:
+                state = json.load(fp)
+            self.rows = state["rows"]
+            self.imported = state.get("imported", False)
+            self.options = state.get("options")
+
+    @staticmethod
+    def _section(slug: str) -> str:
+        return slug.partition("-to-")[0]
+
+    def _set_row(self, slug: str, row: Dict[str, object]) -> None:
+        if self.rows.get(slug) != row:
+            self.rows[slug] = row
+            self._dirty.add(self._section(slug))
+
+    def _drop_row(self, slug: str) -> None:
+        del self.rows[slug]
+        self._dirty.add(self._section(slug))
+
+    def update_row(self, slug: str, titles: List[Tuple[str, str]], manifest: Dict[str, str]) -> None:
+        if not titles:
+            return
+        today = time.strftime("%Y-%m-%d", time.gmtime())
+        previous = {page[0]: page for page in self.rows.get(slug, {}).get("pages", [])}
+        pages = []
+        for fname, title in titles:
+            digest = manifest.get(fname, "")
+            old = previous.get(fname)
+            pages.append([fname, title, digest, old[3] if old and old[2] == digest else today])
+        f1, _, f2 = slug.partition("-to-")
+        self._set_row(slug, {"pair": f"{f1.upper()} → {f2.upper()}", "pages": pages})
+
+    def retain(self, slugs: Set[str]) -> None:
+        """Forget rows that are no longer part of the site (imported rows stay while their files do)."""
+        for slug in [slug for slug, row in self.rows.items() if slug not in slugs and not row.get("unmanaged")]:
+            self._drop_row(slug)
+
+    def _add_unmanaged(self, manifest: Dict[str, str]) -> None:
+        """Import rows whose pages exist on disk but not in the manifest; forget imported rows whose landing is gone."""
+        on_disk = {name for name in os.listdir(self.demo_dir) if name.endswith(".html")}
+        for slug in [slug for slug, row in self.rows.items() if row.get("unmanaged") and f"{slug}.html" not in on_disk]:
+            self._drop_row(slug)
+        landings = [
+            name for name in on_disk
+            if "-to-" in name and name == f"{page_slug(name)}.html" and name not in manifest and page_slug(name) not in self.rows
         ]
-        await asyncio.gather(*tasks)
+        natural = lambda name: [int(t) if t.isdigit() else t for t in re.split(r"(\d+)", name)]
+        for landing in landings:
+            slug = page_slug(landing)
+            children = sorted((name for name in on_disk if page_slug(name) == slug and name != landing), key=natural)
+            pages = []
+            for fname in [landing] + children:
+                path = os.path.join(self.demo_dir, fname)
+                with open(path, "rb") as fp:
+                    data = fp.read()
+                match = _TITLE_RE.search(data.decode("utf-8", "replace"))
+                title = html_unescape(match.group(1)).strip() if match else fname
+                title = title[: -len(" - HappyScribe")] if title.endswith(" - HappyScribe") else title
+                lastmod = time.strftime("%Y-%m-%d", time.gmtime(os.path.getmtime(path)))
+                pages.append([fname, title, hashlib.sha256(data).hexdigest(), lastmod])
+            f1, _, f2 = slug.partition("-to-")
+            self._set_row(slug, {"pair": f"{f1.upper()} → {f2.upper()}", "pages": pages, "unmanaged": True})
+        self.imported = True
+
+    def write(self, writer: SiteWriter, search: bool = False, scan: bool = False) -> None:
+        """Write the index and sitemaps; ``scan`` imports unmanaged pages from disk again."""
+        if scan or not self.imported:
+            self._add_unmanaged(writer.manifest)
+        # Rows whose landing the SiteWriter no longer has (e.g. pruned by render)
+        for slug in [
+            slug for slug, row in self.rows.items() if not row.get("unmanaged") and row["pages"][0][0] not in writer.manifest
+        ]:
+            self._drop_row(slug)
+        sections: Dict[str, List[str]] = collections.defaultdict(list)
+        for slug in sorted(self.rows):
+            sections[self._section(slug)].append(slug)
+        # Minify/compress settings change every section's files
+        options = [writer.minify, writer.compress]
+        if options != self.options:
+            self._dirty.update(sections)
+            self.options = options
+
+        overview, sitemaps = [], []
+        for section, slugs in sorted(sections.items()):
+            index_name, sitemap_name = f"index-{section}.html", f"sitemap-{section}.xml"
+            urls = [(page[0], page[3]) for slug in slugs for page in self.rows[slug]["pages"]]
+            if section in self._dirty or index_name not in writer.manifest or sitemap_name not in writer.manifest:
+                blocks = []
+                for slug in slugs:
+                    landing, *children = self.rows[slug]["pages"]
+                    items = "".join(f'<li><a href="{fname}">{xml_escape(title)}</a></li>' for fname, title, _, _ in children)
+                    blocks.append(
+                        f'<section id="{slug}"><h2><a href="{landing[0]}">{xml_escape(self.rows[slug]["pair"])}</a></h2>'
+                        f'<p>{xml_escape(landing[1])}</p><ul>{items}</ul></section>'
+                    )
+                writer.put(index_name, _index_page(f"{section.upper()} conversions", '<p><a href="index.html">&larr; All formats</a></p>' + "".join(blocks)))
+                writer.put(sitemap_name, (
+                    f'<?xml version="1.0" encoding="UTF-8"?>\n<urlset xmlns="{SITEMAP_NS}">'
+                    + "".join(f"<url><loc>{xml_escape(SITE_URL + fname)}</loc><lastmod>{lastmod}</lastmod></url>" for fname, lastmod in urls)
+                    + "</urlset>\n"
+                ))
+            else:
+                writer.keep([index_name, sitemap_name])
+            overview.append(
+                f'<li><a href="{index_name}">{section.upper()}</a>: '
+                + ", ".join(f'<a href="{index_name}#{slug}">{xml_escape(self.rows[slug]["pair"])}</a>' for slug in slugs)
+                + "</li>"
+            )
+            sitemaps.append((sitemap_name, max(lastmod for _, lastmod in urls)))
+
+        search_box = SEARCH_WIDGET if search else ""
+        writer.put("index.html", _index_page("Available pages", search_box + "<ul>" + "".join(overview) + "</ul>"))
+        writer.put("sitemap.xml", (
+            f'<?xml version="1.0" encoding="UTF-8"?>\n<sitemapindex xmlns="{SITEMAP_NS}">'
+            + "".join(f"<sitemap><loc>{xml_escape(SITE_URL + name)}</loc><lastmod>{lastmod}</lastmod></sitemap>" for name, lastmod in sitemaps)
+            + "</sitemapindex>\n"
+        ))
+        self._dirty.clear()
+        state = {"rows": self.rows, "imported": self.imported, "options": self.options}
+        _atomic_write(self.path, json.dumps(state, ensure_ascii=False).encode("utf-8"))
+
+
+SEARCH_STATE = ".search-index.json"
+SEARCH_DIR = "search"
+SEARCH_PREFIX = 2  # shard postings by the first characters of the term
+SEARCH_DOC_CHUNK = 256  # documents per search/docs-<n>.json file
+SEARCH_FLUSH_POSTINGS = 500_000  # pending postings that trigger a write of the shards they touch
+SEARCH_FIELD_WEIGHTS = {"title": 5, "heading": 3, "body": 1}
+SEARCH_STOPWORDS = frozenset(
+    "an and are as at be by can for from has have how in into is it its of on or our than that the their "
+    "this to was what when which will with you your".split()
+)
+
+_TERM_RE = re.compile(r"[^\W_]+")
+_TAG_RE = re.compile(r"<[^>]+>")
+_MARKS_RE = re.compile(r"[\u0300-\u036f]")  # combining accents left by NFKD
+_TITLE_RE = re.compile(r"<title>(.*?)</title>", re.S | re.I)
+_MAIN_RE = re.compile(r"<main\b[^>]*>(.*?)</main>", re.S | re.I)
+_HEADING_RE = re.compile(r"<h([1-6])\b[^>]*>(.*?)</h\1\s*>", re.S | re.I)
+# Chrome that is not the page's own content: scripts, the TOC, "back" links and
+# the link lists _links_block adds (they would match every sibling page)
+_SEARCH_SKIP_RE = re.compile(
+    r"<(script|style|nav)\b[^>]*>.*?</\1\s*>"
+    r"|<p><a href=\"[^\"]*\">&larr;[^<]*</a></p>"
+    r"|<h2>[^<]*</h2><ul[^>]*>(?:<li><a href=\"[^\"]*\">[^<]*</a></li>)*</ul>",
+    re.S | re.I,
+)
+
+SEARCH_WIDGET = Template(r"""<form class="my-3" role="search" onsubmit="return false">
+<input id="site-search" class="form-control" type="search" placeholder="Search all pages" autocomplete="off">
+</form><ol id="search-results" class="list-unstyled"></ol>
+<script>
+(() => {
+  const STOP = new Set($stopwords), PREFIX = $prefix, CHUNK = $chunk, files = {};
+  const load = (name) => files[name] || (files[name] = fetch('search/' + encodeURIComponent(name) + '.json')
+    .then(r => r.ok ? r.json() : {}).catch(() => ({})));
+  const terms = (q) => (q.toLowerCase().normalize('NFKD').replace(/[\u0300-\u036f]/g, '')
+    .match(/[\p{L}\p{N}]+/gu) || []).filter(t => t.length > 1 && !STOP.has(t));
+  async function search(q) {
+    const words = terms(q);
+    let scores = null;
+    for (const [i, word] of words.entries()) {
+      const shard = await load(word.slice(0, PREFIX));
+      // The word being typed also matches as a prefix
+      const keys = i === words.length - 1 ? Object.keys(shard).filter(t => t.startsWith(word)) : [word];
+      const hits = new Map();
+      for (const key of keys) {
+        const p = shard[key] || [];
+        for (let j = 0; j < p.length; j += 2) hits.set(p[j], Math.max(hits.get(p[j]) || 0, p[j + 1]));
+      }
+      scores = scores ? new Map([...scores].filter(([d]) => hits.has(d)).map(([d, s]) => [d, s + hits.get(d)])) : hits;
+    }
+    const top = [...(scores || [])].sort((a, b) => b[1] - a[1]).slice(0, 20);
+    return (await Promise.all(top.map(async ([d]) => (await load('docs-' + Math.floor(d / CHUNK)))[d % CHUNK]))).filter(Boolean);
+  }
+  const input = document.getElementById('site-search'), list = document.getElementById('search-results');
+  let seq = 0;
+  input.addEventListener('input', async () => {
+    const mine = ++seq, docs = await search(input.value);
+    if (mine !== seq) return;
+    list.replaceChildren(...docs.map(([href, title]) => {
+      const li = document.createElement('li'), a = document.createElement('a');
+      a.href = href; a.textContent = title; li.appendChild(a);
+      return li;
+    }));
+  });
+})();
+</script>""").substitute(
+    stopwords=json.dumps(sorted(SEARCH_STOPWORDS)), prefix=SEARCH_PREFIX, chunk=SEARCH_DOC_CHUNK
+)
+
+
+def search_terms(text: str) -> List[str]:
+    """Lower-cased, accent-folded words of ``text``; the search box normalises queries the same way."""
+    text = _MARKS_RE.sub("", unicodedata.normalize("NFKD", text.lower()))
+    return [t for t in _TERM_RE.findall(text) if 1 < len(t) <= 32 and t not in SEARCH_STOPWORDS]
+
+
+def page_terms(page: str) -> Dict[str, int]:
+    """Field-weighted term scores (capped at 255) of one rendered page.
+
+    The title, the headings and the rest of ``<main>`` are tokenized
+    separately and weighted by SEARCH_FIELD_WEIGHTS.
+    """
+    title = _TITLE_RE.search(page)
+    main = _MAIN_RE.search(page)
+    content = _SEARCH_SKIP_RE.sub(" ", main.group(1) if main else page)
+    fields_text = {
+        "title": title.group(1) if title else "",
+        "heading": " ".join(text for _, text in _HEADING_RE.findall(content)),
+        "body": _HEADING_RE.sub(" ", content),
+    }
+    scores: Dict[str, int] = collections.Counter()
+    for field, text in fields_text.items():
+        weight = SEARCH_FIELD_WEIGHTS[field]
+        for term in search_terms(html_unescape(_TAG_RE.sub(" ", text))):
+            scores[term] += weight
+    return {term: min(score, 255) for term, score in scores.items()}
+
+
+def index_pages(pages: List[Tuple[str, str]]) -> Dict[str, Dict[str, int]]:
+    return {fname: page_terms(html) for fname, html in pages}
+
+
+class SearchIndex:
+    """Client-side search index over the site pages, sharded by term prefix.
+
+    ``search/<prefix>.json`` maps every term starting with ``prefix`` to a
+    flat ``[doc, score, doc, score, ...]`` postings list sorted by doc id, and
+    ``search/docs-<n>.json`` maps doc ids to ``[file, title]``, so the search
+    box on ``index.html`` only fetches the shards of the words typed and the
+    doc chunks of the hits. ``<demo_dir>/.search-index.json`` keeps each
+    page's doc id, content hash, title and shard prefixes: only pages whose
+    hash changed are tokenized again, and only the shards their old and new
+    terms fall in are rewritten. Postings are merged into their shards
+    whenever ``SEARCH_FLUSH_POSTINGS`` are pending, so memory stays bounded
+    however many pages change.
+    """
+
+    def __init__(self, writer: SiteWriter):
+        self.writer = writer
+        self.demo_dir = writer.demo_dir
+        self.path = os.path.join(self.demo_dir, SEARCH_STATE)
+        manifest = writer.manifest
+        self.rows: Dict[str, Dict[str, list]] = {}
+        if os.path.isfile(self.path):
+            with open(self.path, "r", encoding="utf-8") as fp:
+                self.rows = json.load(fp)["rows"]
+        prefixes = {p for row in self.rows.values() for doc in row.values() for p in doc[3]}
+        # Without state, or with shards deleted behind our back (e.g. by a render
+        # without --search-index), the shards on disk cannot be trusted: start over
+        self._rebuild = not self.rows or any(self._shard(p) not in manifest for p in prefixes)
+        if self._rebuild and self.rows:
+            logging.info("Search shards are missing: rebuilding the search index")
+            self.rows = {}
+        used = {doc[0] for row in self.rows.values() for doc in row.values()}
+        self._next = max(used, default=-1) + 1
+        self._free = [i for i in range(self._next) if i not in used]
+        heapq.heapify(self._free)
+        self._terms: Dict[int, Dict[str, int]] = {}  # doc id -> terms not yet merged into the shards
+        self._pending = 0  # postings in _terms
+        self._dropped: Dict[int, Set[str]] = collections.defaultdict(set)  # doc id -> prefixes to clean
+        self._flushed: Set[str] = set()  # prefixes whose shard this run already wrote
+        self.counts = collections.Counter(indexed=0, removed=0)
+
+    @staticmethod
+    def _shard(prefix: str) -> str:
+        return f"{SEARCH_DIR}/{prefix}.json"
+
+    def _new_id(self) -> int:
+        if self._free:
+            return heapq.heappop(self._free)
+        self._next += 1
+        return self._next - 1
+
+    def _drop(self, doc: list) -> None:
+        self._dropped[doc[0]].update(doc[3])
+        self._pending -= len(self._terms.pop(doc[0], {}))
+        heapq.heappush(self._free, doc[0])
+
+    def stale(self, slug: str, titles: List[Tuple[str, str]], manifest: Dict[str, str]) -> List[str]:
+        """Pages of a row whose content changed since they were indexed."""
+        row = self.rows.get(slug, {})
+        return [fname for fname, _ in titles if fname in manifest and row.get(fname, [0, ""])[1] != manifest[fname]]
+
+    def update_row(
+        self, slug: str, titles: List[Tuple[str, str]], manifest: Dict[str, str], terms: Dict[str, Dict[str, int]]
+    ) -> None:
+        """Record a rendered row; ``terms`` holds the tokenized pages from ``stale``."""
+        if not titles:
+            return
+        row = self.rows.setdefault(slug, {})
+        current = dict(titles)
+        for fname in [f for f in row if f not in current]:
+            self._drop(row.pop(fname))
+        for fname, title in titles:
+            doc = row.get(fname)
+            if fname in terms:
+                if doc:
+                    self._dropped[doc[0]].update(doc[3])
+                doc_id = doc[0] if doc else self._new_id()
+                row[fname] = [doc_id, manifest.get(fname, ""), title, sorted({t[:SEARCH_PREFIX] for t in terms[fname]})]
+                self._pending += len(terms[fname]) - len(self._terms.get(doc_id, {}))
+                self._terms[doc_id] = terms[fname]
+            elif doc:
+                doc[2] = title
+        if self._pending >= SEARCH_FLUSH_POSTINGS:
+            self._flush()
+
+    def retain(self, slugs: Set[str]) -> None:
+        """Forget rows that are no longer part of the site."""
+        for slug in set(self.rows) - slugs:
+            for doc in self.rows.pop(slug).values():
+                self._drop(doc)
+
+    def sync(self, site_rows: Dict[str, Dict[str, object]]) -> None:
+        """Mirror the SiteIndex rows: tokenize pages from disk that are unindexed or changed, drop the rest.
+
+        Rows this run did not render (partial runs, baseline pages, a rebuild)
+        are indexed from their files, so the shards always cover the whole site.
+        """
+        for slug, row in site_rows.items():
+            indexed = self.rows.get(slug, {})
+            digests = {fname: digest for fname, _, digest, _ in row["pages"]}
+            stale = [fname for fname, digest in digests.items() if indexed.get(fname, [0, None])[1] != digest]
+            if not stale and indexed.keys() == digests.keys():
+                continue
+            terms = {}
+            for fname in stale:
+                path = os.path.join(self.demo_dir, fname)
+                if os.path.isfile(path):
+                    with open(path, "r", encoding="utf-8") as fp:
+                        terms[fname] = page_terms(fp.read())
+            titles = [(fname, title) for fname, title, _, _ in row["pages"] if fname in terms or fname in indexed]
+            self.update_row(slug, titles, digests, terms)
+        self.retain(set(site_rows))
+
+    def _flush(self) -> None:
+        """Merge the pending postings and removals into their shards, then forget them."""
+        writer = self.writer
+        os.makedirs(os.path.join(self.demo_dir, SEARCH_DIR), exist_ok=True)
+        dropped: Dict[str, Set[int]] = collections.defaultdict(set)
+        for doc_id, doc_prefixes in self._dropped.items():
+            for prefix in doc_prefixes:
+                dropped[prefix].add(doc_id)
+        added: Dict[str, List[Tuple[str, int, int]]] = collections.defaultdict(list)
+        for doc_id, terms in self._terms.items():
+            for term, score in terms.items():
+                added[term[:SEARCH_PREFIX]].append((term, doc_id, score))
+        affected = set(dropped) | set(added)
+        for prefix in sorted(affected):
+            name = self._shard(prefix)
+            path = os.path.join(self.demo_dir, name)
+            shard: Dict[str, List[int]] = {}
+            # A rebuild starts every shard from scratch, but keeps what its earlier flushes wrote
+            if (not self._rebuild or prefix in self._flushed) and name in writer.manifest and os.path.isfile(path):
+                with open(path, "r", encoding="utf-8") as fp:
+                    shard = json.load(fp)
+            postings: Dict[str, Dict[int, int]] = {
+                term: {doc: score for doc, score in zip(flat[::2], flat[1::2]) if doc not in dropped[prefix]}
+                for term, flat in shard.items()
+            }
+            for term, doc_id, score in added[prefix]:
+                postings.setdefault(term, {})[doc_id] = score
+            shard = {term: [x for doc in sorted(docs) for x in (doc, docs[doc])] for term, docs in postings.items() if docs}
+            if shard:
+                writer.put(name, json.dumps(shard, ensure_ascii=False, separators=(",", ":"), sort_keys=True))
+            elif name in writer.manifest:
+                writer.discard(name)
+        self._flushed |= affected
+        self.counts["indexed"] += len(self._terms)
+        self.counts["removed"] += len(set(self._dropped) - set(self._terms))
+        self._terms, self._pending, self._dropped = {}, 0, collections.defaultdict(set)
+        # The shards now hold every row recorded so far
+        _atomic_write(self.path, json.dumps({"rows": self.rows}, ensure_ascii=False).encode("utf-8"))
+
+    def write(self) -> Dict[str, int]:
+        self._flush()
+        writer = self.writer
+        table: List[Optional[List[str]]] = [None] * self._next
+        prefixes: Set[str] = set()
+        for row in self.rows.values():
+            for fname, (doc_id, _, title, doc_prefixes) in row.items():
+                table[doc_id] = [fname, title]
+                prefixes.update(doc_prefixes)
+        expected = {self._shard(p) for p in prefixes}
+        writer.keep(sorted(expected - {self._shard(p) for p in self._flushed}))
+        for start in range(0, len(table), SEARCH_DOC_CHUNK):
+            name = f"{SEARCH_DIR}/docs-{start // SEARCH_DOC_CHUNK}.json"
+            expected.add(name)
+            writer.put(name, json.dumps(table[start:start + SEARCH_DOC_CHUNK], ensure_ascii=False, separators=(",", ":")))
+        # Emptied shards and trailing doc chunks
+        for name in [n for n in writer.manifest if n.startswith(SEARCH_DIR + "/") and n.endswith(".json")]:
+            if name not in expected:
+                writer.discard(name)
+
+        counts = dict(self.counts, shards=len(self._flushed))
+        self.counts, self._flushed, self._rebuild = collections.Counter(indexed=0, removed=0), set(), False
+        return counts
+
+
+def _render_journal_row(
+    job: Tuple[str, str, str, Dict[str, str], bool, bool, Optional[Dict[str, str]]]
+) -> Tuple[int, List[Tuple[str, str, bool]], List[Tuple[str, str]], Dict[str, Dict[str, int]]]:
+    """Process-pool worker: render one journaled row into ``demo_dir``.
+
+    ``known`` holds the manifest hashes of the row's files and ``indexed`` the
+    hashes its pages had when last tokenized for search (None: no search
+    index). Returns the page count, ``(file name, hash, written)`` for every
+    file of the row, the page titles for the index and the terms of the
+    pages whose hash changed since they were indexed.
+    """
+    journal_dir, slug, demo_dir, known, minify, compress, indexed = job
+    entries = RunJournal(journal_dir).load(slug)
+    pages = render_row(slug, entries)
+    results, terms = [], {}
+    for fname, html in pages:
+        page_results = write_page(demo_dir, fname, html, known, minify, compress)
+        if indexed is not None and indexed.get(fname) != page_results[0][1]:
+            terms[fname] = page_terms(html)
+        results += page_results
+    return len(pages), results, row_page_titles(slug, entries) if pages else [], terms
+
+
+def render_site(
+    journal_dir: str,
+    demo_dir: str,
+    workers: Optional[int] = None,
+    minify: bool = False,
+    compress: bool = False,
+    search: bool = False,
+) -> int:
+    """Rebuild the static site from the run journal without any API calls."""
+    slugs = RunJournal(journal_dir).slugs()
+    writer = SiteWriter(demo_dir, minify=minify, compress=compress)
+    known: Dict[str, Dict[str, str]] = collections.defaultdict(dict)
+    for fname, digest in writer.manifest.items():
+        known[page_slug(fname)][fname] = digest
+    search_index = SearchIndex(writer) if search else None
+    jobs = [
+        (
+            journal_dir, slug, demo_dir, known[slug], minify, compress,
+            {fname: doc[1] for fname, doc in search_index.rows.get(slug, {}).items()} if search_index else None,
+        )
+        for slug in slugs
+    ]
+    index = SiteIndex(demo_dir)
+    rendered: Set[str] = set()
+    pages = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # Index each row as it arrives, so its terms can be flushed instead of piling up
+        for slug, (count, results, titles, terms) in zip(slugs, pool.map(_render_journal_row, jobs, chunksize=8)):
+            writer.record(results)
+            writer.checkpoint()
+            index.update_row(slug, titles, writer.manifest)
+            if search_index:
+                search_index.update_row(slug, titles, writer.manifest, terms)
+            if count:
+                rendered.add(slug)
+                pages += count
+    skipped = len(slugs) - len(rendered)
+    if skipped:
+        logging.warning("%d journaled rows have no landing page yet and were not rendered", skipped)
+    index.retain(rendered)
+    index.write(writer, search=bool(search_index), scan=True)
+    if search_index:
+        search_index.sync(index.rows)
+        logging.info("Search index: %(indexed)d pages indexed, %(removed)d removed, %(shards)d shards updated",
+                     search_index.write())
+    # The journal is the whole site: anything else in the manifest is stale
+    writer.prune()
+    writer.close()
+    logging.info("Site files: %s", writer.summary())
+    return pages
+
+###############################################################################
+# Publishing                                                                  #
+###############################################################################
+
+DEFAULT_DOCS_DIR = os.path.join(os.path.dirname(__file__), "docs")
+PUBLISH_MANIFEST = ".publish-manifest.json"
+# Paths in docs/ that are maintained by hand and never touched by publish
+PUBLISH_KEEP = ("settings/web_assets/", "CNAME")
+
+
+def _file_digest(path: str) -> str:
+    with open(path, "rb") as fp:
+        return hashlib.sha256(fp.read()).hexdigest()
+
+
+def _site_files(root: str) -> List[str]:
+    """Relative paths of publishable files under ``root`` (no dotfiles, no partial pages)."""
+    found = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [d for d in dirnames if not d.startswith(".")]
+        for name in filenames:
+            if name.startswith(".") or name.endswith((".part", ".tmp")):
+                continue
+            found.append(os.path.relpath(os.path.join(dirpath, name), root).replace(os.sep, "/"))
+    return sorted(found)
+
+
+def publish_site(demo_dir: str, docs_dir: str) -> Dict[str, int]:
+    """Sync ``demo_dir`` into ``docs_dir``, copying only new or changed files.
+
+    Source hashes come from the SiteWriter manifest; files it does not know,
+    or that changed after it was saved, are hashed. What was last published
+    is recorded in ``<docs_dir>/.publish-manifest.json`` as digest, size and
+    mtime, and a docs file whose size or mtime no longer match is hashed
+    again. Files in ``docs_dir`` that the site no longer has are removed,
+    except ``PUBLISH_KEEP`` paths and dotfiles.
+    """
+    site_manifest: Dict[str, str] = {}
+    manifest_mtime = 0
+    manifest_path = os.path.join(demo_dir, SITE_MANIFEST)
+    if os.path.isfile(manifest_path):
+        with open(manifest_path, "r", encoding="utf-8") as fp:
+            site_manifest = json.load(fp)
+        manifest_mtime = os.stat(manifest_path).st_mtime_ns
+    published_path = os.path.join(docs_dir, PUBLISH_MANIFEST)
+    published: Dict[str, List[object]] = {}
+    if os.path.isfile(published_path):
+        with open(published_path, "r", encoding="utf-8") as fp:
+            published = json.load(fp)
+
+    counts = collections.Counter(copied=0, unchanged=0, removed=0)
+    current: Dict[str, List[object]] = {}
+    for rel in _site_files(demo_dir):
+        if rel.startswith(PUBLISH_KEEP):
+            continue
+        src_path = os.path.join(demo_dir, rel)
+        dest_path = os.path.join(docs_dir, rel)
+        digest = site_manifest.get(rel)
+        if digest is None or os.stat(src_path).st_mtime_ns > manifest_mtime:
+            # Not written by SiteWriter, or edited by hand since its last run
+            digest = _file_digest(src_path)
+        previous = None
+        if os.path.isfile(dest_path):
+            recorded = published.get(rel)
+            stat = os.stat(dest_path)
+            if isinstance(recorded, list) and recorded[1:] == [stat.st_size, stat.st_mtime_ns]:
+                previous = recorded[0]
+            else:
+                # First publish over an existing docs/ tree, or the copy was touched since
+                previous = _file_digest(dest_path)
+        if previous == digest:
+            counts["unchanged"] += 1
+        else:
+            os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+            with open(src_path, "rb") as fp:
+                _atomic_write(dest_path, fp.read())
+            counts["copied"] += 1
+        stat = os.stat(dest_path)
+        current[rel] = [digest, stat.st_size, stat.st_mtime_ns]
+
+    root = os.path.abspath(docs_dir)
+    for rel in _site_files(docs_dir):
+        if rel in current or rel.startswith(PUBLISH_KEEP):
+            continue
+        os.remove(os.path.join(docs_dir, rel))
+        counts["removed"] += 1
+        parent = os.path.dirname(os.path.abspath(os.path.join(docs_dir, rel)))
+        while parent != root and not os.listdir(parent):
+            os.rmdir(parent)
+            parent = os.path.dirname(parent)
+
+    _atomic_write(published_path, json.dumps(current, indent=0, sort_keys=True).encode("utf-8"))
+    return dict(counts)
+
+###############################################################################
+# Helper: related searches                                                    #
+###############################################################################
+
+def fetch_serp_context(query: str, api_key: str) -> Dict[str, object]:
+    """Return SERP context: suggestions list plus raw blocks (questions, overview, organic).
+
+    Raises on transport or API errors so callers can decide whether to cache.
+    """
+    params = {"engine": "google_light", "q": query, "api_key": api_key}
+    results = GoogleSearch(params).get_dict()
+    if "error" in results:
+        raise RuntimeError(results["error"])
+
+    suggestions: List[str] = []
+    questions_raw: List[dict] = results.get("related_questions", [])
+    organic_raw: List[dict] = results.get("organic_results", [])
+
+    # related searches (queries)
+    for item in results.get("related_searches", []):
+        q = item.get("query")
+        if q:
+            suggestions.append(q)
+
+    # related questions
+    for item in questions_raw:
+        q = item.get("question") or item.get("title")
+        if q and q not in suggestions:
+            suggestions.append(q)
+
+    # AI overview summary paragraphs (if available)
+    ai_overview = results.get("ai_overview")
+    if isinstance(ai_overview, dict):
+        summary = ai_overview.get("summary") or ai_overview.get("answer")
+        if summary:
+            suggestions.extend([s.strip() for s in summary.split(". ") if s])
+    elif isinstance(ai_overview, str):
+        suggestions.extend([s.strip() for s in ai_overview.split(". ") if s])
+
+    return {
+        "suggestions": suggestions[:20],
+        "related_questions": questions_raw,
+        "ai_overview": ai_overview,
+        "organic_results": organic_raw,
+    }
 
-        # ---------------- Technical additions (3 blogs + 3 use cases) ------------
 
-        # Generate technical ideas dynamically
-        # Extract SERP context from the main result
-        serp_context = res.get("serp_context", {})
+def gather_serp_context(query: str, api_key: str) -> Dict[str, object]:
+    """Like fetch_serp_context, but degrades to empty suggestions on error."""
+    if not api_key:
+        return {"suggestions": []}
+    try:
+        return fetch_serp_context(query, api_key)
+    except Exception as e:
+        logging.warning("SerpApi error: %s", e)
+        return {"suggestions": []}
+
+
+class SerpPrefetcher:
+    """Deduplicated, cached SERP lookups that run ahead of generation.
+
+    ``start`` schedules one lookup per distinct query, in CSV order, with at
+    most ``parallelism`` SerpApi requests in flight. Rows then ``get`` their
+    context and usually find it already resolved. Successful lookups are
+    stored in ``cache`` (a ResponseCache whose max age acts as the TTL);
+    failed ones resolve to empty suggestions plus an ``error`` key.
+    Each ``start`` of a query is matched by a ``release`` once the row is
+    done, so results are only held while some row still needs them.
+    """
+
+    def __init__(self, api_key: str, cache: Optional["ResponseCache"] = None, parallelism: int = 4):
+        self.api_key = api_key
+        self.cache = cache
+        self.semaphore = asyncio.Semaphore(parallelism)
+        self.tasks: Dict[str, asyncio.Task] = {}
+        self.pending: Dict[str, int] = collections.Counter()
+        self._detached: Set[asyncio.Task] = set()
+        self.fetched = 0
+
+    @staticmethod
+    def key(query: str) -> str:
+        return hashlib.sha256(json.dumps(["google_light", query]).encode("utf-8")).hexdigest()
+
+    async def _lookup(self, query: str) -> Dict[str, object]:
+        if self.cache is not None:
+            cached = self.cache.get(self.key(query))
+            if cached is not None:
+                return json.loads(cached)
+        async with self.semaphore:
+            try:
+                with TRACER.span("serp", "serp", query=query):
+                    context = await asyncio.to_thread(fetch_serp_context, query, self.api_key)
+            except Exception as e:
+                logging.warning("SerpApi error for %r: %s", query, e)
+                # Degraded context; the "error" key keeps it out of the cache and journal
+                return {"suggestions": [], "error": str(e)}
+        self.fetched += 1
+        if self.cache is not None:
+            self.cache.put(self.key(query), json.dumps(context, ensure_ascii=False))
+        return context
+
+    def start(self, queries) -> int:
+        """Schedule lookups for every query not seen yet; returns how many were new."""
+        new = 0
+        for query in queries:
+            self.pending[query] += 1
+            if query not in self.tasks:
+                self.tasks[query] = asyncio.create_task(self._lookup(query))
+                new += 1
+        return new
+
+    async def get(self, query: str) -> Dict[str, object]:
+        if not self.api_key:
+            return {"suggestions": []}
+        if query not in self.tasks:
+            self.start([query])
+        return await self.tasks[query]
+
+    def release(self, query: str) -> None:
+        """Forget ``query``'s result once no scheduled row still needs it."""
+        self.pending[query] -= 1
+        if self.pending[query] > 0:
+            return
+        del self.pending[query]
+        task = self.tasks.pop(query, None)
+        if task is not None and not task.done():
+            # Still filling the cache (e.g. the row was resumed from the journal)
+            self._detached.add(task)
+            task.add_done_callback(self._detached.discard)
+
+###############################################################################
+# Preview checkpoint                                                          #
+###############################################################################
+
+def append_preview_row(path: str, record: Dict[str, object]) -> None:
+    """Append one finished row to the JSONL checkpoint and fsync it."""
+    with open(path, "a", encoding="utf-8") as fp:
+        fp.write(json.dumps(record, ensure_ascii=False) + "\n")
+        fp.flush()
+        os.fsync(fp.fileno())
+
+
+def compact_preview(jsonl_path: str, json_path: str) -> int:
+    """Rewrite the JSONL checkpoint as the pretty ``preview.json`` committed by deploy.sh.
+
+    Rows are keyed by URL (last line wins) and keep their first-seen order.
+    Returns the number of rows written.
+    """
+    rows: Dict[str, Dict[str, object]] = {}
+    if os.path.isfile(jsonl_path):
+        with open(jsonl_path, "r", encoding="utf-8") as fp:
+            for line in fp:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    logging.warning("Ignoring torn line in %s", jsonl_path)
+                    continue
+                rows[record.get("url", "")] = record
+    tmp_path = json_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as fp:
+        json.dump(list(rows.values()), fp, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, json_path)
+    return len(rows)
+
+###############################################################################
+# Input rows                                                                  #
+###############################################################################
+
+def _csv_records(fp) -> Iterator[Tuple[int, List[str]]]:
+    """``(byte offset, fields)`` of each record of a CSV file opened in binary mode."""
+    end = fp.tell()
+
+    def _lines():
+        nonlocal end
+        for line in iter(fp.readline, b""):
+            end += len(line)
+            yield line.decode("utf-8")
+
+    start = end
+    for fields in csv.reader(_lines()):
+        if fields:
+            yield start, fields
+        start = end
+
+
+def _column_names(header: List[str]) -> List[str]:
+    """Column names the way ``pd.read_csv`` gives them (``Unnamed: 1``, ``SV.1`` ...)."""
+    names, seen = [], collections.Counter()
+    for i, name in enumerate(header):
+        name = name or f"Unnamed: {i}"
+        names.append(f"{name}.{seen[name]}" if seen[name] else name)
+        seen[name] += 1
+    return names
+
+
+def _volume(value: str) -> float:
+    try:
+        volume = float(value)
+    except ValueError:
+        return 0.0
+    return 0.0 if volume != volume else volume
+
+
+class CsvRows:
+    """The rows a run works on, read from the CSV one at a time in search-volume order.
+
+    A first pass keeps only the byte offset and search volume (the best of
+    the ``SV`` columns) of every row the run takes, with the shard, test
+    mode and ``--limit`` applied; iterating then seeks to each row, so the
+    table is never held in memory. Rows come back as ``(index, volume,
+    row)`` with ``row`` a ``pd.Series`` keyed like ``pd.read_csv`` names
+    the columns and empty cells as NaN.
+    """
+
+    def __init__(
+        self, path: str, shard: Optional[Tuple[int, int]] = None, test_rows: int = 0, limit: Optional[int] = None
+    ):
+        self.path = path
+        index, offsets, volumes, firsts = array("q"), array("q"), array("d"), array("d")
+        with open(path, "rb") as fp:
+            records = _csv_records(fp)
+            header = next(records, (0, [""]))[1]
+            self.columns = _column_names([header[0].lstrip("\ufeff")] + header[1:])
+            sv_cols = [i for i, name in enumerate(self.columns) if name.startswith("SV")]
+            url_col = self.columns.index("URL") if shard else 0
+            for number, (offset, fields) in enumerate(records):
+                if shard and not in_shard(fields[url_col], shard):
+                    continue
+                sv = [_volume(fields[i]) if i < len(fields) else 0.0 for i in sv_cols]
+                index.append(number)
+                offsets.append(offset)
+                volumes.append(max(sv, default=0.0))
+                firsts.append(sv[0] if sv else 0.0)
+        if shard:
+            logging.info("Shard %d/%d: %d rows", shard[0], shard[1], len(index))
+        order = list(range(len(index)))
+        if test_rows:
+            # Test mode: the rows with the highest volume in the first SV column
+            order = sorted(order, key=lambda i: -firsts[i])[:test_rows]
+        if limit:
+            order = order[:limit]
+        # Highest search volume first; it also ranks the rows' model calls
+        order.sort(key=lambda i: -volumes[i])
+        self.index = array("q", (index[i] for i in order))
+        self.offsets = array("q", (offsets[i] for i in order))
+        self.volumes = array("d", (volumes[i] for i in order))
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __iter__(self) -> Iterator[Tuple[int, float, pd.Series]]:
+        nan = float("nan")
+        with open(self.path, "rb") as fp:
+            for number, offset, volume in zip(self.index, self.offsets, self.volumes):
+                fp.seek(offset)
+                fields = next(_csv_records(fp))[1]
+                fields += [""] * (len(self.columns) - len(fields))
+                yield number, volume, pd.Series([v if v != "" else nan for v in fields], index=self.columns, dtype=object)
+
+###############################################################################
+# Sharding                                                                    #
+###############################################################################
+
+DEFAULT_SHARDS_DIR = "shards"
+
+
+def parse_shard(spec: str) -> Tuple[int, int]:
+    """Parse ``i/N`` (1-based, like ``2/4``) for argparse."""
+    try:
+        index, count = (int(part) for part in spec.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected i/N, got {spec!r}")
+    if not 1 <= index <= count:
+        raise argparse.ArgumentTypeError(f"shard index must be between 1 and {count}, got {index}")
+    return index, count
+
+
+def in_shard(url: str, shard: Tuple[int, int]) -> bool:
+    """Stable assignment of a CSV row to a shard, by hash of its URL."""
+    index, count = shard
+    return int(hashlib.sha256(url.encode("utf-8")).hexdigest(), 16) % count == index - 1
+
+
+def shard_dir(shards_dir: str, shard: Tuple[int, int]) -> str:
+    return os.path.join(shards_dir, f"{shard[0]}-of-{shard[1]}")
+
+
+def write_shard_manifest(path: str, shard: Tuple[int, int], rows: List[Dict[str, str]]) -> None:
+    """Record which rows a shard was given, so ``merge`` can tell when shards are missing."""
+    manifest = {"shard": f"{shard[0]}/{shard[1]}", "finished": time.time(), "rows": rows}
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as fp:
+        json.dump(manifest, fp, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def merge_shards(
+    shards_dir: str,
+    output_jsonl: str,
+    output_json: str,
+    journal_dir: str,
+    demo_dir: str,
+    workers: Optional[int] = None,
+    minify: bool = False,
+    compress: bool = False,
+    search: bool = False,
+) -> Dict[str, int]:
+    """Combine the outputs of ``--shard`` runs into the unified preview, journal and site.
+
+    Preview checkpoints are concatenated and compacted, shard journals are
+    copied into ``journal_dir`` (the most recently written file wins when a
+    row appears in several shards) and the site is rendered from the result.
+    """
+    manifests = []
+    for name in sorted(os.listdir(shards_dir)) if os.path.isdir(shards_dir) else []:
+        path = os.path.join(shards_dir, name, "manifest.json")
+        if os.path.isfile(path):
+            with open(path, "r", encoding="utf-8") as fp:
+                manifests.append((os.path.join(shards_dir, name), json.load(fp)))
+    if not manifests:
+        raise FileNotFoundError(f"No finished shards under {shards_dir}")
+    counts = {int(m["shard"].split("/")[1]) for _, m in manifests}
+    if len(counts) > 1:
+        logging.warning("Shards were produced with different counts: %s", sorted(counts))
+    seen = {m["shard"] for _, m in manifests}
+    for count in counts:
+        missing = [f"{i}/{count}" for i in range(1, count + 1) if f"{i}/{count}" not in seen]
+        if missing:
+            logging.warning("Missing shards %s: their rows are not in the merged output", ", ".join(missing))
+
+    os.makedirs(journal_dir, exist_ok=True)
+    journals = 0
+    tmp_path = output_jsonl + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as out:
+        for path, _ in manifests:
+            preview = os.path.join(path, DEFAULT_OUTPUT_JSONL)
+            if os.path.isfile(preview):
+                with open(preview, "r", encoding="utf-8") as fp:
+                    shutil.copyfileobj(fp, out)
+            shard_journal = os.path.join(path, DEFAULT_JOURNAL_DIR)
+            for name in os.listdir(shard_journal) if os.path.isdir(shard_journal) else []:
+                src, dst = os.path.join(shard_journal, name), os.path.join(journal_dir, name)
+                if not os.path.exists(dst) or os.path.getmtime(src) > os.path.getmtime(dst):
+                    shutil.copy2(src, dst)
+                    journals += 1
+    os.replace(tmp_path, output_jsonl)
+    rows = compact_preview(output_jsonl, output_json)
+    pages = render_site(journal_dir, demo_dir, workers, minify, compress, search)
+    return {"shards": len(manifests), "rows": rows, "journals": journals, "pages": pages}
+
+###############################################################################
+# CLI                                                                         #
+###############################################################################
+
+DEFAULT_CSV = os.path.join("settings", "srt_contents.csv")
+DEFAULT_OUTPUT = "preview.json"
+DEFAULT_OUTPUT_JSONL = "preview.jsonl"
+DEFAULT_DEMO_DIR = os.path.join(os.path.dirname(__file__), "demo_site")
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Generate SEO landing content + pages.")
+    p.add_argument(
+        "command",
+        nargs="?",
+        default="generate",
+        choices=["generate", "compact", "render", "prefetch", "merge", "publish"],
+        help="generate content (default), compact the JSONL checkpoint into --output_json, "
+             "render the site from the journal without API calls, only fill the SERP cache, "
+             "merge --shard outputs, or publish the site into --docs-dir",
+    )
+    p.add_argument("--input_csv", default=DEFAULT_CSV)
+    p.add_argument("--output_json", default=DEFAULT_OUTPUT)
+    p.add_argument("--output_jsonl", default=DEFAULT_OUTPUT_JSONL, help="append-only per-row checkpoint")
+    p.add_argument("--concurrency", type=int, default=6, help="initial number of model calls in flight")
+    p.add_argument("--max-concurrency", type=int, default=32, help="ceiling for the adaptive concurrency limit")
+    p.add_argument("--backend", choices=["chat", "batch"], default="chat",
+                   help="'batch' submits requests as Batch API jobs: slower turnaround, lower price")
+    p.add_argument("--batch-poll-seconds", type=float, default=60.0, help="how often to poll running batch jobs")
+    p.add_argument("--stream", action="store_true",
+                   help="stream HTML pages to <page>.part and cancel obviously broken ones early")
+    p.add_argument("--comparison-per-direction", action="store_true",
+                   help="generate srt→vtt and vtt→srt comparisons separately instead of flipping one table")
+    p.add_argument("--max-cost", type=float, help="stop starting model calls once this many USD would be exceeded")
+    p.add_argument("--max-tokens", type=int, help="stop starting model calls once this many tokens would be exceeded")
+    p.add_argument("--degrade-below", type=float, help="rows with search volume below this get fewer pages")
+    p.add_argument("--degraded-pages", type=int, default=3, help="blog and use-case pages kept for degraded rows")
+    p.add_argument("--row-workers", type=int, help="rows in progress at once (default: 2 x --max-concurrency; every row with --backend batch)")
+    p.add_argument("--rpm", type=float, help="requests-per-minute quota to stay under")
+    p.add_argument("--tpm", type=float, help="tokens-per-minute quota to stay under (prompt + completion)")
+    p.add_argument("--test", action="store_true", default=DEFAULT_TEST_MODE, help="enable test mode to process only top rows")
+    p.add_argument("--limit", type=int)
+    p.add_argument("--trace", help="write a Chrome trace-event timeline of the run to this JSON file")
+    p.add_argument("--report", default=DEFAULT_REPORT, help="where to write the JSON run report (latency, tokens, cost)")
+    p.add_argument("--debug", action="store_true")
+    p.add_argument("--cache-mode", choices=CACHE_MODES, default="readwrite", help="reuse model answers stored on disk")
+    p.add_argument("--cache-path", default=DEFAULT_CACHE_PATH)
+    p.add_argument("--cache-max-mb", type=float, default=512, help="evict least-recently-used answers above this size")
+    p.add_argument("--cache-max-age-days", type=float, default=30, help="evict answers older than this")
+    p.add_argument("--serp-cache-path", default=DEFAULT_SERP_CACHE_PATH)
+    p.add_argument("--serp-ttl-hours", type=float, default=168, help="re-query SerpApi for cached results older than this")
+    p.add_argument("--serp-concurrency", type=int, default=4, help="SerpApi requests in flight during prefetch")
+    p.add_argument("--resume", "--incremental", dest="resume", action="store_true",
+                   help="reuse journaled units whose inputs are unchanged; regenerate only stale ones")
+    p.add_argument("--journal-dir", default=DEFAULT_JOURNAL_DIR)
+    p.add_argument("--shard", type=parse_shard, help="only process shard i of N (by URL hash), e.g. 2/4; outputs go to --shards-dir/i-of-N")
+    p.add_argument("--shards-dir", default=DEFAULT_SHARDS_DIR, help="where sharded runs write, and where 'merge' reads them")
+    p.add_argument("--demo-dir", default=DEFAULT_DEMO_DIR, help="where the static site is written")
+    p.add_argument("--docs-dir", default=DEFAULT_DOCS_DIR, help="GitHub Pages directory the 'publish' command syncs into")
+    p.add_argument("--render-workers", type=int, help="processes used by the render command (default: CPU count)")
+    p.add_argument("--minify", action="store_true", help="minify pages (<pre>, <code> and scripts are kept as-is)")
+    p.add_argument("--precompress", action="store_true",
+                   help="also write .gz (and .br, with the brotli package) siblings of every page")
+    p.add_argument("--search-index", action="store_true",
+                   help="also build a prefix-sharded search index under <demo-dir>/search/ and a search box on index.html")
+    return p.parse_args(argv)
+
+###############################################################################
+# Main async workflow                                                         #
+###############################################################################
+
+async def main(argv: Optional[List[str]] = None) -> None:
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.INFO, format="%(asctime)s | %(levelname)s | %(message)s")
+
+    if args.precompress and brotli is None:
+        logging.warning("brotli is not installed: --precompress only writes .gz files (pip install brotli)")
+    if args.command == "publish":
+        published = publish_site(args.demo_dir, args.docs_dir)
+        logging.info("Published %s into %s: %d copied, %d unchanged, %d removed",
+                     args.demo_dir, args.docs_dir, published["copied"], published["unchanged"], published["removed"])
+        return
+    if args.command == "merge":
+        merged = merge_shards(
+            args.shards_dir, args.output_jsonl, args.output_json, args.journal_dir, args.demo_dir,
+            args.render_workers, args.minify, args.precompress, args.search_index,
+        )
+        logging.info("Merged %(shards)d shards: %(rows)d rows, %(journals)d journals, %(pages)d pages", merged)
+        return
+    if args.shard:
+        # Each shard keeps its own checkpoint, journal, site and report unless told otherwise
+        base = shard_dir(args.shards_dir, args.shard)
+        os.makedirs(base, exist_ok=True)
+        for attr, default, name in (
+            ("output_jsonl", DEFAULT_OUTPUT_JSONL, DEFAULT_OUTPUT_JSONL),
+            ("output_json", DEFAULT_OUTPUT, DEFAULT_OUTPUT),
+            ("journal_dir", DEFAULT_JOURNAL_DIR, DEFAULT_JOURNAL_DIR),
+            ("demo_dir", DEFAULT_DEMO_DIR, "demo_site"),
+            ("report", DEFAULT_REPORT, DEFAULT_REPORT),
+        ):
+            if getattr(args, attr) == default:
+                setattr(args, attr, os.path.join(base, name))
+
+    if args.command == "compact":
+        count = compact_preview(args.output_jsonl, args.output_json)
+        logging.info("Compacted %d rows from %s into %s", count, args.output_jsonl, args.output_json)
+        return
+    if args.command == "render":
+        count = render_site(
+            args.journal_dir, args.demo_dir, args.render_workers, args.minify, args.precompress, args.search_index
+        )
+        logging.info("Rendered %d pages from %s into %s", count, args.journal_dir, args.demo_dir)
+        return
+
+    if args.trace:
+        TRACER.start(args.trace)
+
+    # Search volume (best of the keyword SV columns) orders rows and their model calls
+    test_rows = (TEST_ROW_COUNT if TEST_ROW_COUNT > 0 else 5) if args.test else 0
+    rows = CsvRows(args.input_csv, args.shard, test_rows, args.limit)
+
+    # SERP lookups are deduplicated and prefetched ahead of the rows that need them
+    serp_cache = None
+    if args.cache_mode != "off":
+        serp_cache = ResponseCache(args.serp_cache_path, mode=args.cache_mode, max_age_days=args.serp_ttl_hours / 24)
+    serp = SerpPrefetcher(SERPAPI_API_KEY, cache=serp_cache, parallelism=args.serp_concurrency)
+    if args.command == "prefetch":
+        if SERPAPI_API_KEY:
+            logging.info("Prefetching SERP context for %d distinct keywords", serp.start(row["Keyword 1"] for _, _, row in rows))
+        await asyncio.gather(*serp.tasks.values())
+        logging.info("Fetched %d SERP results from SerpApi", serp.fetched)
+        if serp_cache is not None:
+            serp_cache.close()
+        return
+
+    cache = None
+    if args.cache_mode != "off":
+        cache = ResponseCache(
+            args.cache_path,
+            mode=args.cache_mode,
+            max_bytes=int(args.cache_max_mb * 1024 * 1024),
+            max_age_days=args.cache_max_age_days,
+        )
+    generator = SEOGenerator(
+        concurrency=args.concurrency,
+        serpapi_api_key=SERPAPI_API_KEY,
+        cache=cache,
+        max_concurrency=args.max_concurrency,
+        rate_limiter=RateLimiter(rpm=args.rpm, tpm=args.tpm),
+        backend=args.backend,
+        batch_poll_interval=args.batch_poll_seconds,
+        stream=args.stream,
+        budget=Budget(args.max_cost, args.max_tokens, batch=args.backend == "batch"),
+    )
+    journal = RunJournal(args.journal_dir)
+
+    # Templates keep a static prefix (instructions, then the API reference for
+    # technical prompts) and put row fields and then page fields at the end, so
+    # consecutive calls share the longest possible prefix in the provider's
+    # prompt cache; keep new placeholders at the bottom of the templates
+    with open(os.path.join(PROMPTS_DIR, "landing_prompt.txt"), "r", encoding="utf-8") as fp:
+        landing_tpl_text = fp.read()
+    with open(os.path.join(PROMPTS_DIR, "usecase_prompt.txt"), "r", encoding="utf-8") as fp:
+        use_tpl = Template(fp.read())
+    with open(os.path.join(PROMPTS_DIR, "comparison_prompt.txt"), "r", encoding="utf-8") as fp:
+        comp_tpl = Template(fp.read())
+    with open(os.path.join(PROMPTS_DIR, "ideas_prompt.txt"), "r", encoding="utf-8") as fp:
+        ideas_tpl = Template(fp.read())
+    with open(os.path.join(PROMPTS_DIR, "tech_ideas_prompt.txt"), "r", encoding="utf-8") as fp:
+        tech_ideas_tpl = Template(fp.read())
+
+    demo_dir = args.demo_dir
+    site_writer = SiteWriter(demo_dir, minify=args.minify, compress=args.precompress)
+    site_index = SiteIndex(demo_dir)
+    search_index = SearchIndex(site_writer) if args.search_index else None
+
+    with open(os.path.join(PROMPTS_DIR, "article_prompt.txt"), "r", encoding="utf-8") as fp:
+        article_tpl = Template(fp.read())
+    with open(os.path.join(PROMPTS_DIR, "tech_article_prompt.txt"), "r", encoding="utf-8") as fp:
+        tech_article_tpl = Template(fp.read())
+    with open(os.path.join(PROMPTS_DIR, "tech_usecase_prompt.txt"), "r", encoding="utf-8") as fp:
+        tech_use_tpl = Template(fp.read())
+
+    # Load API summary for technical prompts
+    api_summary_file = os.path.join(PROMPTS_DIR, "api_happyscribe_doc_resume.txt")
+    if os.path.isfile(api_summary_file):
+        with open(api_summary_file, "r", encoding="utf-8") as fp:
+            API_SUMMARY = fp.read()
+    else:
+        API_SUMMARY = ""
+    for tpl in (Template(landing_tpl_text), use_tpl, comp_tpl, ideas_tpl, tech_ideas_tpl, article_tpl, tech_article_tpl, tech_use_tpl):
+        register_prompt_prefix(tpl, API_SUMMARY=API_SUMMARY)
+
+    # ------------------------------------------------------------------
+    # Row pipeline: every row runs its own dependency graph               
+    # ------------------------------------------------------------------
+    #
+    #   serp ─┬─> landing ──┬─> blogs / uses ──────────────┐
+    #         ├─> ideas ────┘                              ├─> landing page
+    #         ├─> comparison ──────────────────────────────┤
+    #         └─> tech ideas ───> tech blogs / tech uses ──┘
+    #
+    # Rows are not processed one after the other: every call that is ready
+    # competes for the generator's concurrency limiter, so the slots stay
+    # busy for the whole run.
+
+    stats_pool = [
+        '<p class="alt-bg">💡 83% of internet users watch videos without sound — subtitles are crucial.</p>',
+        '<p class="alt-bg">📊 92% of videos viewed on mobile are watched in silent mode.</p>',
+        '<p class="alt-bg">🔈 69% of users leave a video if subtitles are missing.</p>',
+        '<p class="alt-bg">🌍 80% of learners retain information better with subtitles.</p>',
+        '<p class="alt-bg">🕒 Subtitled videos increase viewing time by 12%.</p>',
+    ]
+
+    async def _gen_landing(idx: int, row: pd.Series, serp_context: Dict[str, object]):
+        prompt = build_outline_prompt(
+            format_1=row["format_1"],
+            format_2=row["format_2"],
+            kw_primary=row["Keyword 1"],
+            kw_secondary=row["Keyword 2"],
+            related_searches=serp_context.get("suggestions", []),
+        )
+
+        # Landing content -> always generated with BASE_MODEL
+        landing = await generator._single_call(SYSTEM_MESSAGE, prompt, model_override=BASE_MODEL, result_type=LandingCopy, stage="landing")
+
+        # Validation basique
+        if len(landing.content) < 100:
+            logging.warning("Content seems too short: %d chars", len(landing.content))
+        if len(landing.blog_ideas) < 5:
+            logging.warning("Blog ideas seem incomplete: %d items", len(landing.blog_ideas))
+        return asdict(landing)
+
+    async def _gen_ideas(serp_context: Dict[str, object]):
+        # ------- second pass for enriched ideas (3 each) ---------------------
         related_q = [q.get("snippet") or q.get("question") for q in serp_context.get("related_questions", [])][:5]
         organic_snips = [o.get("snippet", "") for o in serp_context.get("organic_results", [])][:4]
-        
+
+        ideas_prompt = ideas_tpl.substitute(
+            RELATED_Q="\n".join(f"- {q}" for q in related_q if q),
+            ORGANIC_SNIPPETS="\n".join(f"- {s}" for s in organic_snips if s)
+        )
+
+        # We only need the blog and use-case lists (3 items each)
+        ideas = await generator._single_call(
+            SYSTEM_MESSAGE,
+            ideas_prompt,
+            model_override=BASE_MODEL,  # single model
+            result_type=PageIdeas,
+            stage="ideas",
+        )
+        return asdict(ideas)
+
+    async def _gen_comparison(f1: str, f2: str):
+        comp_prompt = comp_tpl.substitute(FORMAT_1=f1.upper(), FORMAT_2=f2.upper())
+        comp_html = await generator._single_call(SYSTEM_MESSAGE, comp_prompt, stage="comparison")
+        return {"html": comp_html}
+
+    # The comparison only depends on the format pair: rows sharing a pair (in
+    # either direction) await one task, and the reverse direction is obtained by
+    # flipping the table locally unless --comparison-per-direction is set
+    comparisons: Dict[Tuple[str, str], asyncio.Task] = {}
+    comparisons_made = 0
+
+    def _comparison_pair(f1: str, f2: str) -> Tuple[str, str]:
+        wanted = (f1.lower(), f2.lower())
+        return wanted if args.comparison_per_direction else tuple(sorted(wanted))
+
+    # Rows still to come per pair; the shared table is dropped after the last one
+    pair_rows = collections.Counter(_comparison_pair(row["format_1"], row["format_2"]) for _, _, row in rows)
+
+    async def _shared_comparison(f1: str, f2: str):
+        nonlocal comparisons_made
+        wanted = (f1.lower(), f2.lower())
+        pair = _comparison_pair(f1, f2)
+        task = comparisons.get(pair)
+        if task is None:
+            task = comparisons[pair] = asyncio.create_task(_gen_comparison(*pair))
+            comparisons_made += 1
+        try:
+            payload = await asyncio.shield(task)
+        except Exception:
+            # Let the next row sharing this pair try again
+            if comparisons.get(pair) is task:
+                del comparisons[pair]
+            raise
+        if pair != wanted:
+            return {"html": flip_comparison(payload["html"], *pair)}
+        return payload
+
+    async def _gen_tech_ideas(f1: str, f2: str, serp_context: Dict[str, object]) -> Dict[str, List[str]]:
+        related_q = [q.get("snippet") or q.get("question") for q in serp_context.get("related_questions", [])][:5]
+        organic_snips = [o.get("snippet", "") for o in serp_context.get("organic_results", [])][:4]
+
         tech_ideas_prompt = tech_ideas_tpl.substitute(
             FORMAT_1=f1.upper(),
             FORMAT_2=f2.upper(),
@@ -843,142 +3332,452 @@ async def main() -> None:
             RELATED_Q="\n".join(f"- {q}" for q in related_q if q),
             ORGANIC_SNIPPETS="\n".join(f"- {s}" for s in organic_snips if s)
         )
-        
-        try:
-            logging.debug("Generating technical ideas for %s to %s", f1.upper(), f2.upper())
-            
-            # Use the existing _single_call method with proper JSON parsing
-            tech_response, tech_faq, tech_blogs, tech_uses = await generator._single_call(
-                SYSTEM_MESSAGE, 
-                tech_ideas_prompt, 
-                model_override=BASE_MODEL,
-                expect_json=True
-            )
-            
-            logging.debug("Tech response type: %s", type(tech_response))
-            logging.debug("Tech blogs from _single_call: %s", tech_blogs)
-            logging.debug("Tech uses from _single_call: %s", tech_uses)
-            
-            # The _single_call method expects standard format, but we need custom keys
-            # So let's parse the raw response ourselves
-            if isinstance(tech_response, str) and tech_response.strip().startswith('{'):
-                try:
-                    tech_data = json.loads(tech_response)
-                    tech_blogs = tech_data.get("tech_blog_ideas", [])
-                    tech_uses = tech_data.get("tech_use_cases", [])
-                except Exception as e:
-                    logging.warning("Failed to parse tech JSON from _single_call: %s", e)
-                    tech_blogs = []
-                    tech_uses = []
-            
-            # Extract titles from generated content
-            tech_blog_titles = [blog.get("title", f"Technical blog {i}") for i, blog in enumerate(tech_blogs, 1)]
-            tech_use_titles = [use.get("name", f"Technical use case {i}") for i, use in enumerate(tech_uses, 1)]
-            
-            logging.debug("Generated tech blog titles: %s", tech_blog_titles)
-            logging.debug("Generated tech use case titles: %s", tech_use_titles)
-            
-        except Exception as e:
-            logging.warning("Technical ideas generation failed: %s, using fallback", e)
-            # Fallback to hardcoded titles if generation fails
-            tech_blog_titles = [
+
+        logging.debug("Generating technical ideas for %s to %s", f1.upper(), f2.upper())
+
+        tech = await generator._single_call(
+            SYSTEM_MESSAGE,
+            tech_ideas_prompt,
+            model_override=BASE_MODEL,
+            result_type=TechIdeas,
+            stage="tech_ideas",
+        )
+
+        # Extract titles from generated content
+        tech_blog_titles = [blog["title"] or f"Technical blog {i}" for i, blog in enumerate(tech.tech_blog_ideas, 1)]
+        tech_use_titles = [use["name"] or f"Technical use case {i}" for i, use in enumerate(tech.tech_use_cases, 1)]
+
+        logging.debug("Generated tech blog titles: %s", tech_blog_titles)
+        logging.debug("Generated tech use case titles: %s", tech_use_titles)
+
+        return {"blog_titles": tech_blog_titles, "use_titles": tech_use_titles}
+
+    def _fallback_tech_ideas(f1: str, f2: str) -> Dict[str, List[str]]:
+        # Hardcoded titles used when technical ideas generation fails
+        return {
+            "blog_titles": [
                 f"Building a microservice to convert {f1.upper()} to {f2.upper()} with HappyScribe API",
                 f"Automating {f1.upper()} → {f2.upper()} subtitle conversion in CI/CD",
                 f"Scaling bulk {f1.upper()} to {f2.upper()} conversions in the cloud"
-            ]
-            tech_use_titles = [
+            ],
+            "use_titles": [
                 "Streaming platform integration with HappyScribe API",
                 "Post-production batch captioning workflow",
                 "Multilingual subtitle pipeline for global releases"
-            ]
+            ],
+        }
+
+    async def _gen_html(prompt: str, fname: str, kind: str) -> Optional[str]:
+        """Generate one long-form HTML body, retrying once on invalid output.
+
+        Returns None when every attempt failed; the page is then left out of
+        the journal, rendered as a placeholder and retried by ``--resume``.
+        """
+        model_to_use = BASE_MODEL
+
+        # Retry logic for content generation
+        max_retries = 2
+        for retry in range(max_retries):
+            try:
+                body_html = await generator._single_call(
+                    SYSTEM_MESSAGE,
+                    prompt,
+                    model_override=model_to_use,
+                    stream_path=os.path.join(demo_dir, fname + ".part"),
+                    stage=kind.lower().replace(" ", "_"),
+                    validate=page_body_ok,
+                )
+                # Same check the cache applies, so a rejected body is not replayed on retry
+                if page_body_ok(body_html):
+                    return body_html
+                elif retry < max_retries - 1:
+                    logging.warning("%s content invalid for %s, retrying (%d/%d)", kind, fname, retry + 1, max_retries)
+                    await asyncio.sleep(1)
+            except BudgetExceeded:
+                raise
+            except Exception as e:
+                if retry < max_retries - 1:
+                    logging.warning("%s generation failed for %s, retrying: %s", kind, fname, e)
+                    await asyncio.sleep(2)
+        logging.warning("%s generation failed for %s after %d attempts", kind, fname, max_retries)
+        return None
+
+    # A journaled unit is only reused while the inputs it was made from – template
+    # text, row fields, SERP context, upstream titles and model – are unchanged
+    unit_counts: Dict[str, int] = collections.Counter()
+
+    def _fingerprint(*inputs: object) -> str:
+        return RunJournal.digest([SYSTEM_MESSAGE, *inputs])
+
+    # A fresh run starts a new checkpoint; --resume keeps appending to it
+    if not args.resume and os.path.isfile(args.output_jsonl):
+        os.remove(args.output_jsonl)
+
+    async def _run_row(idx: int, row: pd.Series, volume: float) -> None:
+        f1 = row["format_1"]
+        f2 = row["format_2"]
+        kw_p = row["Keyword 1"]
+        kw_s = row["Keyword 2"]
+
+        slug = _slugify(f"{f1}-to-{f2}")
+        landing_fname = f"{slug}.html"
+        CURRENT_ROW.set(slug)
+        # Higher search volume is served first by the concurrency limiter
+        CURRENT_PRIORITY.set((-volume, 0))
+        if generator.budget.exhausted:
+            raise BudgetExceeded("budget reached before the row started")
+
+        # Units already completed by a previous run (only honoured with --resume)
+        entries = journal.load(slug) if args.resume else {}
+        if not entries:
+            journal.reset(slug)
+
+        def _record(name: str, payload: object, fingerprint: Optional[str] = None) -> None:
+            entries[name] = journal.record(slug, name, payload, fingerprint)
+
+        def _fresh(name: str, fingerprint: str) -> bool:
+            """True when ``name`` is journaled and was made from the same inputs."""
+            fresh = name in entries and entries[name].get("fingerprint") == fingerprint
+            unit_counts["reused" if fresh else "generated"] += 1
+            return fresh
+
+        async def _unit(name: str, make, fingerprint: str) -> Dict[str, object]:
+            """Return the journaled payload for ``name``, or produce and record it."""
+            if not _fresh(name, fingerprint):
+                with TRACER.span(name, "stage", row=slug):
+                    _record(name, await make(), fingerprint)
+            return entries[name]["payload"]
+
+        def _spawn(coro) -> asyncio.Task:
+            task = asyncio.create_task(coro)
+            # Errors are handled where the task is awaited; if the row fails before
+            # that (e.g. over budget), don't let asyncio report them as unretrieved
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            return task
+
+        # Always looked up (the SERP cache's TTL keeps this cheap) and fingerprinted
+        # by its result, so a changed SERP invalidates the stages built on it
+        serp_context = await serp.get(kw_p)
+        if "error" in serp_context:
+            # A failed lookup is not journaled; fall back to the last good one if any
+            serp_context = entries.get("serp", {}).get("payload", serp_context)
+        else:
+            serp_fingerprint = _fingerprint("serp", serp_context)
+            if not _fresh("serp", serp_fingerprint):
+                _record("serp", serp_context, serp_fingerprint)
+
+        # Everything below only needs the SERP context: start it all at once
+        landing_task = _spawn(_unit(
+            "landing",
+            lambda: _gen_landing(idx, row, serp_context),
+            _fingerprint(landing_tpl_text, LandingCopy.SCHEMA, f1, f2, kw_p, kw_s, serp_context.get("suggestions", []), BASE_MODEL),
+        ))
+        ideas_task = _spawn(_unit(
+            "ideas",
+            lambda: _gen_ideas(serp_context),
+            _fingerprint(ideas_tpl.template, PageIdeas.SCHEMA, serp_context, BASE_MODEL),
+        ))
+        comp_task = _spawn(_unit(
+            "comparison",
+            lambda: _shared_comparison(f1, f2),
+            _fingerprint(comp_tpl.template, f1.lower(), f2.lower(), args.comparison_per_direction, OPENAI_MODEL),
+        ))
+        tech_ideas_task = _spawn(_unit(
+            "tech_ideas",
+            lambda: _gen_tech_ideas(f1, f2, serp_context),
+            _fingerprint(tech_ideas_tpl.template, TechIdeas.SCHEMA, API_SUMMARY, f1, f2, serp_context, BASE_MODEL),
+        ))
+
+        landing = await landing_task
+        content, faq = landing["content"], landing["faq"]
+        blogs, uses = list(landing["blog_ideas"]), list(landing["use_cases"])
+        try:
+            ideas = await ideas_task
+        except BudgetExceeded:
+            raise
+        except Exception as e:
+            logging.warning("Ideas prompt failed: %s", e)
+            ideas = {"blog_ideas": [], "use_cases": []}
+
+        # merge while avoiding duplicates
+        def _merge(src, extra, key):
+            titles = {item[key] for item in src}
+            for itm in extra:
+                if itm[key] not in titles and len(src) < 10:
+                    src.append(itm)
+        _merge(blogs, ideas["blog_ideas"], "title")
+        _merge(uses, ideas["use_cases"], "name")
+        if args.degrade_below is not None and volume < args.degrade_below:
+            # Low-volume rows get a shorter cluster of pages
+            blogs, uses = blogs[:args.degraded_pages], uses[:args.degraded_pages]
+        # Debug: log blog ideas and use cases returned by the model
+        logging.debug("Row %d returned blog_ideas (%d): %s", idx, len(blogs), blogs)
+        logging.debug("Row %d returned use_cases (%d): %s", idx, len(uses), uses)
 
-        tech_tasks: List[asyncio.Task] = []
+        # Build filename lists for blogs and use-cases
+        blog_links = [
+            (f"{slug}_blog_{i}.html", _sentence_case(b.get("title", f"Blog {i}")), b.get("meta", ""))
+            for i, b in enumerate(blogs, 1)
+        ]
 
-        for t_idx, title in enumerate(tech_blog_titles, 1):
+        use_links = [
+            (f"{slug}_use_{i}.html", _sentence_case(u.get("name", f"Use case {i}")), u.get("description", ""))
+            for i, u in enumerate(uses, 1)
+        ]
+
+        # Seeded per row so prompts (and therefore cache keys) are stable across runs
+        rng = random.Random(slug)
+        stat_info = rng.choice(stats_pool)
+
+        # Lists for context to avoid redundancy
+        all_blog_titles = [title for _, title, _ in blog_links]
+        all_use_names   = [name for _, name, _ in use_links]
+
+        async def _gen_blog(fname: str, title_b: str, meta_b: str):
+            prompt = article_tpl.substitute(
+                TITLE=title_b,
+                KW_PRIMARY=kw_p,
+                KW_SECONDARY=kw_s,
+                ALL_BLOGS="\n".join(all_blog_titles),
+                ALL_USES="\n".join(all_use_names),
+                STAT_INFO=stat_info,)
+            # The prompt carries the template, the titles derived from the landing page and the row
+            fingerprint = _fingerprint(prompt, meta_b, BASE_MODEL)
+            if _fresh(fname, fingerprint):
+                return
+            with TRACER.span("blog", "stage", row=slug, page=fname):
+                body_html = await _gen_html(prompt, fname, "Blog")
+            if body_html is not None:
+                _record(fname, {"title": title_b, "meta": meta_b, "body_html": body_html}, fingerprint)
+
+        async def _gen_use(fname: str, name_u: str, desc_u: str):
+            prompt = use_tpl.substitute(
+                USE_NAME=name_u,
+                F1=f1.upper(),
+                F2=f2.upper(),
+                ALL_BLOGS="\n".join(all_blog_titles),
+                ALL_USES="\n".join(all_use_names),
+                STAT_INFO=stat_info,
+            )
+            fingerprint = _fingerprint(prompt, desc_u, BASE_MODEL)
+            if _fresh(fname, fingerprint):
+                return
+            with TRACER.span("use_case", "stage", row=slug, page=fname):
+                body_html = await _gen_html(prompt, fname, "Use case")
+            if body_html is not None:
+                _record(fname, {"title": name_u, "meta": desc_u, "body_html": body_html}, fingerprint)
+
+        async def _gen_tech_page(fname: str, title: str, prompt: str):
+            fingerprint = _fingerprint(prompt, title, OPENAI_MODEL)
+            if _fresh(fname, fingerprint):
+                return
+            try:
+                with TRACER.span("tech_page", "stage", row=slug, page=fname):
+                    body_html = await generator._single_call(SYSTEM_MESSAGE, prompt, stage="tech_page")
+            except BudgetExceeded:
+                raise
+            except Exception as e:
+                # Left out of the journal: rendered as a placeholder, retried by --resume
+                logging.warning("Tech page generation failed for %s: %s", fname, e)
+                return
+            _record(fname, {"title": title, "meta": "", "body_html": body_html}, fingerprint)
+
+        page_tasks: List[asyncio.Task] = []
+        page_tasks += [_spawn(_gen_blog(f, t, m)) for f, t, m in blog_links]
+        page_tasks += [_spawn(_gen_use(f, n, d)) for f, n, d in use_links]
+
+        # ---------------- Technical additions (3 blogs + 3 use cases) ------------
+        try:
+            tech_ideas = await tech_ideas_task
+        except BudgetExceeded:
+            raise
+        except Exception as e:
+            logging.warning("Technical ideas generation failed: %s, using fallback", e)
+            tech_ideas = _fallback_tech_ideas(f1, f2)
+        tech_blog_links: List[Tuple[str, str, str]] = []
+        tech_use_links: List[Tuple[str, str, str]] = []
+
+        for t_idx, title in enumerate(tech_ideas["blog_titles"], 1):
             fname = f"{slug}_tech_blog_{t_idx}.html"
             prompt = tech_article_tpl.substitute(TITLE=title, API_SUMMARY=API_SUMMARY)
-            tech_tasks.append(asyncio.create_task(
-                generator._single_call(SYSTEM_MESSAGE, prompt, expect_json=False)))
-            blog_links.append((fname, _sentence_case(title), ""))
+            tech_blog_links.append((fname, _sentence_case(title), ""))
+            page_tasks.append(_spawn(_gen_tech_page(fname, _sentence_case(title), prompt)))
 
-        for u_idx, name in enumerate(tech_use_titles, 1):
+        for u_idx, name in enumerate(tech_ideas["use_titles"], 1):
             fname = f"{slug}_tech_use_{u_idx}.html"
             prompt = tech_use_tpl.substitute(
                 USE_NAME=name,
                 F1=f1.upper(),
                 F2=f2.upper(),
-                STAT_INFO=random.choice(stats_pool),
+                STAT_INFO=rng.choice(stats_pool),
                 API_SUMMARY=API_SUMMARY,
                 ALL_BLOGS="\n".join(all_blog_titles),
                 ALL_USES="\n".join(all_use_names),
             )
-            tech_tasks.append(asyncio.create_task(
-                generator._single_call(SYSTEM_MESSAGE, prompt, expect_json=False)))
-            use_links.append((fname, _sentence_case(name), ""))
-
-        # Wait for tech pages content
-        tech_results = await asyncio.gather(*tech_tasks)
-
-        # Write the new pages
-        for (fname, title, _), (body_html, *_) in zip(blog_links[-3:], tech_results[:3]):
-            await _write_page(os.path.join(demo_dir, fname), title, body_html, model_id=BASE_MODEL)
+            tech_use_links.append((fname, _sentence_case(name), ""))
+            page_tasks.append(_spawn(_gen_tech_page(fname, _sentence_case(name), prompt)))
+
+        comp_html = (await comp_task)["html"]
+        append_preview_row(args.output_jsonl, {
+            "url": row["URL"],
+            "format_1": f1,
+            "format_2": f2,
+            "keyword_primary": kw_p,
+            "keyword_secondary": kw_s,
+            "serp_context": serp_context,
+            "content": content,
+            "faq": faq,
+            "blog_ideas": blogs,
+            "use_cases": uses,
+            "comparison": comp_html,
+        })
 
-        for (fname, name, _), (body_html, *_) in zip(use_links[-3:], tech_results[3:]):
-            await _write_page(os.path.join(demo_dir, fname), name, body_html, model_id=BASE_MODEL)
+        await asyncio.gather(*page_tasks)
 
         # ---------------- Landing page ----------------
-        content_html = _ensure_html(res["content"])
-        comp_html = _ensure_html(res.get("comparison", ""))
-        faq_html = _build_faq_accordion(res.get("faq", []), slug)
-
-        nav_html = ""
-        block_parts = []
-        if blog_links:
-            block_parts.append(
-                "<h2>Related Articles</h2><ul class='related-list'>" + "".join(
-                    f'<li><a href=\"{fname}\">{title}</a></li>' for fname, title, _ in blog_links
-                ) + "</ul>"
-            )
-        if use_links:
-            block_parts.append(
-                "<h2>Professional Use Cases</h2><ul class='related-list'>" + "".join(
-                    f'<li><a href=\"{fname}\">{name}</a></li>' for fname, name, _ in use_links
-                ) + "</ul>"
-            )
-        if block_parts:
-            nav_html = "<hr class='section-divider'><div class='block-section'>" + "<hr class='section-divider'>".join(block_parts) + "</div>"
-
-        await _write_page(
-            landing_path,
-            kw_p,
-            content_html + comp_html + faq_html + nav_html,
-            model_id=BASE_MODEL,
-        )
+        site = {
+            "title": kw_p,
+            "model_id": BASE_MODEL,
+            "blog_links": blog_links,
+            "use_links": use_links,
+            "tech_blog_links": tech_blog_links,
+            "tech_use_links": tech_use_links,
+        }
+        if entries.get(landing_fname, {}).get("hash") != RunJournal.digest(site):
+            _record(landing_fname, site)
+
+        with TRACER.span("write", "stage", row=slug) as info:
+            pages = render_row(slug, entries)
+            written = await asyncio.gather(*(site_writer.write(fname, html) for fname, html in pages))
+            info["pages"] = len(pages)
+            info["written"] = sum(written)
+            site_writer.checkpoint()
+        if pages:
+            # Pages the row linked to last time but no longer has (e.g. fewer blogs);
+            # rows that fail before this point keep the pages of their previous run
+            produced = {fname for fname, _ in pages}
+            for page in site_index.rows.get(slug, {}).get("pages", []):
+                if page[0] not in produced:
+                    site_writer.discard(page[0])
+            titles = row_page_titles(slug, entries)
+            site_index.update_row(slug, titles, site_writer.manifest)
+            if search_index:
+                stale = set(search_index.stale(slug, titles, site_writer.manifest))
+                terms = await asyncio.to_thread(index_pages, [page for page in pages if page[0] in stale])
+                search_index.update_row(slug, titles, site_writer.manifest, terms)
 
         logging.info(
             "✅ Generated landing + %d blogs + %d use cases for %s → %s",
-            len(blog_links),
-            len(use_links),
+            len(blog_links) + len(tech_blog_links),
+            len(use_links) + len(tech_use_links),
             f1.upper(),
             f2.upper(),
         )
 
-    # ------------------------------------------------------------------
-    # Generate an index.html listing all generated pages
-    pages = sorted([f for f in os.listdir(demo_dir) if f.endswith('.html')])
-    list_items = ''.join(f'<li><a href="{p}">{p.replace(".html", " ").replace("-", " ").title()}</a></li>' for p in pages)
-    index_content = (
-        '<!DOCTYPE html><html><head><meta charset="utf-8">'
-        '<meta name="viewport" content="width=device-width,initial-scale=1">'
-        '<title>Demo Index</title>'
-        '<link href="https://cdn.jsdelivr.net/npm/bootstrap@5.3.3/dist/css/bootstrap.min.css" rel="stylesheet">'
-        '<link rel="stylesheet" href="settings/web_assets/style.css">'
-        '</head><body><div class="container">'
-        '<h1>Available Pages</h1><ul>' + list_items + '</ul></div></body></html>'
-    )
-    with open(os.path.join(demo_dir, 'index.html'), 'w', encoding='utf-8') as f:
-        f.write(index_content)
-    logging.info("Static pages generated in %s", demo_dir)
+    async def _traced_row(idx: int, row: pd.Series, volume: float) -> None:
+        with TRACER.span(_slugify(f"{row['format_1']}-to-{row['format_2']}"), "row", url=row["URL"]):
+            await _run_row(idx, row, volume)
+
+    async def _sample_limiter() -> None:
+        while True:
+            snap = generator.limiter.snapshot()
+            TRACER.counter("concurrency", limit=snap["limit"], in_flight=snap["in_flight"], waiting=snap["waiting"])
+            await asyncio.sleep(0.25)
+
+    # Rows stream through a fixed pool of workers fed by a bounded queue, so
+    # only about 2 x row_workers rows (and their SERP blobs, landing copy and
+    # pages) are alive at once, whatever the size of the CSV. The queue also
+    # bounds how far SERP lookups run ahead of generation. A batch job only
+    # covers the rows in flight when it is flushed, so with --backend batch up
+    # to BATCH_ROW_WORKERS rows are in flight by default and each stage
+    # becomes one job per wave of rows.
+    row_workers = args.row_workers or (max(1, min(len(rows), BATCH_ROW_WORKERS)) if args.backend == "batch" else 2 * args.max_concurrency)
+    queue: asyncio.Queue = asyncio.Queue(maxsize=row_workers)
+    over_budget = 0
+
+    async def _feed_rows() -> None:
+        for idx, volume, row in rows:
+            if SERPAPI_API_KEY:
+                serp.start([row["Keyword 1"]])
+            await queue.put((idx, volume, row))
+        for _ in range(row_workers):
+            await queue.put(None)
+
+    async def _row_worker() -> None:
+        nonlocal over_budget
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            idx, volume, row = item
+            try:
+                await _traced_row(idx, row, volume)
+            except BudgetExceeded:
+                over_budget += 1
+            except Exception as e:
+                # A failed row keeps its finished units in the journal; --resume picks it up
+                logging.error("Row %s failed: %s", row["URL"], e)
+            finally:
+                if SERPAPI_API_KEY:
+                    serp.release(row["Keyword 1"])
+                pair = _comparison_pair(row["format_1"], row["format_2"])
+                pair_rows[pair] -= 1
+                if not pair_rows[pair]:
+                    comparisons.pop(pair, None)
+
+    logging.info("Streaming %d rows through %d row workers", len(rows), row_workers)
+    sampler = asyncio.create_task(_sample_limiter()) if args.trace else None
+    await asyncio.gather(_feed_rows(), *(_row_worker() for _ in range(row_workers)))
+    if sampler is not None:
+        sampler.cancel()
+    if args.resume:
+        logging.info("Incremental run: reused %d units, regenerated %d", unit_counts["reused"], unit_counts["generated"])
+    if over_budget:
+        logging.warning(
+            "Budget reached after $%.2f / %d tokens: %d rows left incomplete, rerun with --resume to continue",
+            generator.budget.spent_cost,
+            generator.budget.spent_tokens,
+            over_budget,
+        )
+    count = compact_preview(args.output_jsonl, args.output_json)
+    logging.info("Wrote %d rows to %s", count, args.output_json)
+
+    site_index.write(site_writer, search=bool(search_index))
+    if search_index:
+        search_index.sync(site_index.rows)
+        logging.info("Search index: %(indexed)d pages indexed, %(removed)d removed, %(shards)d shards updated",
+                     search_index.write())
+    site_writer.close()
+    logging.info("Static pages generated in %s: %s", demo_dir, site_writer.summary())
+    if args.shard:
+        write_shard_manifest(
+            os.path.join(shard_dir(args.shards_dir, args.shard), "manifest.json"),
+            args.shard,
+            [{"url": row["URL"], "slug": _slugify(f"{row['format_1']}-to-{row['format_2']}")} for _, _, row in rows],
+        )
+    TRACER.save()
+    report = generator.telemetry.report()
+    if generator.batch is None:
+        report["limiter"] = generator.limiter.snapshot()
+    with open(args.report, "w", encoding="utf-8") as fh:
+        json.dump(report, fh, indent=2)
+    logging.info("Run report (%s):\n%s", args.report, Telemetry.format_report(report))
+    if comparisons_made:
+        logging.info("Generated %d comparison tables for %d rows", comparisons_made, len(rows))
+    if generator.aborted_streams:
+        logging.info("Cancelled %d streamed pages with a broken start", generator.aborted_streams)
+    if generator.coalesced:
+        logging.info("Coalesced %d duplicate in-flight requests", generator.coalesced)
+    if generator.batch is not None:
+        logging.info("Batch jobs: %s", ", ".join(generator.batch.jobs) or "none")
+    else:
+        logging.info("Concurrency limiter: %s", generator.limiter.snapshot())
+    if generator.rate_limiter.throttled_seconds:
+        logging.info("Rate limiter held calls for %.1fs to stay under quota", generator.rate_limiter.throttled_seconds)
+    if cache is not None:
+        cache.close()
+    if serp_cache is not None:
+        serp_cache.close()
 
 if __name__ == "__main__":
     asyncio.run(main()) 
\ No newline at end of file
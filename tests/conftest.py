@@ -0,0 +1,31 @@
+"""Shared fixtures: the mock APIs on a free port and script.py pointed at them."""
+
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import mock_server  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def mock_url():
+    server = mock_server.serve(port=0, state=mock_server.MockState(batch_latency=0.1, seed=1))
+    yield "http://%s:%d" % server.server_address[:2]
+    server.shutdown()
+
+
+@pytest.fixture(scope="session")
+def script(mock_url):
+    """script.py, imported once the environment points it at the mock server."""
+    os.environ["OPENAI_BASE_URL"] = f"{mock_url}/v1"
+    os.environ["SERPAPI_BACKEND"] = mock_url
+    import script as module  # read OPENAI_BASE_URL / SERPAPI_BACKEND at import time
+
+    module.OPENAI_API_KEY = "mock"
+    module.SERPAPI_API_KEY = "mock"
+    module.DEFAULT_TEST_MODE = False
+    return module
@@ -0,0 +1,53 @@
+import sqlite3
+
+
+def test_modes(script, tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    key = script.ResponseCache.key("gpt", "system", "user", "html")
+    assert key != script.ResponseCache.key("gpt", "system", "user", "json")
+
+    cache = script.ResponseCache(path)
+    assert cache.get(key) is None
+    cache.put(key, "<h1>answer</h1>")
+    assert cache.get(key) == "<h1>answer</h1>"
+    assert (cache.hits, cache.misses) == (1, 1)
+    cache.close()
+
+    refresh = script.ResponseCache(path, mode="refresh")
+    assert refresh.get(key) is None
+    refresh.put(key, "<h1>fresh</h1>")
+    refresh.close()
+
+    read = script.ResponseCache(path, mode="read")
+    assert read.get(key) == "<h1>fresh</h1>"
+    read.put(key, "<h1>ignored</h1>")
+    assert read.get(key) == "<h1>fresh</h1>"
+    read.close()
+
+
+def test_expired_and_oversized_entries_are_evicted(script, tmp_path):
+    cache = script.ResponseCache(str(tmp_path / "cache.sqlite"), max_bytes=10)
+    cache.put("a", "x" * 8)
+    cache.put("b", "y" * 8)
+    assert cache.evict() == 1
+    assert cache.get("a") is None
+    assert cache.get("b") == "y" * 8
+    cache.close()
+
+
+def test_locked_writes_are_skipped(script, tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    cache = script.ResponseCache(path, timeout=0.05)
+    cache.put("kept", "old")
+    other = sqlite3.connect(path, isolation_level=None)
+    other.execute("BEGIN EXCLUSIVE")
+    try:
+        cache.put("lost", "new")  # logged and dropped, not raised
+        assert cache.get("kept") == "old"  # WAL readers are not blocked
+    finally:
+        other.execute("ROLLBACK")
+        other.close()
+    assert cache.get("lost") is None
+    cache.put("lost", "new")
+    assert cache.get("lost") == "new"
+    cache.close()
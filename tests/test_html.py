@@ -0,0 +1,39 @@
+import pytest
+
+
+@pytest.mark.parametrize(
+    "prefix, final, problem",
+    [
+        ("", False, None),
+        ("```html", False, None),
+        ("```json\n{", False, "JSON-fenced answer"),
+        ('{"title": "x"}', False, "JSON instead of HTML"),
+        ("Sure! Here is the page", False, "does not start with an HTML tag"),
+        ("<article><h2>Title</h2>", True, None),
+        ("```html\n<div><h1>Title</h1>", True, None),
+        ("<div><p>no heading</p></div>", True, "no heading"),
+        ("<div><p>still short</p>", False, None),
+    ],
+)
+def test_html_prefix_problem(script, prefix, final, problem):
+    assert script.html_prefix_problem(prefix, final) == problem
+
+
+def test_html_prefix_problem_checks_heading_after_window(script):
+    prefix = "<div>" + "x" * script.HTML_PREFIX_WINDOW
+    assert script.html_prefix_problem(prefix) == "no heading"
+
+
+def test_minify_html(script):
+    html = (
+        "<html>\n  <!-- note -->\n  <body>\n    <h1>  Title  </h1>\n"
+        "    <pre>  keep\n    this  </pre>\n"
+        "    <script>var  a = 1;\n</script>\n  </body>\n</html>\n"
+    )
+    out = script.minify_html(html)
+    assert "<!--" not in out
+    assert "<h1> Title </h1>" in out
+    assert "<pre>  keep\n    this  </pre>" in out
+    assert "<script>var  a = 1;\n</script>" in out
+    assert "\n" not in out.replace("<pre>  keep\n", "").replace("a = 1;\n", "")
+    assert script.minify_html(out) == out
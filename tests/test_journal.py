@@ -0,0 +1,27 @@
+def test_record_and_load(script, tmp_path):
+    journal = script.RunJournal(str(tmp_path))
+    journal.record("srt-to-vtt", "landing", {"title": "one"}, fingerprint="f1")
+    journal.record("srt-to-vtt", "landing", {"title": "two"}, fingerprint="f2")
+    journal.record("srt-to-vtt", "srt-to-vtt_blog_1.html", "<h1>blog</h1>")
+
+    entries = journal.load("srt-to-vtt")
+    assert set(entries) == {"landing", "srt-to-vtt_blog_1.html"}
+    assert entries["landing"]["payload"] == {"title": "two"}  # later entries win
+    assert entries["landing"]["fingerprint"] == "f2"
+    assert journal.slugs() == ["srt-to-vtt"]
+
+    journal.reset("srt-to-vtt")
+    assert journal.load("srt-to-vtt") == {}
+    assert journal.slugs() == []
+
+
+def test_torn_and_tampered_lines_are_ignored(script, tmp_path):
+    journal = script.RunJournal(str(tmp_path))
+    journal.record("a", "serp", {"results": [1]})
+    journal.record("a", "landing", {"title": "ok"})
+    path = tmp_path / "a.jsonl"
+    lines = path.read_text(encoding="utf-8").splitlines()
+    tampered = lines[1].replace('"ok"', '"edited"')
+    path.write_text(lines[0] + "\n" + tampered + "\n" + '{"unit": "ideas", "ha', encoding="utf-8")
+
+    assert set(journal.load("a")) == {"serp"}
@@ -0,0 +1,87 @@
+import asyncio
+
+import pytest
+
+
+def test_limiter_grows_and_backs_off(script):
+    limiter = script.AdaptiveLimiter(initial=4, max_limit=8)
+    for _ in range(20):
+        limiter.on_success(0.1)
+    assert 4 < limiter.limit <= 8
+
+    before = limiter.limit
+    limiter.on_overload()
+    limiter.on_overload()  # at most once per round trip
+    assert limiter.limit == pytest.approx(before / 2)
+    assert limiter.snapshot()["decreases"] == 1
+
+
+def test_limiter_serves_waiters_by_priority(script):
+    async def run():
+        limiter = script.AdaptiveLimiter(initial=1, max_limit=1)
+        await limiter.acquire()
+        order = []
+
+        async def wait(name, priority):
+            await limiter.acquire(priority)
+            order.append(name)
+            limiter.release()
+
+        tasks = [asyncio.create_task(wait("low", (5.0, 0))), asyncio.create_task(wait("high", (1.0, 0)))]
+        await asyncio.sleep(0)
+        assert limiter.snapshot()["waiting"] == 2
+        limiter.release()
+        await asyncio.gather(*tasks)
+        return order, limiter.snapshot()
+
+    order, snap = asyncio.run(run())
+    assert order == ["high", "low"]
+    assert snap["in_flight"] == 0
+    assert snap["peak_in_flight"] == 1
+
+
+def test_budget_reserves_settles_and_refuses(script):
+    async def run():
+        budget = script.Budget(max_tokens=1000)
+        first = script.CallRecord("landing", "a", "gpt-4o")
+        await budget.reserve(first, 400, 200)
+
+        # 600 held + 600 more would cross the cap: wait until the first call settles
+        second = script.CallRecord("ideas", "a", "gpt-4o")
+        waiting = asyncio.create_task(budget.reserve(second, 400, 200))
+        await asyncio.sleep(0)
+        assert not waiting.done()
+
+        first.prompt_tokens, first.completion_tokens = 300, 100
+        budget.settle(first)
+        await waiting
+        assert budget.spent_tokens == 400
+
+        # Nothing in flight can make room for this one: refused, and so is everything after
+        third = script.CallRecord("blog", "a", "gpt-4o")
+        with pytest.raises(script.BudgetExceeded):
+            await budget.reserve(third, 400, 200)
+        assert budget.exhausted
+
+        second.prompt_tokens, second.completion_tokens = 400, 150
+        budget.settle(second)
+        assert budget.spent_tokens == 950
+        with pytest.raises(script.BudgetExceeded):
+            await budget.reserve(script.CallRecord("blog", "b", "gpt-4o"), 1, 1)
+
+    asyncio.run(run())
+
+
+def test_budget_charges_retries_once(script):
+    async def run():
+        budget = script.Budget(max_tokens=10_000)
+        call = script.CallRecord("landing", "a", "gpt-4o")
+        await budget.reserve(call, 100, 100)
+        call.prompt_tokens, call.completion_tokens = 100, 20
+        budget.settle(call, final=False)
+        await budget.reserve(call, 100, 100)
+        call.prompt_tokens, call.completion_tokens = 200, 120  # both attempts
+        budget.settle(call)
+        return budget.spent_tokens
+
+    assert asyncio.run(run()) == 320
@@ -0,0 +1,67 @@
+"""Sharded runs against mock_server.py, then merge and publish."""
+
+import asyncio
+import json
+import os
+
+
+def _pages(directory):
+    return sorted(name for name in os.listdir(directory) if name.endswith(".html") and name != "index.html")
+
+
+def _calls(report):
+    with open(report, encoding="utf-8") as fp:
+        return json.load(fp)["totals"]["calls"]
+
+
+def test_shards_merge_and_publish(script, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # relative defaults (caches, batch dir) stay in the scratch directory
+    csv_path = os.path.join(os.path.dirname(script.__file__), script.DEFAULT_CSV)
+    shards = str(tmp_path / "shards")
+
+    def run(*argv):
+        asyncio.run(script.main(list(argv)))
+
+    def run_shard(shard, *extra):
+        run("--input_csv", csv_path, "--shard", shard, "--limit", "2", "--shards-dir", shards,
+            "--cache-mode", "off", "--concurrency", "4", *extra)
+
+    run_shard("1/2")
+    run_shard("2/2")
+    shard_pages = []
+    for name in ("1-of-2", "2-of-2"):
+        base = os.path.join(shards, name)
+        assert os.path.isfile(os.path.join(base, "manifest.json"))
+        assert _calls(os.path.join(base, script.DEFAULT_REPORT)) > 0
+        shard_pages += _pages(os.path.join(base, "demo_site"))
+    assert shard_pages
+
+    # Every unit of a finished shard is journaled: resuming makes no model calls
+    first = os.path.join(shards, "1-of-2")
+    before = _pages(os.path.join(first, "demo_site"))
+    run_shard("1/2", "--resume")
+    assert _calls(os.path.join(first, script.DEFAULT_REPORT)) == 0
+    assert _pages(os.path.join(first, "demo_site")) == before
+
+    site, docs, journal = str(tmp_path / "site"), str(tmp_path / "docs"), str(tmp_path / "journal")
+    merged = script.merge_shards(
+        shards, str(tmp_path / "preview.jsonl"), str(tmp_path / "preview.json"), journal, site, workers=1,
+    )
+    assert merged["shards"] == 2
+    assert merged["rows"] == 4
+    assert sorted(_pages(site)) == sorted(shard_pages)
+    assert len(os.listdir(journal)) == 4
+    with open(tmp_path / "preview.json", encoding="utf-8") as fp:
+        assert len(json.load(fp)) == 4
+
+    published = script.publish_site(site, docs)
+    assert published["copied"] > len(shard_pages)
+    assert _pages(docs) == _pages(site)
+    assert os.path.isfile(os.path.join(docs, "index.html"))
+
+    # A second publish copies nothing; a page the site dropped is removed from docs
+    assert script.publish_site(site, docs)["copied"] == 0
+    os.remove(os.path.join(site, shard_pages[0]))
+    again = script.publish_site(site, docs)
+    assert again["removed"] == 1
+    assert shard_pages[0] not in _pages(docs)